@@ -21,12 +21,14 @@
 """Main Flask App file."""
 
 import datetime
+import hashlib
 import yaml
 import io
 import os
 import logging
-import copy
-import requests
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from requests.exceptions import Timeout
 from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_dance.consumer import OAuth2ConsumerBlueprint
@@ -37,20 +39,28 @@ from app.infra import Infrastructures
 from app.im import InfrastructureManager
 from app.ssh_key import SSHKey
 from app.ott import OneTimeTokenData
-from app import utils, appdb, db
+from app import utils, appdb, db, stats, contmsg
 from app.vault_info import VaultInfo
+from app.catalog import ToscaCatalog
 from oauthlib.oauth2.rfc6749.errors import InvalidTokenError, TokenExpiredError, InvalidGrantError, MissingTokenError
 from werkzeug.exceptions import Forbidden
+from werkzeug.http import is_resource_modified
 from flask import Flask, json, render_template, request, redirect, url_for, flash, session, g, make_response
+from flask import Response, stream_with_context, send_file
 from markupsafe import Markup
 from functools import wraps
 from urllib.parse import urlparse
-from radl import radl_parse
-from radl.radl import deploy, description, Feature
+from radl.radl import deploy, description
 from flask_apscheduler import APScheduler
 from flask_wtf.csrf import CSRFProtect, CSRFError
-from toscaparser.tosca_template import ToscaTemplate
+from app.tosca_validator import ToscaValidator
+from app.tosca_fetch import ToscaFetcher
+from app.vminfo import format_vminfo
+from app.radl_cache import RADLCache
+from app.metrics import Metrics
+from app.jobs import JobTracker
 from app.oaipmh.oai import OAI
+from app.oaipmh.records import RecordStores
 
 
 def create_app(oidc_blueprint=None):
@@ -73,6 +83,24 @@ def create_app(oidc_blueprint=None):
     ssh_key = SSHKey(settings.db_url)
     vault_info = VaultInfo(settings.db_url)
     ott = OneTimeTokenData(settings.vault_url)
+    tosca_validator = ToscaValidator(settings.tosca_validation_cache_size, settings.tosca_validation_process,
+                                     settings.tosca_validation_cpu_limit, settings.tosca_validation_timeout)
+    oai_records = RecordStores()
+    tosca_fetcher = ToscaFetcher(tosca_validator, settings.tosca_fetch_cache_size, settings.tosca_fetch_max_size)
+    stats_store = stats.StatsStore(settings.stats_cache_ttl)
+    log_indexes = contmsg.LogIndexes()
+    log_followers = contmsg.LogFollowers(settings.log_tail_max_user, settings.log_tail_max)
+    radl_cache = RADLCache(settings.radl_cache_size)
+    # All the operations are sent to the same IM, so more workers than its limit would just wait
+    bulk_jobs = JobTracker(min(settings.bulk_ops_workers, settings.bulk_ops_im_limit), settings.bulk_ops_im_limit,
+                           max_user_jobs=settings.bulk_ops_max_user_jobs)
+    metrics = Metrics()
+    metrics.register_cache("radl", radl_cache)
+    metrics.register_cache("tosca_validation", tosca_validator)
+    metrics.register_cache("tosca_fetch", tosca_fetcher)
+    log_cache = None
+    if settings.log_cache_dir:
+        log_cache = contmsg.LogCache(settings.log_cache_dir, settings.log_cache_size)
 
     # To Reload internally the site cache
     scheduler = APScheduler()
@@ -81,10 +109,11 @@ def create_app(oidc_blueprint=None):
     scheduler.start()
 
     toscaTemplates = utils.loadToscaTemplates(settings.toscaDir)
-    toscaInfo = utils.extractToscaInfo(settings.toscaDir, toscaTemplates, settings.hide_tosca_tags)
+    toscaCatalog = ToscaCatalog(utils.extractToscaInfo(settings.toscaDir, toscaTemplates,
+                                                       settings.hide_tosca_tags))
 
     app.jinja_env.filters['tojson_pretty'] = utils.to_pretty_json
-    app.logger.debug("TOSCA INFO: " + json.dumps(toscaInfo))
+    app.logger.debug("TOSCA INFO: " + json.dumps(toscaCatalog.snapshot().templates))
 
     loglevel = app.config.get("LOG_LEVEL") if app.config.get("LOG_LEVEL") else "INFO"
 
@@ -125,6 +154,8 @@ def create_app(oidc_blueprint=None):
         g.analytics_tag = settings.analytics_tag
         g.motomo_info = settings.motomo_info
         g.settings = settings
+        # Pin the catalog version used along the whole request
+        g.catalog = toscaCatalog.snapshot()
 
     def authorized_with_valid_token(f):
         @wraps(f)
@@ -170,6 +201,31 @@ def create_app(oidc_blueprint=None):
             session["next"] = request.args.get("next_url")
         return render_template('home.html', oidc_name=settings.oidcName, oidc_image=settings.oidcImage)
 
+    def catalog_response(etag_parts, build_response, private=False):
+        """Build a response that only depends on the catalog and the etag_parts with HTTP conditional caching.
+
+        If the client has a valid copy of the response a 304 response is returned without building it.
+        """
+        # The flashed messages are shown in the page, so it cannot be cached
+        if session.get('_flashes'):
+            return make_response(build_response())
+
+        etag = utils.response_etag(g.catalog.digest, settings.version, *etag_parts)
+        last_modified = datetime.datetime.fromtimestamp(int(g.catalog.timestamp), datetime.timezone.utc)
+        if request.method in ['GET', 'HEAD'] and \
+                not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+            response = Response(status=304)
+        else:
+            response = make_response(build_response())
+        response.set_etag(etag, weak=True)
+        response.last_modified = last_modified
+        if private:
+            response.cache_control.private = True
+        else:
+            response.cache_control.public = True
+        response.cache_control.no_cache = True
+        return response
+
     @app.route('/')
     def home():
         template_filter = None
@@ -178,18 +234,8 @@ def create_app(oidc_blueprint=None):
         if "filter" in session:
             template_filter = session["filter"]
 
-        templates = {}
-        for name, tosca in toscaInfo.items():
-            if "parents" not in tosca["metadata"]:
-                templates[name] = tosca
-
         if template_filter:
             session["filter"] = template_filter
-            templates = {}
-            for k, v in toscaInfo.items():
-                if 'description' and v['description']:
-                    if v['description'].find(template_filter) != -1 and "parents" not in tosca["metadata"]:
-                        templates[k] = v
 
         if settings.debug_oidc_token:
             oidc_blueprint.session.token = {'access_token': settings.debug_oidc_token}
@@ -251,7 +297,15 @@ def create_app(oidc_blueprint=None):
             next_url = session.pop("next")
             return redirect(url_for('home') + next_url[1:])
         else:
-            return render_template('portfolio.html', templates=templates, parent=None)
+            def render_portfolio():
+                templates = toscaCatalog.views.get(g.catalog, session.get('vos')).parents
+                if template_filter:
+                    found = g.catalog.index.search(template_filter)
+                    templates = OrderedDict((name, tosca) for name, tosca in templates.items() if name in found)
+                return render_template('portfolio.html', templates=templates, parent=None)
+
+            etag_parts = [session.get(key) for key in ['userid', 'username', 'gravatar', 'vos', 'external_links']]
+            return catalog_response(etag_parts + [template_filter], render_portfolio, private=True)
 
     @app.route('/vminfo')
     @authorized_with_valid_token
@@ -271,119 +325,37 @@ def create_app(oidc_blueprint=None):
             flash("Error retrieving VM info: \n" + response.text, 'error')
             return redirect(url_for('showinfrastructures'))
         else:
-            vminfo = {}
-            state = ""
-            nets = ""
-            disks = ""
-            deployment = ""
             app.logger.debug("VM Info: %s" % response.text)
-            radl_json = response.json()["radl"]
-            outports = utils.get_out_ports(radl_json)
-            vminfo = utils.format_json_radl(radl_json)
-            if "cpu.arch" in vminfo:
-                del vminfo["cpu.arch"]
-            if "state" in vminfo:
-                state = vminfo["state"]
-                del vminfo["state"]
-            if "provider.type" in vminfo:
-                deployment = vminfo["provider.type"]
-                del vminfo["provider.type"]
-            if "provider.vo" in vminfo:
-                del vminfo["provider.vo"]
-            if "provider.host" in vminfo:
-                if "provider.port" in vminfo:
-                    deployment += ": %s:%s" % (vminfo["provider.host"], vminfo["provider.port"])
-                    del vminfo["provider.port"]
-                else:
-                    deployment += ": " + vminfo["provider.host"]
-                del vminfo["provider.host"]
-            if "disk.0.os.name" in vminfo:
-                del vminfo["disk.0.os.name"]
-            if "gpu.count" in vminfo and vminfo["gpu.count"] <= 0:
-                del vminfo["gpu.count"]
-                if "gpu.model" in vminfo:
-                    del vminfo["gpu.model"]
-                if "gpu.vendor" in vminfo:
-                    del vminfo["gpu.vendor"]
-
-            cont = 0
-            while "net_interface.%s.connection" % cont in vminfo:
-                if "net_interface.%s.ip" % cont in vminfo:
-                    if cont > 0:
-                        nets += Markup('<br/>')
-                    nets += Markup('<i class="fa fa-network-wired"></i>')
-                    nets += Markup(' <span class="badge bg-secondary">%s</span>' % cont)
-                    nets += ": %s" % vminfo["net_interface.%s.ip" % cont]
-                    del vminfo["net_interface.%s.ip" % cont]
-                    if "net_interface.%s.dns_name" % cont in vminfo:
-                        nets += " (%s)" % vminfo["net_interface.%s.dns_name" % cont]
-                        del vminfo["net_interface.%s.dns_name" % cont]
-
-                    if ("net_interface.%s.additional_dns_names" % cont in vminfo and
-                            vminfo["net_interface.%s.additional_dns_names" % cont]):
-                        dns_names = vminfo["net_interface.%s.additional_dns_names" % cont]
-                        nets += " (%s)" % ", ".join(dns_names).replace("@", ".")
-                        del vminfo["net_interface.%s.additional_dns_names" % cont]
-
-                cont += 1
-
-            cont = 0
-            while "net_interface.%s.connection" % cont in vminfo:
-                del vminfo["net_interface.%s.connection" % cont]
-                cont += 1
-
-            for elem in vminfo:
-                if elem.endswith("size") and isinstance(vminfo[elem], (int, float)):
-                    vminfo[elem] = "%.1f GiB" % (vminfo[elem] / 1073741824.0)
-
-            cont = 0
-            while "disk.%s.size" % cont in vminfo or "disk.%s.image.url" % cont in vminfo:
-                if cont > 0:
-                    disks += Markup('<br/>')
-                disks += Markup('<i class="fa fa-database"></i> <span class="badge bg-secondary">'
-                                '%s</span><br/>' % cont)
-
-                prop_map = {"size": "Size", "image.url": "URL", "device": "Device", "mount_path": "Mount Path",
-                            "fstype": "F.S. type", "os.flavour": "O.S. Flavor", "os.version": "O.S. Version",
-                            "type": "Volume Type"}
-                for name, label in prop_map.items():
-                    prop = "disk.%s.%s" % (cont, name)
-                    if prop in vminfo:
-                        disks += Markup('&nbsp;&nbsp;')
-                        disks += "- %s: %s" % (label, vminfo[prop])
-                        disks += Markup('<br/>')
-                        del vminfo[prop]
-
-                cont += 1
-
-            # delete disk info of disks without size
-            for prop_name in ["device", "fstype", "mount_path"]:
-                new_cont = cont
-                prop = "disk.%s.%s" % (new_cont, prop_name)
-                while prop in vminfo:
-                    del vminfo[prop]
-                    new_cont += 1
-
-            str_outports = ""
-            if outports:
-                for port in outports:
-                    remote_cidr = ""
-                    if port.get_remote_cidr() != "0.0.0.0/0":
-                        remote_cidr = "%s-" % port.get_remote_cidr()
-                    str_outports += Markup('<i class="fas fa-project-diagram"></i> <span class="badge '
-                                           'bg-secondary">%s%s</span>' % (remote_cidr, port.get_remote_port()))
-                    if not port.is_range():
-                        if port.get_remote_port() != port.get_local_port():
-                            str_outports += Markup(' <i class="fas fa-long-arrow-alt-right">'
-                                                   '</i> <span class="badge bg-secondary">%s</span>' %
-                                                   port.get_local_port())
-                    else:
-                        str_outports += Markup(' : </i> <span class="badge bg-secondary">%s</span>' %
-                                               port.get_local_port())
-                    str_outports += Markup('<br/>')
+            vm = format_vminfo(response.json()["radl"])
 
-        return render_template('vminfo.html', infid=infid, vmid=vmid, vminfo=vminfo, outports=str_outports,
-                               state=state, nets=nets, deployment=deployment, disks=disks)
+        return render_template('vminfo.html', infid=infid, vmid=vmid, **vm)
+
+    @app.route('/vms/<infid>')
+    @authorized_with_valid_token
+    def showvms(infid=None):
+        access_token = oidc_blueprint.session.token['access_token']
+        auth_data = utils.getUserAuthData(access_token, cred, get_cred_id(), infra.get_infra_cred_id(infid))
+        try:
+            vm_states = im.get_inf_state(infid, auth_data)["vm_states"]
+        except Exception as ex:
+            flash("Error: %s." % ex, 'error')
+            return redirect(url_for('showinfrastructures'))
+
+        def get_vm(vmid):
+            try:
+                response = im.get_vm_info(infid, vmid, auth_data)
+                if not response.ok:
+                    raise Exception(response.text)
+                return format_vminfo(response.json()["radl"])
+            except Exception as ex:
+                return {"error": str(ex), "state": vm_states[vmid]}
+
+        # Get the info of all the VMs concurrently with the same auth data, with a pool per request
+        # so an infrastructure with many VMs does not delay the requests of other users
+        vmids = sorted(vm_states, key=lambda vmid: (not vmid.isdigit(), int(vmid) if vmid.isdigit() else vmid))
+        with ThreadPoolExecutor(max(min(settings.vm_info_workers, len(vmids)), 1)) as executor:
+            vms = OrderedDict(zip(vmids, executor.map(get_vm, vmids)))
+        return render_template('infvms.html', infid=infid, vms=vms)
 
     @app.route('/managevm/<op>/<infid>/<vmid>', methods=['POST'])
     @authorized_with_valid_token
@@ -398,31 +370,21 @@ def create_app(oidc_blueprint=None):
                 form_data = request.form.to_dict()
                 cpu = int(form_data['cpu'])
                 memory = float(form_data['memory'])
-                gpu = int(form_data.get('gpu', 0))
-                disk_size = float(form_data.get('disk_size', 0))
-
-                vminforesp = im.get_vm_info(infid, vmid, auth_data, "text/plain")
-                if vminforesp.ok:
-                    vminfo = radl_parse.parse_radl(vminforesp.text)
-                    vminfo.systems[0].delValue("instance_type")
-                    vminfo.systems[0].delValue("cpu.count")
-                    vminfo.systems[0].addFeature(Feature("cpu.count", ">=", cpu),
-                                                 conflict="other", missing="other")
-                    vminfo.systems[0].delValue("memory.size")
-                    vminfo.systems[0].addFeature(Feature("memory.size", ">=", memory, "GB"),
-                                                 conflict="other", missing="other")
-                    if gpu > 0:
-                        vminfo.systems[0].delValue("gpu.count")
-                        vminfo.systems[0].addFeature(Feature("gpu.count", ">=", gpu),
-                                                     conflict="other", missing="other")
-                    if disk_size > 0:
-                        vminfo.systems[0].delValue("disks.free_size")
-                        vminfo.systems[0].delValue("disks.0.free_size")
-                        vminfo.systems[0].addFeature(Feature("disks.free_size", ">=", disk_size, "GB"),
-                                                     conflict="other", missing="other")
-                    response = im.resize_vm(infid, vmid, str(vminfo), auth_data)
-                else:
-                    raise Exception("Error getting VM info: %s" % vminforesp.text)
+                gpu = int(form_data.get('gpu') or 0)
+                disk_size = float(form_data.get('disk_size') or 0)
+
+                # Send only the new features, without getting the VM RADL
+                vm_radl = utils.resize_radl(cpu, memory, gpu, disk_size, system_name=form_data.get('system') or "vm")
+                response = im.resize_vm(infid, vmid, vm_radl, auth_data)
+                if response.status_code in [400, 415, 422]:
+                    # The IM rejected the partial RADL, so merge the new features in the VM RADL
+                    app.logger.warning("Error resizing VM %s with the new features, merging them in the VM RADL: %s"
+                                       % (vmid, response.text))
+                    vminforesp = im.get_vm_info(infid, vmid, auth_data, "text/plain")
+                    if not vminforesp.ok:
+                        raise Exception("Error getting VM info: %s" % vminforesp.text)
+                    vm_radl = utils.resize_radl(cpu, memory, gpu, disk_size, radl_cache.parse(vminforesp.text))
+                    response = im.resize_vm(infid, vmid, vm_radl, auth_data)
             else:
                 response = im.manage_vm(op, infid, vmid, auth_data)
         except Exception as ex:
@@ -431,6 +393,8 @@ def create_app(oidc_blueprint=None):
 
         if response.ok:
             flash("Operation '%s' successfully made on VM ID: %s" % (op, vmid), 'success')
+            if op == "reconfigure":
+                invalidate_log(infid)
         else:
             flash("Error making %s op on VM %s: \n%s" % (op, vmid, response.text), 'error')
 
@@ -470,7 +434,7 @@ def create_app(oidc_blueprint=None):
                     response = im.get_inf_property(inf_id, "radl", auth_data)
                     if not response.ok:
                         raise Exception(response.text)
-                    infra_radl = radl_parse.parse_radl(response.text)
+                    infra_radl = radl_cache.parse(response.text, copy=False)
                     if infra_radl.description and infra_radl.description.getValue("name"):
                         infra_data["name"] = infra_radl.description.getValue("name")
                         infrastructures[inf_id]['name'] = infra_data["name"]
@@ -539,10 +503,7 @@ def create_app(oidc_blueprint=None):
         auth_data = utils.getUserAuthData(access_token, cred, get_cred_id(), infra.get_infra_cred_id(infid))
         try:
             state = im.get_inf_state(infid, auth_data)
-            try:
-                infra.write_infra(infid, {"state": state})
-            except Exception as ex:
-                app.logger.error("Error saving infrastructure state: %s" % ex)
+            save_inf_state(infid, state)
             return state
         except Timeout as texs:
             app.logger.error("Timeout waiting infrastructure state: %s" % texs)
@@ -611,64 +572,222 @@ def create_app(oidc_blueprint=None):
 
         return render_template('deptemplate.html', template=template)
 
-    def add_colors(log):
-        """Add color in error messages in logs."""
-        res = ""
-        lines = log.split('\n')
-        for n, line in enumerate(lines):
-            if "ERROR executing task" in line or ("fatal: " in line and "...ignoring" not in lines[n + 1]):
-                res += Markup('<span class="bg-danger text-white">%s</span><br>' % line)
-            else:
-                res += Markup("%s<br>\n" % line)
-        return res
+    def log_range(index):
+        """Get the page size and the lines [start, end) of a log selected in the request.
+
+        The page starts at the line start, at the separator of the VM vm, it is
+        the whole log with all or, by default, the tail of the log.
+        """
+        count = request.args.get('count', settings.log_page_lines, type=int)
+        if request.args.get('all'):
+            count = index.num_lines
+        count = max(count, 1)
+        return (count,) + index.page(count, request.args.get('start', type=int), request.args.get('vm', type=int))
+
+    def log_page(log, separators=True):
+        index = log_indexes.get(log)
+        count, start, end = log_range(index)
+        return {"start": start, "end": end, "count": count, "total": index.num_lines,
+                "vms": len(index.vm_lines) if separators else 0, "log": index.render(log, start, end, separators),
+                "offset": "%d-%d" % (index.size, len(index.vm_lines) if separators else 0)}
+
+    def log_cache_key(infid, vmid=None):
+        """Get the key of a log in the log cache, or None if it must not be cached."""
+        if not log_cache:
+            return None
+        try:
+            infra_data = infra.get_infra(infid)
+        except Exception as ex:
+            app.logger.error("Error getting infrastructure data: %s" % ex)
+            return None
+        if infra_data.get("state", {}).get("state") not in contmsg.FINAL_STATES:
+            return None
+        return session['userid'], infid, vmid, infra_data.get("log_version", 0)
+
+    def invalidate_log(infid):
+        """The log of the infrastructure is going to change: increase its version and remove it from the cache."""
+        if not log_cache:
+            return
+        log_cache.invalidate(infid)
+        try:
+            infra_data = infra.get_infra(infid)
+            infra.write_infra(infid, {"log_version": infra_data.get("log_version", 0) + 1})
+        except Exception as ex:
+            app.logger.error("Error setting the log version: %s" % ex)
 
-    def add_vm_separators(log):
-        res = ""
-        lines = log.split('\n')
-        vms = 0
-        for line in lines:
-            sline = str(line)
-            if len(sline) > 8 and len(sline) < 12 and sline.startswith("VM ") and sline.endswith(":<br>"):
-                res += Markup('<p id="vm_%s" class="bg-dark text-white">%s</p><br>' % (vms, line))
-                vms += 1
-            else:
-                res += Markup("%s\n" % line)
-        return res, vms
+    def save_inf_state(infid, state):
+        """Save the IM state of an infrastructure, increasing its log version if it leaves a final state."""
+        infra_data = {"state": state}
+        try:
+            old_data = infra.get_infra(infid)
+            if (old_data.get("state", {}).get("state") in contmsg.FINAL_STATES and
+                    state.get("state") not in contmsg.FINAL_STATES):
+                # The log is going to change (e.g. it has been reconfigured outside the dashboard)
+                infra_data["log_version"] = old_data.get("log_version", 0) + 1
+        except Exception as ex:
+            app.logger.error("Error getting infrastructure data: %s" % ex)
+        try:
+            infra.write_infra(infid, infra_data)
+        except Exception as ex:
+            app.logger.error("Error saving infrastructure state: %s" % ex)
+
+    def get_inf_log(infid, vmid=None, auth_data=None, use_cache=True):
+        cache_key = log_cache_key(infid, vmid) if use_cache else None
+        if cache_key:
+            log = log_cache.get(cache_key)
+            if log is not None:
+                return log
+
+        if auth_data is None:
+            access_token = oidc_blueprint.session.token['access_token']
+            auth_data = utils.getIMUserAuthData(access_token, cred, get_cred_id())
+        if vmid is None:
+            response = im.get_inf_property(infid, 'contmsg', auth_data)
+        else:
+            response = im.get_vm_contmsg(infid, vmid, auth_data)
+        if not response.ok:
+            raise Exception(response.text)
+
+        if cache_key:
+            try:
+                # The state in the DB may be outdated, only cache the log if the IM state is final
+                state = im.get_inf_state(infid, auth_data)
+                save_inf_state(infid, state)
+                if state["state"] in contmsg.FINAL_STATES:
+                    log_cache.put(cache_key, response.text)
+            except Exception as ex:
+                app.logger.error("Error caching the log: %s" % ex)
+        return response.text
 
     @app.route('/log/<infid>')
     @authorized_with_valid_token
     def inflog(infid=None):
-        access_token = oidc_blueprint.session.token['access_token']
-        auth_data = utils.getIMUserAuthData(access_token, cred, get_cred_id())
-        log = "Not found"
-        vms = 0
+        page = {"log": "Not found", "vms": 0}
         try:
-            response = im.get_inf_property(infid, 'contmsg', auth_data)
-            if not response.ok:
-                raise Exception(response.text)
-            log = add_colors(response.text)
-            log, vms = add_vm_separators(log)
+            page = log_page(get_inf_log(infid))
         except Exception as ex:
             flash("Error: %s." % ex, 'error')
 
-        return render_template('inflog.html', log=log, vms=vms)
+        return render_template('inflog.html', infid=infid, vmid=None, **page)
 
     @app.route('/vmlog/<infid>/<vmid>')
     @authorized_with_valid_token
     def vmlog(infid=None, vmid=None):
-
-        access_token = oidc_blueprint.session.token['access_token']
-        auth_data = utils.getIMUserAuthData(access_token, cred, get_cred_id())
-        log = "Not found"
+        page = {"log": "Not found", "vms": 0}
         try:
-            response = im.get_vm_contmsg(infid, vmid, auth_data)
-            if not response.ok:
-                raise Exception(response.text)
-            log = add_colors(response.text)
+            page = log_page(get_inf_log(infid, vmid), separators=False)
         except Exception as ex:
             flash("Error: %s." % ex, 'error')
 
-        return render_template('inflog.html', log=log, vmid=vmid, vms=0)
+        return render_template('inflog.html', infid=infid, vmid=vmid, **page)
+
+    @app.route('/log/<infid>/page')
+    @app.route('/vmlog/<infid>/<vmid>/page')
+    @authorized_with_valid_token
+    def log_page_api(infid=None, vmid=None):
+        """Get a page of a log in JSON format or, with format=text, the text of the lines selected."""
+        text = request.args.get('format') == 'text'
+        filename = "%s-log.txt" % (vmid if vmid is not None else "deployment")
+        if text and request.args.get('all') and request.accept_encodings['gzip'] > 0:
+            # Serve the compressed file of the cache of the current log version, with range support
+            cache_key = log_cache_key(infid, vmid)
+            path = log_cache.get_path(cache_key) if cache_key else None
+            if path:
+                response = send_file(path, mimetype='text/plain', as_attachment=True, download_name=filename,
+                                     conditional=True)
+                response.headers['Content-Encoding'] = 'gzip'
+                response.headers['Vary'] = 'Accept-Encoding'
+                return response
+
+        try:
+            log = get_inf_log(infid, vmid)
+        except Exception as ex:
+            return make_response("Error: %s." % ex, 502, {'Content-Type': 'text/plain'})
+
+        if text:
+            index = log_indexes.get(log)
+            _, start, end = log_range(index)
+            return make_response("\n".join(index.lines(log, start, end)), 200,
+                                 {'Content-Type': 'text/plain; charset=utf-8',
+                                  'Content-Disposition': 'attachment; filename="%s"' % filename})
+
+        page = log_page(log, separators=vmid is None)
+        return make_response(json.dumps(page), 200, {'Content-Type': 'application/json'})
+
+    @app.route('/log/<infid>/search')
+    @app.route('/vmlog/<infid>/<vmid>/search')
+    @authorized_with_valid_token
+    def log_search(infid=None, vmid=None):
+        """Search a text in a log and return the matches in JSON format."""
+        query = request.args.get('q')
+        if not query:
+            return make_response("No search text.", 400, {'Content-Type': 'text/plain'})
+        context = min(max(request.args.get('context', 2, type=int), 0), 10)
+        max_matches = min(max(request.args.get('max', contmsg.MAX_SEARCH_MATCHES, type=int), 1),
+                          contmsg.MAX_SEARCH_MATCHES)
+
+        try:
+            cache_key = log_cache_key(infid, vmid)
+            log_file = log_cache.open(cache_key) if cache_key else None
+            if log_file is None:
+                log_file = io.StringIO(get_inf_log(infid, vmid), newline="\n")
+        except Exception as ex:
+            return make_response("Error: %s." % ex, 502, {'Content-Type': 'text/plain'})
+
+        with log_file:
+            res = contmsg.search_log(log_file, query, context, max_matches)
+        return make_response(json.dumps(res), 200, {'Content-Type': 'application/json'})
+
+    @app.route('/log/<infid>/tail')
+    @app.route('/vmlog/<infid>/<vmid>/tail')
+    @authorized_with_valid_token
+    def log_tail(infid=None, vmid=None):
+        """Stream as Server-Sent Events the lines added to a log while the infrastructure is being configured."""
+        access_token = oidc_blueprint.session.token['access_token']
+        auth_data = utils.getIMUserAuthData(access_token, cred, get_cred_id())
+        # The id of the events is the offset in the log and the number of VM separators already sent
+        last_id = request.headers.get('Last-Event-ID') or request.args.get('offset', '0-0')
+        try:
+            offset, vms = [int(elem) for elem in last_id.split("-")]
+        except ValueError:
+            offset, vms = 0, 0
+        tail = contmsg.LogTail(offset, vms, separators=vmid is None)
+        userid = session['userid']
+        if not log_followers.acquire(userid):
+            return make_response("Too many logs followed.", 429, {'Content-Type': 'text/plain'})
+
+        def generate():
+            deadline = time.time() + settings.log_tail_timeout
+            while True:
+                try:
+                    state = im.get_inf_state(infid, auth_data)["state"]
+                    # The log is not going to grow: render the incomplete last line and end
+                    final = state not in ["pending", "running"]
+                    html = tail.update(get_inf_log(infid, vmid, auth_data, use_cache=False), final)
+                except Exception as ex:
+                    yield utils.sse_event("Error: %s." % ex, "failure")
+                    return
+
+                if html is None:
+                    # The log has been truncated (e.g. the infrastructure has been reconfigured)
+                    yield utils.sse_event("", "reset")
+                    return
+                if html:
+                    yield utils.sse_event(html, event_id="%d-%d" % (tail.offset, tail.vms))
+                else:
+                    yield ": keepalive\n\n"
+                if final:
+                    yield utils.sse_event(state, "end")
+                    return
+                if time.time() > deadline:
+                    # Release the worker, the browser reconnects sending the last event id
+                    return
+                time.sleep(settings.log_tail_interval)
+
+        response = Response(stream_with_context(generate()), mimetype='text/event-stream',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+        response.call_on_close(lambda: log_followers.release(userid))
+        return response
 
     @app.route('/outputs/<infid>')
     @authorized_with_valid_token
@@ -730,36 +849,24 @@ def create_app(oidc_blueprint=None):
         if 'selected_tosca' in request.args:
             selected_tosca = request.args['selected_tosca']
 
+        toscaInfo = g.catalog.templates
         if not selected_tosca or selected_tosca not in toscaInfo:
             flash("Invalid TOSCA template name: %s" % selected_tosca, "error")
             return redirect(url_for('home'))
 
-        if not utils.valid_template_vos(session['vos'], toscaInfo[selected_tosca]["metadata"]):
+        view = toscaCatalog.views.get(g.catalog, session['vos'])
+        if selected_tosca not in view.visible:
             flash("Invalid TOSCA template name: %s" % selected_tosca, "error")
             return redirect(url_for('home'))
 
-        child_templates = {}
-        selected_template = copy.deepcopy(toscaInfo[selected_tosca])
         if "childs" in toscaInfo[selected_tosca]["metadata"]:
-            if childs is not None:
-                for child in childs:
-                    if child in toscaInfo and utils.valid_template_vos(session['vos'], toscaInfo[child]["metadata"]):
-                        child_templates[child] = toscaInfo[child]
-                        if "inputs" in toscaInfo[child]:
-                            for k, v in toscaInfo[child]["inputs"].items():
-                                if k not in selected_template["inputs"]:
-                                    selected_template["inputs"][k] = v
-                                else:
-                                    selected_template["inputs"][k].update(v)
-                        if "tabs" in toscaInfo[child]:
-                            selected_template["tabs"].extend(toscaInfo[child]["tabs"])
-            else:
-                for child in toscaInfo[selected_tosca]["metadata"]["childs"]:
-                    if child in toscaInfo and utils.valid_template_vos(session['vos'], toscaInfo[child]["metadata"]):
-                        child_templates[child] = toscaInfo[child]
-                return render_template('portfolio.html', templates=child_templates, parent=selected_tosca)
+            if childs is None:
+                return render_template('portfolio.html', templates=view.children[selected_tosca],
+                                       parent=selected_tosca)
         else:
             app.logger.debug("Template: " + json.dumps(toscaInfo[selected_tosca]))
+            childs = None
+        selected_template, child_templates = view.merged(selected_tosca, childs)
 
         try:
             creds = cred.get_creds(get_cred_id(), 1)
@@ -1041,13 +1148,9 @@ def create_app(oidc_blueprint=None):
         if request.args.get('template') == 'tosca.yml':
             try:
                 if form_data.get('tosca'):
-                    template = yaml.safe_load(form_data.get('tosca'))
-                    ToscaTemplate(yaml_dict_tpl=copy.deepcopy(template))
+                    template = tosca_validator.validate(form_data.get('tosca'))
                 else:
-                    response = requests.get(form_data.get('tosca_url'), timeout=10)
-                    response.raise_for_status()
-                    template = yaml.safe_load(response.text)
-                    ToscaTemplate(yaml_dict_tpl=copy.deepcopy(template))
+                    template = tosca_fetcher.get_template(form_data.get('tosca_url'))
             except Exception as ex:
                 msg = "%s" % ex
                 flash("Invalid TOSCA specified: '%s'." % msg[:512], "error")
@@ -1090,6 +1193,7 @@ def create_app(oidc_blueprint=None):
             response = im.create_inf(payload, auth_data)
             if not response.ok:
                 raise Exception(response.text)
+            stats_store.invalidate(session['userid'])
 
             try:
                 # Remove all sensible data
@@ -1226,7 +1330,7 @@ def create_app(oidc_blueprint=None):
                 image_url_str = None
                 image_url = None
                 try:
-                    radl = radl_parse.parse_radl(response.text)
+                    radl = radl_cache.parse(response.text, copy=False)
                     systems = radl.systems
                     image_url_str = systems[0].getValue("disk.0.image.url")
                     image_url = urlparse(image_url_str)
@@ -1266,7 +1370,7 @@ def create_app(oidc_blueprint=None):
                 radl = None
                 total_dep = 0
                 try:
-                    radl = radl_parse.parse_radl(response.text)
+                    radl = radl_cache.parse(response.text)
                     radl.deploys = []
                     for system in radl.systems:
                         if 'newImage' in form_data and form_data['newImage']:
@@ -1286,6 +1390,7 @@ def create_app(oidc_blueprint=None):
                         response = im.addresource_inf(infid, str(radl), auth_data)
                         if not response.ok:
                             raise Exception(response.text)
+                        invalidate_log(infid)
                         num = len(response.json()["uri-list"])
                         flash("%d nodes added successfully" % num, 'success')
                     except Exception as ex:
@@ -1299,6 +1404,56 @@ def create_app(oidc_blueprint=None):
                 flash("Error getting RADL: \n%s" % (response.text), 'error')
                 return redirect(url_for('showinfrastructures'))
 
+    @app.route('/bulk/<op>', methods=['POST'])
+    @authorized_with_valid_token
+    def bulk_op(op=None):
+        if op not in ["start", "stop", "delete", "reconfigure"]:
+            return make_response("Invalid operation: %s." % op, 400, {'Content-Type': 'text/plain'})
+        infids = list(OrderedDict.fromkeys(request.form.getlist('infid')))
+        if not infids:
+            return make_response("No infrastructures selected.", 400, {'Content-Type': 'text/plain'})
+        force = request.form.get('force', '0') != '0'
+        user = session['userid']
+
+        # The auth data must be got in the request context
+        access_token = oidc_blueprint.session.token['access_token']
+        inf_auth_data = {}
+        for infid in infids:
+            inf_auth_data[infid] = utils.getUserAuthData(access_token, cred, get_cred_id(),
+                                                         infra.get_infra_cred_id(infid))
+
+        def run_op(infid):
+            auth_data = inf_auth_data[infid]
+            if op == "delete":
+                response = im.delete_inf(infid, force, auth_data)
+            elif op == "reconfigure":
+                response = im.reconfigure_inf(infid, auth_data)
+            else:
+                response = im.manage_inf(op, infid, auth_data)
+            if not response.ok:
+                raise Exception(response.text)
+
+            if op == "delete":
+                stats_store.invalidate(user)
+                set_infra_deleting(infid)
+            if op in ["delete", "reconfigure"]:
+                invalidate_log(infid)
+            return "Operation '%s' successfully made." % op
+
+        job_id = bulk_jobs.submit(user, op, infids, run_op, im.im_url)
+        if job_id is None:
+            return make_response("Too many bulk operations in progress.", 429, {'Content-Type': 'text/plain'})
+        res = {"id": job_id, "url": url_for('bulk_job', job_id=job_id)}
+        return make_response(json.dumps(res), 202, {'Content-Type': 'application/json'})
+
+    @app.route('/jobs/<job_id>')
+    @authorized_with_valid_token
+    def bulk_job(job_id=None):
+        job = bulk_jobs.get(job_id, session['userid'])
+        if job is None:
+            return make_response("Job not found.", 404, {'Content-Type': 'text/plain'})
+        return make_response(json.dumps(job), 200, {'Content-Type': 'application/json'})
+
     @app.route('/manage_inf/<infid>/<op>', methods=['POST'])
     @authorized_with_valid_token
     def manage_inf(infid=None, op=None):
@@ -1320,7 +1475,7 @@ def create_app(oidc_blueprint=None):
                         response = im.get_inf_property(infid, "radl", auth_data)
                         if not response.ok:
                             raise Exception(response.text)
-                        infra_radl = radl_parse.parse_radl(response.text)
+                        infra_radl = radl_cache.parse(response.text)
                         if not infra_radl.description:
                             infra_radl.description = description("desc")
                         if not infra_radl.description.getValue("name"):
@@ -1349,15 +1504,10 @@ def create_app(oidc_blueprint=None):
                 response = im.delete_inf(infid, force, auth_data)
                 if not response.ok:
                     raise Exception(response.text)
+                invalidate_log(infid)
+                stats_store.invalidate(session['userid'])
                 flash("Infrastructure '%s' successfuly deleted." % infid, "success")
-                try:
-                    infra_data = infra.get_infra(infid)
-                    infra_data["state"]["state"] = "deleting"
-                    infra.write_infra(infid, infra_data)
-                    scheduler.add_job('delete_infra_%s' % infid, delete_infra, trigger='interval',
-                                      seconds=60, args=(infid,))
-                except Exception as dex:
-                    app.logger.error('Error setting infra state to deleting.: %s', (dex))
+                set_infra_deleting(infid)
 
                 if recreate:
                     return redirect(url_for('configure', inf_id=infid))
@@ -1382,6 +1532,7 @@ def create_app(oidc_blueprint=None):
                     response = im.reconfigure_inf(infid, auth_data)
                 if not response.ok:
                     raise Exception(response.text)
+                invalidate_log(infid)
                 flash("Reconfiguration process successfuly started.", "success")
             elif op == "change_user":
                 overwrite = False
@@ -1401,6 +1552,8 @@ def create_app(oidc_blueprint=None):
                 response = im.remove_resources(infid, vm_list, auth_data)
                 if not response.ok:
                     raise Exception(response.text)
+                invalidate_log(infid)
+                stats_store.invalidate(session['userid'])
                 flash("VMs %s successfully deleted." % vm_list, "success")
             elif op == "migrate":
                 new_im_url = form_data.get('new_im_url')
@@ -1514,15 +1667,22 @@ def create_app(oidc_blueprint=None):
             return make_response("OAI-PMH not enabled.", 404, {'Content-Type': 'text/plain'})
 
         oai = OAI(settings.oaipmh_repo_name, request.base_url, settings.oaipmh_repo_description,
-                  settings.oaipmh_repo_base_identifier_url, repo_admin_email=app.config.get('SUPPORT_EMAIL'))
+                  settings.oaipmh_repo_base_identifier_url, repo_admin_email=app.config.get('SUPPORT_EMAIL'),
+                  page_size=settings.oaipmh_page_size, token_secret=app.secret_key, version=g.catalog.digest[:16],
+                  stream=True)
 
-        metadata_dict = {}
-        for name, tosca in toscaInfo.items():
-            metadata = tosca["metadata"]
-            metadata_dict[name] = metadata
+        def oai_response():
+            response_xml = oai.processRequest(request, records=oai_records.get(g.catalog, oai))
+            return Response(stream_with_context(response_xml), 200, {'Content-Type': 'text/xml'})
 
-        response_xml = oai.processRequest(request, metadata_dict)
-        return make_response(response_xml, 200, {'Content-Type': 'text/xml'})
+        etag_parts = [request.base_url, sorted(request.values.items(multi=True))]
+        return catalog_response(etag_parts, oai_response)
+
+    @app.route('/metrics')
+    def show_metrics():
+        if not settings.metrics_enabled:
+            return make_response("Metrics not enabled.", 404, {'Content-Type': 'text/plain'})
+        return make_response(metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4'})
 
     @app.route('/reconfigure/<infid>')
     @authorized_with_valid_token
@@ -1595,37 +1755,64 @@ def create_app(oidc_blueprint=None):
         with app.app_context():
             deletedTemplates, newTemplates = utils.reLoadToscaTemplates(settings.toscaDir, toscaTemplates,
                                                                         delay=settings.checkToscaChangesTime + 10)
+            newToscaInfo = {}
             if newTemplates:
                 app.logger.info('Reloading TOSCA templates %s' % newTemplates)
                 for elem in newTemplates:
                     if elem not in toscaTemplates:
                         toscaTemplates.append(elem)
                 newToscaInfo = utils.extractToscaInfo(settings.toscaDir, newTemplates, settings.hide_tosca_tags)
-                toscaInfo.update(newToscaInfo)
 
             if deletedTemplates:
                 app.logger.info('Removing TOSCA templates %s' % deletedTemplates)
                 for elem in deletedTemplates:
-                    if elem in toscaInfo:
-                        del toscaInfo[elem]
+                    toscaTemplates.remove(elem)
+
+            if newTemplates or deletedTemplates:
+                snapshot = toscaCatalog.update(newToscaInfo, deletedTemplates)
+                app.logger.info('TOSCA templates catalog updated to version %d' % snapshot.version)
 
     def delete_infra(infid):
         infra.delete_infra(infid)
         scheduler.remove_job('delete_infra_%s' % infid)
 
+    def set_infra_deleting(infid):
+        try:
+            infra_data = infra.get_infra(infid)
+            infra_data["state"]["state"] = "deleting"
+            infra.write_infra(infid, infra_data)
+            scheduler.add_job('delete_infra_%s' % infid, delete_infra, trigger='interval',
+                              seconds=60, args=(infid,))
+        except Exception as dex:
+            app.logger.error('Error setting infra state to deleting.: %s', (dex))
+
     def get_cred_id():
         if settings.vault_url:
             return oidc_blueprint.session.token['access_token'], vault_info.get_vault_info(session['userid'])
         else:
             return session['userid']
 
+    def get_user_stats(auth_data, access_token, init_date, end_date, today):
+        try:
+            live_ids = set(im.get_inf_list(auth_data))
+        except Exception as ex:
+            app.logger.warning("Error getting the infrastructure list, stats not cached: %s" % ex)
+            live_ids = None
+        # Identify the IM credentials used, ignoring the access token as it is renewed
+        auth_id = hashlib.sha256(auth_data.replace(access_token, "").encode("utf-8")).hexdigest()
+        return stats_store.get_stats(session['userid'], lambda init, end: im.get_stats(auth_data, init, end),
+                                     init_date, end_date, today, auth_id, live_ids)
+
     @app.route('/stats')
     @authorized_with_valid_token
     def show_stats():
         init_date = request.args.get('init_date')
         end_date = request.args.get('end_date')
         active = request.args.get('active')
+        bucket = request.args.get('bucket', 'auto')
         today = datetime.datetime.today().date()
+        if request.args.get('refresh'):
+            stats_store.invalidate(session['userid'])
 
         if not end_date:
             end_date = str(today)
@@ -1636,87 +1823,39 @@ def create_app(oidc_blueprint=None):
         access_token = oidc_blueprint.session.token['access_token']
 
         auth_data = utils.getIMUserAuthData(access_token, cred, get_cred_id())
-        fedcloud_sites = None
-        inf_actives = []
-        # Add an element in the first date
-        infs = [0]
-        vms = [0]
-        cpus = [0]
-        mems = [0]
-        labels = ["%s 00:00:00" % init_date]
-        cloud_hosts = []
-        clouds = [""]
-        site_name = None
+        series = stats.stats_series([], init_date, end_date)
         try:
-            for inf_stat in sorted(im.get_stats(auth_data, init_date, end_date),
-                                   key=lambda stat: stat['creation_date']):
-                if inf_stat['cloud_host']:
-                    # only load this data if a EGI Cloud site appears
-                    if fedcloud_sites is None:
-                        fedcloud_sites = {}
-                        for site in list(utils.getCachedSiteList().values()):
-                            site_host = urlparse(site['url'])[1].split(":")[0]
-                            fedcloud_sites[site_host] = site["name"]
-
-                    site_name = inf_stat['cloud_host']
-                    if site_name in fedcloud_sites:
-                        site_name = fedcloud_sites[site_name]
-                elif inf_stat['cloud_type']:
-                    site_name = inf_stat['cloud_type']
-
-                if site_name not in cloud_hosts:
-                    cloud_hosts.append(site_name)
-
-                if active:
-                    curr_date = datetime.datetime.strptime(inf_stat['creation_date'], "%Y-%m-%d %H:%M:%S")
-                    inf_list = list(inf_actives)
-                    for inf in inf_list:
-                        del_time = datetime.datetime.strptime(inf[4], "%Y-%m-%d %H:%M:%S")
-                        if del_time <= curr_date:
-                            infs.append(-1)
-                            vms.append(inf[0] * -1)
-                            mems.append(inf[1] * -1.0)
-                            cpus.append(inf[2] * -1)
-                            clouds.append(inf[3])
-                            labels.append(inf[4])
-                            inf_actives.remove(inf)
-
-                    inf_actives.append((inf_stat['vm_count'], (inf_stat['memory_size'] / 1024),
-                                        inf_stat['cpu_count'], site_name, "%s 12:00:00" % inf_stat['last_date']))
-
-                infs.append(1)
-                vms.append(inf_stat['vm_count'])
-                mems.append((inf_stat['memory_size'] / 1024))
-                cpus.append(inf_stat['cpu_count'])
-                labels.append(inf_stat['creation_date'])
-                clouds.append(site_name)
-
-            if active:
-                curr_date = datetime.datetime.strptime("%s 23:59:59" % end_date, "%Y-%m-%d %H:%M:%S")
-                for inf in inf_actives:
-                    del_time = datetime.datetime.strptime(inf[4], "%Y-%m-%d %H:%M:%S")
-                    if del_time <= curr_date:
-                        infs.append(-1)
-                        vms.append(inf[0])
-                        mems.append(inf[1])
-                        cpus.append(inf[2])
-                        clouds.append(inf[3])
-                        labels.append(inf[4])
-
-            # Add an element in the last date
-            infs.append(0)
-            vms.append(0)
-            mems.append(0)
-            cpus.append(0)
-            labels.append("%s 23:59:59" % end_date)
-            clouds.append("")
-
+            inf_stats = get_user_stats(auth_data, access_token, init_date, end_date, today)
+            series = stats.stats_series(inf_stats, init_date, end_date, active, utils.getStatsSiteName())
         except Exception as ex:
             flash("Error Getting Stats: %s." % ex, 'error')
 
-        return render_template('stats.html', infs=infs, vms=vms, cpus=cpus, mems=mems, labels=labels,
-                               today=str(today), init_date=init_date or "", end_date=end_date or "",
-                               cloud_hosts=cloud_hosts, clouds=clouds)
+        plot_series = stats.cumulative_series(series, stats.bucket_size(series, bucket))
+        return render_template('stats.html', today=str(today), init_date=init_date or "", end_date=end_date or "",
+                               cloud_hosts=series["cloud_hosts"], series=plot_series, bucket=bucket, active=active)
+
+    @app.route('/stats/export')
+    @authorized_with_valid_token
+    def export_stats():
+        fmt = request.args.get('format', 'csv')
+        if fmt not in stats.EXPORT_FORMATS:
+            return make_response("Invalid format: %s." % fmt, 400, {'Content-Type': 'text/plain'})
+        today = datetime.datetime.today().date()
+        init_date = request.args.get('init_date') or str(today - datetime.timedelta(days=180))
+        end_date = request.args.get('end_date') or str(today)
+        sites = set(request.args.getlist('site'))
+
+        access_token = oidc_blueprint.session.token['access_token']
+        auth_data = utils.getIMUserAuthData(access_token, cred, get_cred_id())
+        try:
+            inf_stats = get_user_stats(auth_data, access_token, init_date, end_date, today)
+        except Exception as ex:
+            return make_response("Error Getting Stats: %s." % ex, 502, {'Content-Type': 'text/plain'})
+
+        filename = "stats_%s_%s.%s" % (init_date, end_date, fmt)
+        return Response(stream_with_context(stats.export_stats(inf_stats, fmt, utils.getStatsSiteName(), sites)),
+                        mimetype=stats.EXPORT_FORMATS[fmt],
+                        headers={'Content-Disposition': 'attachment; filename="%s"' % filename})
 
     return app
 
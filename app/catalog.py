@@ -0,0 +1,180 @@
+#
+# IM - Infrastructure Manager Dashboard
+# Copyright (C) 2020 - GRyCAP - Universitat Politecnica de Valencia
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""Classes to manage the TOSCA templates catalog."""
+
+import copy
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from app import utils
+from app.search import TemplateIndex
+
+
+class CatalogView:
+    """Part of the catalog visible for a set of VOs.
+
+    The view is read only: the templates returned must not be modified.
+    """
+
+    MAX_MERGED = 64
+
+    def __init__(self, toscaInfo, user_vos):
+        """Creator function."""
+        self.toscaInfo = toscaInfo
+        self.visible = set()
+        self.parents = OrderedDict()
+        self.children = {}
+        self._merged = OrderedDict()
+        self._lock = threading.Lock()
+
+        for name, tosca in toscaInfo.items():
+            if utils.valid_template_vos(user_vos, tosca["metadata"]):
+                self.visible.add(name)
+                if "parents" not in tosca["metadata"]:
+                    self.parents[name] = tosca
+
+        for name in self.visible:
+            child_templates = OrderedDict()
+            for child in toscaInfo[name]["metadata"].get("childs") or []:
+                if child in self.visible:
+                    child_templates[child] = toscaInfo[child]
+            self.children[name] = child_templates
+
+    def merged(self, name, childs=None):
+        """Get the template with the inputs and tabs of the selected childs merged and the childs used."""
+        childs = tuple(child for child in childs or [] if child in self.visible)
+        key = (name, childs)
+        with self._lock:
+            if key in self._merged:
+                self._merged.move_to_end(key)
+                return self._merged[key]
+
+        template = self.toscaInfo[name]
+        child_templates = OrderedDict()
+        if childs:
+            template = copy.deepcopy(template)
+            for child in childs:
+                child_templates[child] = self.toscaInfo[child]
+                for k, v in self.toscaInfo[child].get("inputs", {}).items():
+                    if k not in template["inputs"]:
+                        template["inputs"][k] = copy.deepcopy(v)
+                    else:
+                        template["inputs"][k].update(v)
+                if "tabs" in self.toscaInfo[child]:
+                    template["tabs"].extend(self.toscaInfo[child]["tabs"])
+
+        with self._lock:
+            self._merged[key] = template, child_templates
+            while len(self._merged) > self.MAX_MERGED:
+                self._merged.popitem(last=False)
+        return template, child_templates
+
+
+class CatalogViews:
+    """Memoized per VO set catalog views, computed once per catalog version."""
+
+    def __init__(self, max_views=256):
+        """Creator function."""
+        self.max_views = max_views
+        self._views = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, snapshot, user_vos):
+        """Get the view of a catalog snapshot for a set of VOs."""
+        key = (snapshot.version, tuple(sorted(user_vos or [])))
+        with self._lock:
+            if key in self._views:
+                self._views.move_to_end(key)
+                return self._views[key]
+
+        view = CatalogView(snapshot.templates, user_vos)
+
+        with self._lock:
+            self._views[key] = view
+            while len(self._views) > self.max_views:
+                self._views.popitem(last=False)
+        return view
+
+
+class CatalogSnapshot:
+    """Immutable version of the catalog: neither the templates nor the index must be modified."""
+
+    def __init__(self, version, templates, index):
+        """Creator function."""
+        self.version = version
+        self.templates = templates
+        self.index = index
+        self.timestamp = time.time()
+        self._digest = None
+
+    @property
+    def digest(self):
+        """Hash of the contents of the catalog, the same in all the processes serving the same templates."""
+        if self._digest is None:
+            try:
+                data = json.dumps(self.templates, sort_keys=True, default=str)
+            except TypeError:
+                # Not comparable keys
+                data = json.dumps(self.templates, default=str)
+            self._digest = hashlib.sha256(data.encode("utf-8")).hexdigest()
+        return self._digest
+
+
+class ToscaCatalog:
+    """TOSCA templates catalog held as copy-on-write versioned snapshots.
+
+    Readers get the current snapshot with snapshot() and keep using it for
+    the whole request, while update() builds a new one and swaps it atomically.
+    """
+
+    def __init__(self, toscaInfo):
+        """Creator function."""
+        index = TemplateIndex()
+        index.update(toscaInfo)
+        self._snapshot = CatalogSnapshot(1, OrderedDict(toscaInfo), index)
+        self._lock = threading.Lock()
+        self.views = CatalogViews()
+
+    def snapshot(self):
+        return self._snapshot
+
+    @property
+    def version(self):
+        return self._snapshot.version
+
+    def update(self, newToscaInfo=None, deletedTemplates=None):
+        """Create a new version of the catalog adding/replacing and deleting the specified templates."""
+        with self._lock:
+            old = self._snapshot
+            templates = dict(old.templates)
+            index = old.index.copy()
+            for name in deletedTemplates or []:
+                templates.pop(name, None)
+                index.remove(name)
+            if newToscaInfo:
+                templates.update(newToscaInfo)
+                index.update(newToscaInfo)
+            templates = OrderedDict(sorted(templates.items(), key=lambda x: x[1]["metadata"]['order']))
+            self._snapshot = CatalogSnapshot(old.version + 1, templates, index)
+            return self._snapshot
@@ -0,0 +1,371 @@
+#
+# IM - Infrastructure Manager Dashboard
+# Copyright (C) 2020 - GRyCAP - Universitat Politecnica de Valencia
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""Functions to render the contextualization logs (contmsg) of the infrastructures."""
+
+import bisect
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from array import array
+from collections import OrderedDict, deque
+from itertools import accumulate
+
+from markupsafe import Markup, escape
+
+# States of the infrastructures whose logs do not change
+FINAL_STATES = ["configured", "unconfigured", "failed"]
+MAX_SEARCH_MATCHES = 1000
+
+
+def is_error(line, next_line=""):
+    """Check if a log line is an error message (an ignored fatal error is not)."""
+    return "ERROR executing task" in line or ("fatal: " in line and "...ignoring" not in next_line)
+
+
+def is_vm_separator(line):
+    """Check if a log line is the separator of the log of a VM ("VM <num>:")."""
+    return 4 < len(line) < 8 and line.startswith("VM ") and line.endswith(":")
+
+
+def _annotate(lines, separators, first_vm, next_line=""):
+    """Highlight the errors and convert the VM separators of a list of escaped lines in place.
+
+    next_line is the line of the log after the last one.
+    """
+    vms = first_vm
+    last = len(lines) - 1
+    for n, line in enumerate(lines):
+        if separators and line.startswith("VM ") and is_vm_separator(line):
+            lines[n] = '<p id="vm_%d" class="bg-dark text-white">%s<br></p>' % (vms, line)
+            vms += 1
+        elif (("fatal: " in line or "ERROR executing task" in line) and
+              is_error(line, lines[n + 1] if n < last else next_line)):
+            lines[n] = '<span class="bg-danger text-white">%s</span>' % line
+    return vms - first_vm
+
+
+def render_lines(lines, separators=True, first_vm=0, next_line=""):
+    """Render a list of log lines in HTML and return it with the number of VM separators.
+
+    The lines are escaped, the errors highlighted (next_line is the line of the
+    log after them) and, if separators is set, the VM separators are converted
+    in anchors numbered from first_vm.
+    """
+    if not lines:
+        return Markup(""), 0
+    lines = str(escape("\n".join(lines))).split("\n")
+    vms = _annotate(lines, separators, first_vm, next_line)
+    return Markup("<br>\n".join(lines) + "<br>\n"), vms
+
+
+def search_log(lines, text, context=2, max_matches=MAX_SEARCH_MATCHES):
+    """Search a text in the lines of a log (any iterable, e.g. a file), in a single pass.
+
+    Return the matching lines (number, VM, text and the context lines before
+    and after), the total number of matches and the number of matches of each
+    VM (None for the lines before the first VM separator). Only max_matches
+    matches are returned, but all of them are counted.
+    """
+    before = deque(maxlen=context)
+    pending = []
+    matches = []
+    vm_hits = OrderedDict()
+    total = 0
+    vm = None
+    for n, line in enumerate(lines):
+        if line.endswith("\n"):
+            line = line[:-1]
+        for elem in pending:
+            elem["after"].append(line)
+        if pending and len(pending[0]["after"]) >= context:
+            pending = [elem for elem in pending if len(elem["after"]) < context]
+
+        if is_vm_separator(line):
+            vm = int(line[3:-1]) if line[3:-1].isdigit() else line[3:-1]
+        if text in line:
+            total += 1
+            vm_hits[vm] = vm_hits.get(vm, 0) + 1
+            if len(matches) < max_matches:
+                elem = {"line": n, "vm": vm, "text": line, "before": list(before), "after": []}
+                matches.append(elem)
+                if context:
+                    pending.append(elem)
+        before.append(line)
+
+    return {"matches": matches, "total": total, "truncated": total > len(matches),
+            "vms": [{"vm": vm, "hits": hits} for vm, hits in vm_hits.items()]}
+
+
+class LogIndex:
+    """Index of the lines and the VM separators of a log.
+
+    The index does not hold the log, so it can be reused with the log
+    fetched again from the IM while its contents do not change.
+    """
+
+    def __init__(self, log):
+        """Creator function."""
+        lines = log.split("\n")
+        self.num_lines = len(lines)
+        self.size = len(log)
+        # Position of the end of each line (without the new line)
+        self._ends = array("q", (end + n for n, end in enumerate(accumulate(map(len, lines)))))
+        self.vm_lines = [n for n, line in enumerate(lines) if line.startswith("VM ") and is_vm_separator(line)]
+
+    def offset(self, line):
+        """Position in the log of the start of a line."""
+        if line <= 0:
+            return 0
+        if line >= self.num_lines:
+            return self.size
+        return self._ends[line - 1] + 1
+
+    def lines(self, log, start, end):
+        """Get the lines [start, end) of the log."""
+        if start >= end:
+            return []
+        return log[self.offset(start):self._ends[min(end, self.num_lines) - 1]].split("\n")
+
+    def vms_before(self, line):
+        """Number of VM separators before a line."""
+        return bisect.bisect_left(self.vm_lines, line)
+
+    def page(self, count, start=None, vm=None):
+        """Get the range of lines [start, end) of a page of count lines.
+
+        The page starts at the line start, at the separator of the VM
+        number vm or, by default, it is the tail of the log.
+        """
+        if vm is not None and 0 <= vm < len(self.vm_lines):
+            start = self.vm_lines[vm]
+        elif start is None:
+            start = self.num_lines - count
+        start = min(max(start, 0), self.num_lines)
+        return start, min(start + count, self.num_lines)
+
+    def render(self, log, start, end, separators=True):
+        """Render the lines [start, end) of the log in HTML."""
+        # The line after the page is needed to know if a last fatal error was ignored
+        next_line = "".join(self.lines(log, end, end + 1))
+        html, _ = render_lines(self.lines(log, start, end), separators, self.vms_before(start), next_line)
+        return html
+
+
+class LogIndexes:
+    """Memoized indexes of the logs by content hash, so each log is indexed once."""
+
+    def __init__(self, max_logs=16):
+        """Creator function."""
+        self.max_logs = max_logs
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, log):
+        key = hashlib.sha256(log.encode("utf-8", errors="replace")).hexdigest()
+        with self._lock:
+            if key in self._indexes:
+                self._indexes.move_to_end(key)
+                return self._indexes[key]
+
+        index = LogIndex(log)
+
+        with self._lock:
+            self._indexes[key] = index
+            while len(self._indexes) > self.max_logs:
+                self._indexes.popitem(last=False)
+        return index
+
+
+class LogTail:
+    """Incremental rendering of a growing log: only the lines added since the last update are rendered.
+
+    Only complete lines are rendered until the log is final, and a last "fatal"
+    line is held back until the next one is available, as it may be followed by
+    "...ignoring". If the offset is in the middle of a line (a page rendered an
+    incomplete last line), the log is reset once that line is completed.
+    """
+
+    def __init__(self, offset=0, vms=0, separators=True):
+        """Creator function."""
+        self.offset = offset
+        self.vms = vms
+        self.separators = separators
+
+    def update(self, log, final=False):
+        """Get the HTML of the new lines of the log, or None if the log has been truncated (e.g. reconfigured).
+
+        If final is set, the last line is rendered even if it is not complete.
+        """
+        if len(log) < self.offset:
+            self.offset = self.vms = 0
+            return None
+        if 0 < self.offset < len(log) and log[self.offset - 1] != "\n":
+            if log.find("\n", self.offset) == -1 and not final:
+                return Markup("")
+            # The rest of the line can not be appended to the one already rendered
+            self.offset = self.vms = 0
+            return None
+
+        end = log.rfind("\n", self.offset)
+        if final and len(log) > self.offset and not log.endswith("\n"):
+            end = len(log)
+        if end < self.offset:
+            return Markup("")
+        lines = log[self.offset:end].split("\n")
+        if not final and "fatal: " in lines[-1]:
+            end -= len(lines.pop()) + 1
+            if not lines:
+                return Markup("")
+
+        html, vms = render_lines(lines, self.separators, self.vms)
+        self.offset = min(end + 1, len(log))
+        self.vms += vms
+        return html
+
+
+class LogFollowers:
+    """Number of logs followed by each user, limited by user and in total."""
+
+    def __init__(self, max_user=2, max_total=20):
+        """Creator function."""
+        self.max_user = max_user
+        self.max_total = max_total
+        self._users = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, user):
+        """Register a new follower of the user, returns False if a limit has been reached."""
+        with self._lock:
+            if self._users.get(user, 0) >= self.max_user or sum(self._users.values()) >= self.max_total:
+                return False
+            self._users[user] = self._users.get(user, 0) + 1
+            return True
+
+    def release(self, user):
+        with self._lock:
+            self._users[user] -= 1
+            if not self._users[user]:
+                del self._users[user]
+
+
+class LogCache:
+    """Compressed on disk cache of the logs of the infrastructures that have finished their configuration.
+
+    The logs are stored by (user, infid, vmid, log version), so a new version of
+    the log of an infrastructure is not served from the cache. The total size
+    is limited to max_size bytes, evicting the least recently used logs.
+    """
+
+    SUFFIX = ".log.gz"
+
+    def __init__(self, directory, max_size=1073741824):
+        """Creator function."""
+        self.directory = directory
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def _prefix(infid):
+        return hashlib.sha256(str(infid).encode("utf-8")).hexdigest()[:16]
+
+    def path(self, key):
+        """Path of the file of a key (user, infid, vmid, version)."""
+        key_hash = hashlib.sha256(json.dumps(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, "%s_%s%s" % (self._prefix(key[1]), key_hash, self.SUFFIX))
+
+    def get_path(self, key):
+        """Get the path of the compressed log of a key, or None if it is not cached."""
+        path = self.path(key)
+        try:
+            # Update the access time used to evict the least recently used logs
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def get(self, key):
+        """Get the log of a key, or None if it is not cached."""
+        log_file = self.open(key)
+        if log_file is None:
+            return None
+        try:
+            with log_file:
+                return log_file.read()
+        except (OSError, EOFError):
+            return None
+
+    def open(self, key):
+        """Open the log of a key as a text file, or return None if it is not cached."""
+        path = self.get_path(key)
+        if path is None:
+            return None
+        try:
+            return gzip.open(path, "rt", encoding="utf-8", newline="\n")
+        except OSError:
+            return None
+
+    def put(self, key, log):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                with gzip.GzipFile(fileobj=tmp_file, mode="wb", mtime=0) as gz_file:
+                    gz_file.write(log.encode("utf-8"))
+            os.replace(tmp_path, self.path(key))
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+        self._evict()
+
+    def invalidate(self, infid):
+        """Remove all the logs of an infrastructure."""
+        prefix = self._prefix(infid) + "_"
+        for name in os.listdir(self.directory):
+            if name.startswith(prefix):
+                try:
+                    os.unlink(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def _evict(self):
+        with self._lock:
+            files = []
+            total = 0
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(self.SUFFIX):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+            files.sort()
+            for _, size, path in files:
+                if total <= self.max_size:
+                    break
+                try:
+                    os.unlink(path)
+                    total -= size
+                except OSError:
+                    pass
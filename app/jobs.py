@@ -0,0 +1,117 @@
+#
+# IM - Infrastructure Manager Dashboard
+# Copyright (C) 2020 - GRyCAP - Universitat Politecnica de Valencia
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""Class to run the bulk operations over several infrastructures in background."""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# States of the items of a job
+PENDING = "pending"
+RUNNING = "running"
+SUCCESS = "success"
+ERROR = "error"
+
+
+class JobTracker:
+    """Run the bulk operations of the users in a bounded pool of threads and track their progress.
+
+    Each job applies an operation to a list of items (e.g. infrastructure IDs).
+    The number of items processed at the same time is limited by the number of
+    workers, and the ones sent to the same IM by per_im_limit. Each user can
+    have max_user_jobs jobs not finished (and all the users max_jobs). The
+    finished jobs are kept ttl seconds (and at most max_jobs jobs).
+    """
+
+    def __init__(self, workers=10, per_im_limit=5, max_jobs=1000, ttl=3600, max_user_jobs=2):
+        """Creator function."""
+        self.per_im_limit = per_im_limit
+        self.max_jobs = max_jobs
+        self.max_user_jobs = max_user_jobs
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(workers)
+        self._jobs = OrderedDict()
+        self._im_limits = {}
+        self._lock = threading.Lock()
+
+    def _im_limit(self, im_url):
+        with self._lock:
+            if im_url not in self._im_limits:
+                self._im_limits[im_url] = threading.BoundedSemaphore(self.per_im_limit)
+            return self._im_limits[im_url]
+
+    def submit(self, user, op, items, func, im_url=None):
+        """Queue the operation op of a user over a list of items and return the job ID.
+
+        func(item) is called for each item: it returns a message or raises an
+        exception if the operation fails. None is returned if the user, or all
+        the users, have too many jobs not finished.
+        """
+        job_id = str(uuid.uuid4())
+        job = {"id": job_id, "user": user, "op": op, "done": 0, "finished": None,
+               "items": OrderedDict((item, {"state": PENDING, "message": ""}) for item in items)}
+        if not job["items"]:
+            job["finished"] = time.time()
+        with self._lock:
+            self._purge()
+            running = [other["user"] for other in self._jobs.values() if not other["finished"]]
+            if running.count(user) >= self.max_user_jobs or len(running) >= self.max_jobs:
+                return None
+            self._jobs[job_id] = job
+        for item in job["items"]:
+            self._executor.submit(self._run, job, item, func, im_url)
+        return job_id
+
+    def _run(self, job, item, func, im_url):
+        result = job["items"][item]
+        with self._im_limit(im_url):
+            with self._lock:
+                result["state"] = RUNNING
+            try:
+                state, message = SUCCESS, func(item)
+            except Exception as ex:
+                state, message = ERROR, str(ex)
+        with self._lock:
+            result["state"] = state
+            result["message"] = message or ""
+            job["done"] += 1
+            if job["done"] == len(job["items"]):
+                job["finished"] = time.time()
+
+    def _purge(self):
+        # Remove the expired jobs and the oldest finished ones to make room for a new one
+        now = time.time()
+        finished = [job_id for job_id, job in self._jobs.items() if job["finished"]]
+        for job_id in finished:
+            if now - self._jobs[job_id]["finished"] > self.ttl or len(self._jobs) >= self.max_jobs:
+                del self._jobs[job_id]
+
+    def get(self, job_id, user):
+        """Get the progress of a job of the user, or None if it does not exist."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["user"] != user:
+                return None
+            return {"id": job["id"], "op": job["op"], "total": len(job["items"]), "done": job["done"],
+                    "finished": job["finished"] is not None,
+                    "results": [dict(result, id=item) for item, result in job["items"].items()]}
@@ -0,0 +1,73 @@
+#
+# IM - Infrastructure Manager Dashboard
+# Copyright (C) 2020 - GRyCAP - Universitat Politecnica de Valencia
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""Metrics of the dashboard exposed in /metrics in the Prometheus text format."""
+
+import threading
+from collections import OrderedDict
+
+# Metrics reported of each cache: (name, field of the snapshot, type, help)
+CACHE_METRICS = [("cache_hits_total", "hits", "counter", "Number of hits of the cache."),
+                 ("cache_misses_total", "misses", "counter", "Number of misses of the cache."),
+                 ("cache_hit_rate", "hit_rate", "gauge", "Ratio of hits of the cache."),
+                 ("cache_size", "size", "gauge", "Number of elements in the cache.")]
+
+
+class Metrics:
+    """Registry of the caches of the dashboard whose hit rates are reported.
+
+    The caches must have hits and misses counters, and their size is also
+    reported if they implement len().
+    """
+
+    def __init__(self, prefix="im_dashboard"):
+        """Creator function."""
+        self.prefix = prefix
+        self._caches = OrderedDict()
+        self._lock = threading.Lock()
+
+    def register_cache(self, name, cache):
+        with self._lock:
+            self._caches[name] = cache
+
+    def snapshot(self):
+        """Get the hits, misses, hit rate and size (or None) of the registered caches."""
+        with self._lock:
+            caches = list(self._caches.items())
+        res = OrderedDict()
+        for name, cache in caches:
+            hits, misses = cache.hits, cache.misses
+            res[name] = {"hits": hits, "misses": misses,
+                         "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+                         "size": len(cache) if hasattr(cache, "__len__") else None}
+        return res
+
+    def render(self):
+        """Render the metrics in the Prometheus text format."""
+        caches = self.snapshot()
+        lines = []
+        for metric, field, metric_type, help_text in CACHE_METRICS:
+            name = "%s_%s" % (self.prefix, metric)
+            lines.append("# HELP %s %s" % (name, help_text))
+            lines.append("# TYPE %s %s" % (name, metric_type))
+            for cache, values in caches.items():
+                if values[field] is not None:
+                    lines.append('%s{cache="%s"} %s' % (name, cache, values[field]))
+        return "\n".join(lines) + "\n"
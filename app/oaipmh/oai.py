@@ -21,14 +21,19 @@
 from lxml import etree  # nosec
 from datetime import datetime, timezone
 from app.oaipmh.errors import Errors
+from app.oaipmh.resumption import encode_token, decode_token
+from app.oaipmh.records import RecordStore
 
 
 class OAI():
 
+    CHUNK_SIZE = 65536
+
     def __init__(self, repo_name, repo_base_url, repo_description,
                  repo_identifier_base_url="https://github.com/grycap/tosca/blob/main/templates/",
                  earliest_datestamp="2000-01-01", datestamp_granularity="YYYY-MM-DD",
-                 repo_admin_email="admin@localhost", ):
+                 repo_admin_email="admin@localhost", page_size=100, token_secret="", version=None,
+                 stream=False):
         self.repository_name = repo_name
         self.repository_base_url = repo_base_url
         self.repository_description = repo_description
@@ -38,6 +43,14 @@ class OAI():
         self.repository_deleted_records = "no"
         self.repository_protocol_version = "2.0"
         self.repository_indentifier_base_url = repo_identifier_base_url
+        # Number of records returned in each ListRecords/ListIdentifiers response
+        self.page_size = page_size
+        # Key used to sign the resumption tokens
+        self.token_secret = token_secret
+        # Version of the records list, the tokens of other versions are not valid
+        self.version = version
+        # Return the responses as generators of text chunks
+        self.stream = stream
 
         self.valid_metadata_formats = ['oai_dc', 'oai_openaire']
 
@@ -74,7 +87,7 @@ class OAI():
 
         return root
 
-    def getRecord(self, root, metadata_dict, verb, identifier, metadata_prefix):
+    def getRecord(self, root, metadata_dict, verb, identifier, metadata_prefix, records=None):
         self.addRequestElement(root, verb=verb, identifier=identifier, metadata_prefix=metadata_prefix)
 
         if not identifier or not metadata_prefix:
@@ -87,44 +100,14 @@ class OAI():
             root.append(error_element)
             return etree.tostring(root, pretty_print=True, encoding='unicode')
 
-        identifier = identifier
-        if 'templates/' in identifier:
-            name_identifier = identifier.split('templates/')[1]
-        else:
+        records = records or RecordStore(self, metadata_dict)
+        record_name = records.recordName(identifier)
+        if record_name is None:
             error_element = Errors.idDoesNotExist()
             root.append(error_element)
             return etree.tostring(root, pretty_print=True, encoding='unicode')
 
-        if name_identifier not in metadata_dict:
-            error_element = Errors.idDoesNotExist()
-            root.append(error_element)
-            return etree.tostring(root, pretty_print=True, encoding='unicode')
-
-        record_data = self.recordByIdentifier(metadata_dict, identifier)
-
-        get_record_element = etree.SubElement(root, 'GetRecord')
-        record = etree.SubElement(get_record_element, 'record')
-
-        header = etree.SubElement(record, 'header')
-
-        identifier_element = etree.SubElement(header, 'identifier')
-        identifier_element.text = identifier
-        datestamp_element = etree.SubElement(header, 'datestamp')
-        datestamp_element.text = self.earliest_datestamp
-        if record_data.get('creation_date'):
-            datestamp_element.text = record_data.get('creation_date').strftime("%Y-%m-%d")
-
-        metadata_element = etree.SubElement(record, 'metadata')
-
-        if metadata_prefix == 'oai_dc':
-            metadata_xml = self.mapDC(record_data)
-
-        if metadata_prefix == 'oai_openaire':
-            metadata_xml = self.mapOAIRE(record_data)
-
-        metadata_element.append(metadata_xml)
-
-        return etree.tostring(root, pretty_print=True, encoding='unicode')
+        return self.envelope(root, 'GetRecord', [records.record(record_name, metadata_prefix)])
 
     def identify(self, root, verb):
         self.addRequestElement(root, verb)
@@ -133,94 +116,148 @@ class OAI():
 
         return etree.tostring(root, pretty_print=True, encoding='unicode')
 
-    def filterIdentifiers(self, metadata_dict, from_date, until_date):
-        if from_date is not None:
-            from_date_dt = self.isValidDate(from_date)
-        if until_date is not None:
-            until_date_dt = self.isValidDate(until_date)
-
-        # Filter identifiers based on the date range specified by from_date and until_date
-        filtered_identifiers = list(metadata_dict.keys())
+    def listPage(self, root, records, metadata_prefix, from_date, until_date, set_spec, resumption_token):
+        """Get the identifiers of the page to return and the resumptionToken element (None if not needed).
 
-        if from_date is not None or until_date is not None:
-            filtered_identifiers = []
-            for record_identifier, record_data in metadata_dict.items():
-                if record_data.get("creation_date"):
-                    record_date = datetime.combine(record_data.get("creation_date"), datetime.min.time())
-                else:
-                    # Convert the date string to a datetime object
-                    record_date = datetime.strptime(self.earliest_datestamp, "%Y-%m-%d")
+        In case of error it is added to the root element and None is returned.
+        """
+        cursor = 0
+        if resumption_token is not None:
+            # The resumptionToken is an exclusive argument
+            if metadata_prefix or from_date or until_date or set_spec:
+                root.append(Errors.badArgument())
+                return None
+            state = decode_token(resumption_token, self.token_secret)
+            if not state or state.get("v") != self.version or not isinstance(state.get("c"), int):
+                root.append(Errors.badResumptionToken())
+                return None
+            metadata_prefix = state.get("p")
+            from_date = state.get("f")
+            until_date = state.get("u")
+            set_spec = state.get("s")
+            cursor = state["c"]
+
+        if set_spec is not None and not records.set_names:
+            root.append(Errors.noSetHierarchy())
+            return None
 
-                if (from_date is None or record_date >= from_date_dt) and \
-                        (until_date is None or record_date <= until_date_dt):
-                    filtered_identifiers.append(record_identifier)
+        # Check the validity of "from" and "until" parameters
+        from_date_dt = from_date and self.isValidDate(from_date)
+        until_date_dt = until_date and self.isValidDate(until_date)
 
-        return filtered_identifiers
+        if not metadata_prefix or (from_date is not None and not from_date_dt) or \
+                (until_date is not None and not until_date_dt):
+            root.append(Errors.badArgument())
+            return None
 
-    def listIdentifiers(self, root, metadata_dict, verb, metadata_prefix, from_date=None,
-                        until_date=None, set_spec=None, resumption_token=None):
-        self.addRequestElement(root, verb, metadata_prefix=metadata_prefix, from_date=from_date,
-                               until_date=until_date, set_spec=None, resumption_token=resumption_token)
+        if not self.validMetadataPrefix(metadata_prefix):
+            root.append(Errors.cannotDisseminateFormat())
+            return None
 
-        if resumption_token is not None:
-            error_element = Errors.badResumptionToken()
-            root.append(error_element)
-            return etree.tostring(root, pretty_print=True, encoding='unicode')
+        if set_spec is not None and not records.hasSet(set_spec):
+            root.append(Errors.noRecordsMatch())
+            return None
 
-        if set_spec is not None:
-            error_element = Errors.noSetHierarchy()
-            root.append(error_element)
-            return etree.tostring(root, pretty_print=True, encoding='unicode')
+        start, end = records.dateRange(from_date_dt, until_date_dt, set_spec)
+        complete_list_size = end - start
 
-        # Check the validity of "from" and "until" parameters
-        valid_from_date = from_date is None or self.isValidDate(from_date)
-        valid_until_date = until_date is None or self.isValidDate(until_date)
+        if not complete_list_size:
+            root.append(Errors.noRecordsMatch())
+            return None
 
-        if not metadata_prefix or not valid_from_date or not valid_until_date:
-            error_element = Errors.badArgument()
-            root.append(error_element)
-            return etree.tostring(root, pretty_print=True, encoding='unicode')
+        if cursor < 0 or cursor >= complete_list_size:
+            root.append(Errors.badResumptionToken())
+            return None
 
-        if not self.validMetadataPrefix(metadata_prefix):
-            error_element = Errors.cannotDisseminateFormat()
-            root.append(error_element)
-            return etree.tostring(root, pretty_print=True, encoding='unicode')
+        page = records.names(start + cursor, min(start + cursor + self.page_size, end), set_spec)
+
+        token_element = None
+        if resumption_token is not None or complete_list_size > len(page):
+            token_element = etree.Element('resumptionToken', completeListSize=str(complete_list_size),
+                                          cursor=str(cursor))
+            next_cursor = cursor + len(page)
+            if next_cursor < complete_list_size:
+                state = {"p": metadata_prefix, "f": from_date, "u": until_date, "s": set_spec,
+                         "c": next_cursor, "v": self.version}
+                token_element.text = encode_token(state, self.token_secret)
+
+        return metadata_prefix, page, token_element
+
+    def recordHeader(self, metadata_dict, record_name, set_specs=None):
+        header_element = etree.Element('header')
+        identifier_element = etree.SubElement(header_element, 'identifier')
+        identifier_element.text = f'{self.repository_indentifier_base_url}{record_name}'
+        datestamp_element = etree.SubElement(header_element, 'datestamp')
+        datestamp_element.text = self.earliest_datestamp
+        if metadata_dict[record_name].get('creation_date'):
+            datestamp_element.text = metadata_dict[record_name].get('creation_date').strftime("%Y-%m-%d")
+        for set_spec in set_specs or []:
+            set_spec_element = etree.SubElement(header_element, 'setSpec')
+            set_spec_element.text = set_spec
+        return header_element
+
+    def recordElement(self, metadata_dict, record_name, metadata_prefix, set_specs=None):
+        record_element = etree.Element('record')
+        record_element.append(self.recordHeader(metadata_dict, record_name, set_specs))
+        metadata_element = etree.SubElement(record_element, 'metadata')
 
-        filtered_identifiers = self.filterIdentifiers(metadata_dict, from_date, until_date)
+        if metadata_prefix == 'oai_dc':
+            metadata_xml = self.mapDC(metadata_dict[record_name])
 
-        # Create the ListIdentifiers element
-        list_identifiers_element = etree.Element('ListIdentifiers')
+        if metadata_prefix == 'oai_openaire':
+            metadata_xml = self.mapOAIRE(metadata_dict[record_name])
 
-        if not metadata_dict or filtered_identifiers == []:
-            # If the metadata_dict is empty, add a noRecordsMatch error
-            error_element = Errors.noRecordsMatch()
-            root.append(error_element)
-            return etree.tostring(root, pretty_print=True, encoding='unicode')
-        else:
-            for record_identifier in filtered_identifiers:
-                header_element = etree.Element('header')
-                identifier_element = etree.Element('identifier')
-                identifier_element.text = f'{self.repository_indentifier_base_url}{record_identifier}'
-                datestamp_element = etree.Element('datestamp')
-                datestamp_element.text = self.earliest_datestamp
-                if metadata_dict[record_identifier].get('creation_date'):
-                    datestamp_element.text = metadata_dict[record_identifier].get('creation_date').strftime("%Y-%m-%d")
+        # Append the generated XML to the metadata element
+        metadata_element.append(metadata_xml)
+        return record_element
+
+    def iterEnvelope(self, root, element_name, fragments, token_element=None):
+        """Generate the response adding an element_name element with the serialized fragments.
+
+        The fragments are consumed lazily and yielded in chunks of about CHUNK_SIZE characters.
+        """
+        response = etree.tostring(root, pretty_print=True, encoding='unicode')
+        yield response[:response.rindex('</OAI-PMH>')] + '<%s>\n' % element_name
+        chunk = []
+        size = 0
+        for fragment in fragments:
+            chunk.append(fragment)
+            size += len(fragment)
+            if size >= self.CHUNK_SIZE:
+                yield ''.join(chunk)
+                chunk = []
+                size = 0
+        if token_element is not None:
+            chunk.append(etree.tostring(token_element, pretty_print=True, encoding='unicode'))
+        chunk.append('</%s>\n</OAI-PMH>\n' % element_name)
+        yield ''.join(chunk)
+
+    def envelope(self, root, element_name, fragments, token_element=None):
+        """Serialize the response, or get a generator of it in stream mode."""
+        response = self.iterEnvelope(root, element_name, fragments, token_element)
+        if self.stream:
+            return response
+        return ''.join(response)
 
-                header_element.append(identifier_element)
-                header_element.append(datestamp_element)
-                list_identifiers_element.append(header_element)
+    def listIdentifiers(self, root, metadata_dict, verb, metadata_prefix, from_date=None,
+                        until_date=None, set_spec=None, resumption_token=None, records=None):
+        self.addRequestElement(root, verb, metadata_prefix=metadata_prefix, from_date=from_date,
+                               until_date=until_date, set_spec=set_spec, resumption_token=resumption_token)
 
-        root.append(list_identifiers_element)
+        records = records or RecordStore(self, metadata_dict)
+        res = self.listPage(root, records, metadata_prefix, from_date, until_date, set_spec, resumption_token)
+        if res is None:
+            return etree.tostring(root, pretty_print=True, encoding='unicode')
+        _, page, token_element = res
 
-        return etree.tostring(root, pretty_print=True, encoding='unicode')
+        return self.envelope(root, 'ListIdentifiers', (records.header(name) for name in page), token_element)
 
-    def listMetadataFormats(self, root, metadata_dict, verb, identifier=None):
+    def listMetadataFormats(self, root, metadata_dict, verb, identifier=None, records=None):
         self.addRequestElement(root, verb, identifier=identifier)
 
         if identifier:
-            record_data = self.recordByIdentifier(metadata_dict, identifier)
-
-            if record_data is None:
+            records = records or RecordStore(self, metadata_dict)
+            if records.recordName(identifier) is None:
                 error_element = Errors.idDoesNotExist()
                 root.append(error_element)
 
@@ -239,82 +276,41 @@ class OAI():
         return etree.tostring(root, pretty_print=True, encoding='unicode')
 
     def listRecords(self, root, metadata_dict, verb, metadata_prefix, from_date=None,
-                    until_date=None, set_spec=None, resumption_token=None):
+                    until_date=None, set_spec=None, resumption_token=None, records=None):
         self.addRequestElement(root, verb, metadata_prefix=metadata_prefix, from_date=from_date,
                                until_date=until_date, set_spec=set_spec, resumption_token=resumption_token)
 
-        if resumption_token is not None:
-            error_element = Errors.badResumptionToken()
-            root.append(error_element)
-            return etree.tostring(root, pretty_print=True, encoding='unicode')
-
-        if set_spec is not None:
-            error_element = Errors.noSetHierarchy()
-            root.append(error_element)
+        records = records or RecordStore(self, metadata_dict)
+        res = self.listPage(root, records, metadata_prefix, from_date, until_date, set_spec, resumption_token)
+        if res is None:
             return etree.tostring(root, pretty_print=True, encoding='unicode')
+        metadata_prefix, page, token_element = res
 
-        # Check the validity of "from" and "until" parameters
-        valid_from_date = from_date is None or self.isValidDate(from_date)
-        valid_until_date = until_date is None or self.isValidDate(until_date)
+        return self.envelope(root, 'ListRecords', (records.record(name, metadata_prefix) for name in page),
+                             token_element)
 
-        if not metadata_prefix or not valid_from_date or not valid_until_date:
-            error_element = Errors.badArgument()
-            root.append(error_element)
-            return etree.tostring(root, pretty_print=True, encoding='unicode')
+    def listSets(self, root, metadata_dict, verb, resumption_token=None, records=None):
+        self.addRequestElement(root, verb, resumption_token=resumption_token)
 
-        if not self.validMetadataPrefix(metadata_prefix):
-            error_element = Errors.cannotDisseminateFormat()
+        # All the sets are returned in the first response
+        if resumption_token is not None:
+            error_element = Errors.badResumptionToken()
             root.append(error_element)
             return etree.tostring(root, pretty_print=True, encoding='unicode')
 
-        filtered_identifiers = self.filterIdentifiers(metadata_dict, from_date, until_date)
-
-        list_records_element = etree.Element('ListRecords')
-
-        if not metadata_dict or filtered_identifiers == []:
-            # If the metadata_dict dictionary is empty
-            error_element = Errors.noRecordsMatch()
+        records = records or RecordStore(self, metadata_dict)
+        if not records.set_names:
+            error_element = Errors.noSetHierarchy()
             root.append(error_element)
             return etree.tostring(root, pretty_print=True, encoding='unicode')
-        else:
-            for record_name in filtered_identifiers:
-                record_element = etree.Element('record')
-
-                header_element = etree.Element('header')
-                identifier_element = etree.Element('identifier')
-                identifier_element.text = f'{self.repository_indentifier_base_url}{record_name}'
-                datestamp_element = etree.Element('datestamp')
-                datestamp_element.text = 'datestamp'
-                if metadata_dict[record_name].get('creation_date'):
-                    datestamp_element.text = metadata_dict[record_name].get('creation_date').strftime("%Y-%m-%d")
-
-                metadata_element = etree.Element('metadata')
-
-                if metadata_prefix == 'oai_dc':
-                    metadata_xml = self.mapDC(metadata_dict[record_name])
-
-                if metadata_prefix == 'oai_openaire':
-                    metadata_xml = self.mapOAIRE(metadata_dict[record_name])
-
-                # Append the generated XML to the metadata element
-                metadata_element.append(metadata_xml)
-
-                header_element.append(identifier_element)
-                header_element.append(datestamp_element)
-                record_element.append(header_element)
-                record_element.append(metadata_element)
 
-                list_records_element.append(record_element)
-
-        root.append(list_records_element)
-
-        return etree.tostring(root, pretty_print=True, encoding='unicode')
-
-    def listSets(self, root, verb, set_spec=False, resumption_token=None):
-        self.addRequestElement(root, verb)
-
-        error_element = Errors.noSetHierarchy()
-        root.append(error_element)
+        list_sets_element = etree.SubElement(root, 'ListSets')
+        for set_spec, set_name in sorted(records.set_names.items()):
+            set_element = etree.SubElement(list_sets_element, 'set')
+            set_spec_element = etree.SubElement(set_element, 'setSpec')
+            set_spec_element.text = set_spec
+            set_name_element = etree.SubElement(set_element, 'setName')
+            set_name_element.text = set_name
 
         return etree.tostring(root, pretty_print=True, encoding='unicode')
 
@@ -385,11 +381,11 @@ class OAI():
         if metadata_prefix in self.valid_metadata_formats:
             return True
 
-    def recordByIdentifier(self, metadata_dict, identifier):
-        for record_name, record_metadata in metadata_dict.items():
-            if f'{self.repository_indentifier_base_url}{record_name}' == identifier:
-                return record_metadata
-        return None
+    def recordDate(self, record_data):
+        """Get the datestamp of a record as a datetime."""
+        if record_data.get('creation_date'):
+            return datetime.combine(record_data.get('creation_date'), datetime.min.time())
+        return datetime.strptime(self.earliest_datestamp, "%Y-%m-%d")
 
     def isValidDate(self, date_str):
         try:
@@ -558,7 +554,21 @@ class OAI():
         error_element = error_type
         root.append(error_element)
 
-    def processRequest(self, request, metadata_dict):
+    def processRequest(self, request, metadata_dict=None, records=None):
+        """Process an OAI-PMH request using the serialized records of the RecordStore, if provided.
+
+        In stream mode it always returns an iterable of text chunks.
+        """
+        response = self._processRequest(request, metadata_dict, records)
+        if self.stream and isinstance(response, str):
+            return [response]
+        return response
+
+    def _processRequest(self, request, metadata_dict=None, records=None):
+        if records is not None:
+            metadata_dict = records.metadata_dict
+        else:
+            records = RecordStore(self, metadata_dict)
         root = self.baseXMLTree()
 
         attributes_dict = {
@@ -606,7 +616,7 @@ class OAI():
         # Create a dictionary mapping verbs to functions
         verb_handlers = {
             "GetRecord": lambda metadata_dict = metadata_dict: self.getRecord(
-                root, metadata_dict, verb, identifier, metadata_prefix
+                root, metadata_dict, verb, identifier, metadata_prefix, records
             ),
             "Identify": lambda: self.identify(root, verb),
             "ListIdentifiers": lambda metadata_dict = metadata_dict: self.listIdentifiers(
@@ -618,6 +628,7 @@ class OAI():
                 until_date,
                 set_spec,
                 resumption_token,
+                records,
             ),
             "ListRecords": lambda metadata_dict = metadata_dict: self.listRecords(
                 root,
@@ -628,11 +639,14 @@ class OAI():
                 until_date,
                 set_spec,
                 resumption_token,
+                records,
             ),
             "ListMetadataFormats": lambda metadata_dict = metadata_dict: self.listMetadataFormats(
-                root, metadata_dict, verb, identifier
+                root, metadata_dict, verb, identifier, records
+            ),
+            "ListSets": lambda metadata_dict = metadata_dict: self.listSets(
+                root, metadata_dict, verb, resumption_token, records
             ),
-            "ListSets": lambda: self.listSets(root, verb, resumption_token),
         }
 
         # Get the handler function for the specified verb
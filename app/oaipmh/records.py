@@ -0,0 +1,192 @@
+#
+# IM - Infrastructure Manager Dashboard
+# Copyright (C) 2023 - GRyCAP - Universitat Politecnica de Valencia
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""Serialized OAI-PMH records of the TOSCA templates catalog."""
+
+import re
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+from lxml import etree  # nosec
+
+SET_SPEC_INVALID_RE = re.compile(r"[^A-Za-z0-9\-_.!~*'()]")
+SET_NAMES = {"tag": "Templates by tag", "vo": "Templates by VO", "family": "Template families"}
+
+
+def setSpecValue(value):
+    """Get a value usable in a setSpec replacing the not allowed chars."""
+    return SET_SPEC_INVALID_RE.sub("_", str(value))
+
+
+def _as_list(value):
+    if not value:
+        return []
+    if isinstance(value, (list, tuple, set)):
+        return [elem for elem in value if elem]
+    return [value]
+
+
+def recordSets(metadata_dict):
+    """Get the setSpecs of each record and the names of all the sets.
+
+    The sets are derived from the templates metadata: tags (tag:<tag>),
+    VOs (vo:<vo>) and families of a parent template and its childs
+    (family:<parent>). Each top level set (tag, vo, family) includes the
+    records of all its subsets.
+    """
+    record_sets = OrderedDict((name, set()) for name in metadata_dict)
+    set_names = {}
+    # parent -> templates declaring it in their parents metadata
+    parent_childs = {}
+    for name, record_data in metadata_dict.items():
+        for parent in _as_list(record_data.get("parents")):
+            parent_childs.setdefault(parent, []).append(name)
+
+    for name, record_data in metadata_dict.items():
+        for tag in _as_list(record_data.get("tag")):
+            spec = "tag:%s" % setSpecValue(tag)
+            record_sets[name].add(spec)
+            set_names[spec] = "Tag %s" % tag
+        for vo in _as_list(record_data.get("vos")):
+            spec = "vo:%s" % setSpecValue(vo)
+            record_sets[name].add(spec)
+            set_names[spec] = "VO %s" % vo
+
+        family = [child for child in _as_list(record_data.get("childs")) if child in metadata_dict]
+        family.extend(parent_childs.get(name, []))
+        if family:
+            spec = "family:%s" % setSpecValue(name)
+            set_names[spec] = "Family of %s" % (record_data.get("display_name") or
+                                                record_data.get("template_name") or name)
+            for member in [name] + family:
+                record_sets[member].add(spec)
+
+    for specs in record_sets.values():
+        specs.update([spec.split(":")[0] for spec in specs])
+    for spec, set_name in SET_NAMES.items():
+        if any(spec in specs for specs in record_sets.values()):
+            set_names[spec] = set_name
+
+    return {name: sorted(specs) for name, specs in record_sets.items()}, set_names
+
+
+class RecordStore:
+    """Serialized OAI-PMH record fragments of a version of the catalog.
+
+    Every record is mapped and serialized only the first time it is
+    requested, and the fragment is reused to assemble the next responses.
+    The records are indexed by full identifier and sorted by datestamp,
+    globally and for each set.
+    """
+
+    def __init__(self, oai, metadata_dict):
+        """Creator function."""
+        self.oai = oai
+        self.metadata_dict = metadata_dict
+        self._headers = {}
+        self._records = {}
+        self._lock = threading.Lock()
+
+        # record name -> list of setSpecs, setSpec -> setName
+        self.record_sets, self.set_names = recordSets(metadata_dict)
+
+        # full identifier -> record name
+        self._identifiers = {}
+        dated = []
+        for pos, (name, record_data) in enumerate(metadata_dict.items()):
+            self._identifiers[f'{oai.repository_indentifier_base_url}{name}'] = name
+            dated.append((oai.recordDate(record_data), pos, name))
+        dated.sort()
+
+        # setSpec (None for all the records) -> (datestamps, names) sorted by datestamp (and catalog order)
+        self._lists = {None: ([], [])}
+        for spec in self.set_names:
+            self._lists[spec] = ([], [])
+        for date, _, name in dated:
+            for spec in [None] + self.record_sets[name]:
+                self._lists[spec][0].append(date)
+                self._lists[spec][1].append(name)
+
+    def recordName(self, identifier):
+        """Get the name of the record with a full identifier or None."""
+        return self._identifiers.get(identifier)
+
+    def hasSet(self, set_spec):
+        return set_spec in self._lists
+
+    def dateRange(self, from_date=None, until_date=None, set_spec=None):
+        """Get the (start, end) positions of the records of a set with datestamp between from_date and until_date."""
+        dates = self._lists[set_spec][0]
+        start = 0 if from_date is None else bisect_left(dates, from_date)
+        end = len(dates) if until_date is None else bisect_right(dates, until_date)
+        return start, max(start, end)
+
+    def names(self, start, end, set_spec=None):
+        """Get the names of the records of a set between two positions of the datestamp order."""
+        return self._lists[set_spec][1][start:end]
+
+    def _serialize(self, element):
+        return etree.tostring(element, pretty_print=True, encoding='unicode')
+
+    def header(self, name):
+        """Get the serialized header element of a record."""
+        fragment = self._headers.get(name)
+        if fragment is None:
+            fragment = self._serialize(self.oai.recordHeader(self.metadata_dict, name, self.record_sets[name]))
+            with self._lock:
+                self._headers[name] = fragment
+        return fragment
+
+    def record(self, name, metadata_prefix):
+        """Get the serialized record element of a record in a metadata format."""
+        key = (name, metadata_prefix)
+        fragment = self._records.get(key)
+        if fragment is None:
+            fragment = self._serialize(self.oai.recordElement(self.metadata_dict, name, metadata_prefix,
+                                                              self.record_sets[name]))
+            with self._lock:
+                self._records[key] = fragment
+        return fragment
+
+
+class RecordStores:
+    """RecordStore of the latest catalog versions."""
+
+    def __init__(self, max_versions=2):
+        """Creator function."""
+        self.max_versions = max_versions
+        self._stores = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, snapshot, oai):
+        """Get the RecordStore of a catalog snapshot."""
+        with self._lock:
+            if snapshot.version in self._stores:
+                return self._stores[snapshot.version]
+
+        metadata_dict = OrderedDict((name, tosca["metadata"]) for name, tosca in snapshot.templates.items())
+        store = RecordStore(oai, metadata_dict)
+
+        with self._lock:
+            store = self._stores.setdefault(snapshot.version, store)
+            while len(self._stores) > self.max_versions:
+                self._stores.popitem(last=False)
+        return store
@@ -0,0 +1,59 @@
+#
+# IM - Infrastructure Manager Dashboard
+# Copyright (C) 2023 - GRyCAP - Universitat Politecnica de Valencia
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""Stateless signed OAI-PMH resumption tokens."""
+
+import base64
+import hashlib
+import hmac
+import json
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def _b64decode(data):
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _signature(payload, secret):
+    return _b64encode(hmac.new(secret.encode("utf-8"), payload.encode("utf-8"), hashlib.sha256).digest())
+
+
+def encode_token(state, secret):
+    """Get a resumption token with the state of a list request (a dict) signed with the secret."""
+    payload = _b64encode(json.dumps(state, separators=(",", ":"), sort_keys=True).encode("utf-8"))
+    return "%s.%s" % (payload, _signature(payload, secret))
+
+
+def decode_token(token, secret):
+    """Get the state of a resumption token or None if it is not valid."""
+    payload, _, signature = (token or "").partition(".")
+    expected = _signature(payload, secret)
+    if not payload or not hmac.compare_digest(signature.encode("utf-8"), expected.encode("utf-8")):
+        return None
+    try:
+        state = json.loads(_b64decode(payload))
+    except ValueError:
+        return None
+    if not isinstance(state, dict):
+        return None
+    return state
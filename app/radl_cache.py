@@ -0,0 +1,76 @@
+#
+# IM - Infrastructure Manager Dashboard
+# Copyright (C) 2020 - GRyCAP - Universitat Politecnica de Valencia
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""Class to cache the parsed RADL documents of the infrastructures."""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+from radl import radl_parse
+
+
+def content_hash(radl):
+    return hashlib.sha256(radl.encode("utf-8")).hexdigest()
+
+
+class RADLCache:
+    """Parse RADL documents caching the parsed objects by content hash.
+
+    The cache is bounded (LRU eviction). As the parsed objects are usually
+    modified before sending them back to the IM, a copy is returned unless
+    the caller only reads it.
+    """
+
+    def __init__(self, cache_size=128):
+        """Creator function."""
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def parse(self, radl, copy=True):
+        """Parse a RADL document (or get it from the cache).
+
+        If copy is False the cached object is returned, so it must not be modified.
+        """
+        key = content_hash(radl)
+        with self._lock:
+            parsed = self._cache.get(key)
+            if parsed is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._cache.move_to_end(key)
+
+        if parsed is None:
+            # The parse errors are not cached, they are raised to the caller
+            parsed = radl_parse.parse_radl(radl)
+            with self._lock:
+                self._cache[key] = parsed
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        return parsed.clone() if copy else parsed
@@ -0,0 +1,189 @@
+#
+# IM - Infrastructure Manager Dashboard
+# Copyright (C) 2020 - GRyCAP - Universitat Politecnica de Valencia
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""Inverted index over the TOSCA templates catalog."""
+
+import re
+from bisect import bisect_left, insort
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+FACETS = ["tag", "vo"]
+
+
+def tokenize(text):
+    if not text:
+        return []
+    return TOKEN_RE.findall(str(text).lower())
+
+
+def _as_list(value):
+    if not value:
+        return []
+    if isinstance(value, (list, tuple, set)):
+        return [str(elem) for elem in value if elem]
+    return [str(value)]
+
+
+class TemplateIndex:
+    """Tokenized, prefix and faceted (tag/VO) search over the TOSCA catalog.
+
+    It is fed with the toscaInfo entries returned by utils.extractToscaInfo
+    and it is updated incrementally when templates are reloaded or removed.
+    """
+
+    def __init__(self):
+        """Creator function."""
+        # token -> set of template names
+        self._postings = {}
+        # sorted list of tokens, used for prefix lookups
+        self._tokens = []
+        # facet -> value -> set of template names
+        self._facets = {facet: {} for facet in FACETS}
+        # template name -> (tokens, {facet: values}) to be able to remove it
+        self._docs = {}
+
+    def __len__(self):
+        return len(self._docs)
+
+    def __contains__(self, name):
+        return name in self._docs
+
+    @staticmethod
+    def _doc_terms(name, tosca):
+        metadata = tosca.get("metadata", {}) or {}
+        tokens = set(tokenize(name))
+        tokens.update(tokenize(metadata.get("template_name")))
+        tokens.update(tokenize(metadata.get("display_name")))
+        tokens.update(tokenize(tosca.get("description")))
+        for input_name in (tosca.get("inputs") or {}):
+            tokens.update(tokenize(input_name))
+
+        facets = {"tag": set(value.lower() for value in _as_list(metadata.get("tag"))),
+                  "vo": set(value.lower() for value in _as_list(metadata.get("vos")))}
+        for values in facets.values():
+            for value in values:
+                tokens.update(tokenize(value))
+
+        return tokens, facets
+
+    def add(self, name, tosca):
+        """Add (or replace) a template in the index."""
+        if name in self._docs:
+            self.remove(name)
+
+        tokens, facets = self._doc_terms(name, tosca)
+        for token in tokens:
+            if token not in self._postings:
+                self._postings[token] = set()
+                insort(self._tokens, token)
+            self._postings[token].add(name)
+
+        for facet, values in facets.items():
+            for value in values:
+                self._facets[facet].setdefault(value, set()).add(name)
+
+        self._docs[name] = (tokens, facets)
+
+    def remove(self, name):
+        """Remove a template from the index."""
+        if name not in self._docs:
+            return
+
+        tokens, facets = self._docs.pop(name)
+        for token in tokens:
+            names = self._postings[token]
+            names.discard(name)
+            if not names:
+                del self._postings[token]
+                del self._tokens[bisect_left(self._tokens, token)]
+
+        for facet, values in facets.items():
+            for value in values:
+                names = self._facets[facet][value]
+                names.discard(name)
+                if not names:
+                    del self._facets[facet][value]
+
+    def update(self, toscaInfo):
+        """Add or replace all the templates of a toscaInfo dict."""
+        for name, tosca in toscaInfo.items():
+            self.add(name, tosca)
+
+    def copy(self):
+        """Get an independent copy of the index."""
+        new = TemplateIndex()
+        new._postings = {token: set(names) for token, names in self._postings.items()}
+        new._tokens = list(self._tokens)
+        new._facets = {facet: {value: set(names) for value, names in values.items()}
+                       for facet, values in self._facets.items()}
+        new._docs = dict(self._docs)
+        return new
+
+    def _prefix_matches(self, prefix):
+        res = set()
+        pos = bisect_left(self._tokens, prefix)
+        while pos < len(self._tokens) and self._tokens[pos].startswith(prefix):
+            res.update(self._postings[self._tokens[pos]])
+            pos += 1
+        return res
+
+    @staticmethod
+    def parse_query(query):
+        """Split a query in free text terms and facet filters (e.g. "tag:kubernetes vo:vo.access.egi.eu")."""
+        terms = []
+        facets = {}
+        for word in (query or "").split():
+            facet, sep, value = word.partition(":")
+            if sep and facet.lower() in FACETS and value:
+                facets.setdefault(facet.lower(), []).append(value.lower())
+            else:
+                terms.extend(tokenize(word))
+        return terms, facets
+
+    def search(self, query=None, tags=None, vos=None):
+        """Get the set of template names matching all the query terms and facets.
+
+        Every query term matches the tokens starting with it. Facet values
+        of the same facet are ORed, and different facets are ANDed.
+        """
+        terms, facets = self.parse_query(query)
+        for facet, values in (("tag", tags), ("vo", vos)):
+            if values:
+                facets.setdefault(facet, []).extend(value.lower() for value in _as_list(values))
+
+        res = None
+        for facet, values in facets.items():
+            names = set()
+            for value in values:
+                names.update(self._facets[facet].get(value, ()))
+            res = names if res is None else res & names
+            if not res:
+                return set()
+
+        # Start by the most selective terms
+        for term in sorted(set(terms), key=len, reverse=True):
+            names = self._prefix_matches(term)
+            res = names if res is None else res & names
+            if not res:
+                return set()
+
+        if res is None:
+            return set(self._docs)
+        return res
@@ -55,3 +55,24 @@ class Settings:
         self.oaipmh_repo_name = config.get('OAIPMH_REPO_NAME', "")
         self.oaipmh_repo_description = config.get('OAIPMH_REPO_DESCRIPTION', "")
         self.oaipmh_repo_base_identifier_url = config.get('OAIPMH_REPO_BASE_IDENTIFIER_URL', "")
+        self.oaipmh_page_size = config.get('OAIPMH_PAGE_SIZE', 100)
+        self.tosca_validation_cache_size = config.get('TOSCA_VALIDATION_CACHE_SIZE', 128)
+        self.tosca_validation_process = config.get('TOSCA_VALIDATION_PROCESS', False)
+        self.tosca_validation_cpu_limit = config.get('TOSCA_VALIDATION_CPU_LIMIT', 30)
+        self.tosca_validation_timeout = config.get('TOSCA_VALIDATION_TIMEOUT', 120)
+        self.tosca_fetch_cache_size = config.get('TOSCA_FETCH_CACHE_SIZE', 64)
+        self.tosca_fetch_max_size = config.get('TOSCA_FETCH_MAX_SIZE', 1048576)
+        self.stats_cache_ttl = config.get('STATS_CACHE_TTL', 3600)
+        self.log_page_lines = config.get('LOG_PAGE_LINES', 1000)
+        self.log_tail_interval = config.get('LOG_TAIL_INTERVAL', 5)
+        self.log_tail_timeout = config.get('LOG_TAIL_TIMEOUT', 60)
+        self.log_tail_max_user = config.get('LOG_TAIL_MAX_USER', 2)
+        self.log_tail_max = config.get('LOG_TAIL_MAX', 20)
+        self.log_cache_dir = config.get('LOG_CACHE_DIR')
+        self.log_cache_size = config.get('LOG_CACHE_SIZE', 1073741824)
+        self.vm_info_workers = config.get('VM_INFO_WORKERS', 10)
+        self.radl_cache_size = config.get('RADL_CACHE_SIZE', 128)
+        self.metrics_enabled = config.get('METRICS_ENABLED', False)
+        self.bulk_ops_workers = config.get('BULK_OPS_WORKERS', 10)
+        self.bulk_ops_im_limit = config.get('BULK_OPS_IM_LIMIT', 5)
+        self.bulk_ops_max_user_jobs = config.get('BULK_OPS_MAX_USER_JOBS', 2)
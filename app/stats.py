@@ -0,0 +1,317 @@
+#
+# IM - Infrastructure Manager Dashboard
+# Copyright (C) 2020 - GRyCAP - Universitat Politecnica de Valencia
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""Aggregation of the IM usage stats."""
+
+import csv
+import datetime
+import heapq
+import io
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Size in seconds of the time buckets
+BUCKETS = OrderedDict([("hour", 3600), ("day", 86400), ("week", 7 * 86400)])
+# Max number of points of each plotted series
+MAX_POINTS = 1000
+METRICS = ["infs", "vms", "cpus", "mems"]
+# Columns of the exported stats
+EXPORT_FIELDS = ["inf_id", "creation_date", "last_date", "site", "cloud_type", "cloud_host", "tosca_name",
+                 "vm_count", "cpu_count", "memory_size", "hybrid", "im_user"]
+EXPORT_FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+
+def parse_date(value):
+    """Parse a date of the IM stats (DATE_FORMAT)."""
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return datetime.datetime.strptime(value, DATE_FORMAT)
+
+
+def stats_series(stats, init_date, end_date, active=False, site_name=None):
+    """Get the ready to plot series of the IM stats of the infrastructures created between two dates.
+
+    Every infrastructure adds an event in its creation date with the number of
+    infrastructures (1), VMs, CPUs and memory (in GB). If active is set, the
+    infrastructures are also removed (negative event) in their last date, so
+    the cumulative sums of the series give the active resources. The deletions
+    are computed with a sweep over the creation dates using a heap of end dates.
+
+    Returns a dict with the infs, vms, cpus, mems, labels (dates) and clouds
+    lists, and the list of cloud_hosts that appear in the stats. site_name is
+    a function that returns the name of the cloud site of a stat.
+    """
+    infs = [0]
+    vms = [0]
+    cpus = [0]
+    mems = [0]
+    labels = ["%s 00:00:00" % init_date]
+    clouds = [""]
+    cloud_hosts = []
+    seen_hosts = set()
+    # heap of (end date, creation order, vms, mems, cpus, cloud, label) of the active infrastructures
+    actives = []
+
+    def add_event(sign, vm_count, mem_size, cpu_count, cloud, label):
+        infs.append(sign)
+        vms.append(sign * vm_count)
+        mems.append(sign * mem_size)
+        cpus.append(sign * cpu_count)
+        clouds.append(cloud)
+        labels.append(label)
+
+    def remove_ended(date):
+        while actives and actives[0][0] <= date:
+            _, _, vm_count, mem_size, cpu_count, cloud, label = heapq.heappop(actives)
+            add_event(-1, vm_count, mem_size, cpu_count, cloud, label)
+
+    for order, inf_stat in enumerate(sorted(stats, key=lambda stat: stat['creation_date'])):
+        if site_name:
+            cloud = site_name(inf_stat)
+        else:
+            cloud = inf_stat['cloud_host'] or inf_stat['cloud_type']
+        if cloud not in seen_hosts:
+            seen_hosts.add(cloud)
+            cloud_hosts.append(cloud)
+
+        mem_size = inf_stat['memory_size'] / 1024
+        if active:
+            creation_date = parse_date(inf_stat['creation_date'])
+            remove_ended(creation_date)
+            end_label = "%s 12:00:00" % inf_stat['last_date']
+            end = parse_date(end_label)
+            if end < creation_date:
+                # deleted the same day it was created
+                end, end_label = creation_date, inf_stat['creation_date']
+            heapq.heappush(actives, (end, order, inf_stat['vm_count'], mem_size,
+                                     inf_stat['cpu_count'], cloud, end_label))
+
+        add_event(1, inf_stat['vm_count'], mem_size, inf_stat['cpu_count'], cloud, inf_stat['creation_date'])
+
+    end_label = "%s 23:59:59" % end_date
+    if active:
+        remove_ended(parse_date(end_label))
+
+    # Add an element in the last date
+    infs.append(0)
+    vms.append(0)
+    mems.append(0)
+    cpus.append(0)
+    labels.append(end_label)
+    clouds.append("")
+
+    return {"infs": infs, "vms": vms, "cpus": cpus, "mems": mems, "labels": labels, "clouds": clouds,
+            "cloud_hosts": cloud_hosts}
+
+
+def bucket_size(series, bucket="auto", max_points=MAX_POINTS):
+    """Get the size in seconds of the time buckets used to plot the series (None to plot all the points).
+
+    With "auto" the points are not aggregated if there are less than max_points
+    events. Otherwise the smallest bucket (or the requested one) is enlarged, if
+    needed, so that there are at most max_points buckets.
+    """
+    if not bucket or bucket == "none" or (bucket == "auto" and len(series["labels"]) - 2 <= max_points):
+        return None
+
+    span = (parse_date(series["labels"][-1]) - parse_date(series["labels"][0])).total_seconds()
+    min_size = BUCKETS.get(bucket, 0)
+    for size in BUCKETS.values():
+        if size >= min_size and span / size <= max_points:
+            return size
+    return max(min_size, int(math.ceil(span / max_points)))
+
+
+def cumulative_series(series, size=None):
+    """Get the cumulative series of each cloud site ("" for all the sites) to plot them.
+
+    The events of the series returned by stats_series are aggregated in time
+    buckets of the specified size (in secs), so each plotted series has at
+    most a point per bucket. Returns a dict with a dict of labels, infs, vms,
+    cpus and mems lists for each cloud site.
+    """
+    init_label = series["labels"][0]
+    end_label = series["labels"][-1]
+    init = parse_date(init_label)
+    labels, clouds = series["labels"], series["clouds"]
+    infs, vms, cpus, mems = (series[metric] for metric in METRICS)
+
+    # cloud -> point key (label or bucket number) -> metric deltas
+    all_points = {}
+    deltas = OrderedDict([("", all_points)])
+    for i in range(1, len(labels) - 1):
+        key = labels[i]
+        if size:
+            key = max(0, int((parse_date(key) - init).total_seconds() // size))
+        targets = [all_points]
+        if clouds[i] != "":
+            targets.append(deltas.setdefault("%s" % clouds[i], {}))
+        for points in targets:
+            point = points.get(key)
+            if point is None:
+                point = points[key] = [0, 0, 0, 0]
+            point[0] += infs[i]
+            point[1] += vms[i]
+            point[2] += cpus[i]
+            point[3] += mems[i]
+
+    bucket_labels = {}
+    res = OrderedDict()
+    for cloud, points in deltas.items():
+        point_labels = [init_label]
+        values = [[0] for _ in METRICS]
+        for key, point in sorted(points.items()):
+            if size:
+                if key not in bucket_labels:
+                    bucket_labels[key] = (init + datetime.timedelta(seconds=key * size)).strftime(DATE_FORMAT)
+                key = bucket_labels[key]
+            point_labels.append(key)
+            for j in range(len(METRICS)):
+                values[j].append(values[j][-1] + point[j])
+        # add the last value on the end time
+        point_labels.append(end_label)
+        for value in values:
+            value.append(value[-1])
+        res[cloud] = dict(zip(METRICS, values), labels=point_labels)
+    return res
+
+
+def export_stats(stats, fmt="csv", site_name=None, sites=None, chunk_rows=500):
+    """Generator of the stats rows, enriched with the site name, in CSV or NDJSON format.
+
+    The rows are written in chunks of chunk_rows rows, so the memory used does
+    not depend on the number of rows. If sites is set only the rows of those
+    sites are returned.
+    """
+    buf = io.StringIO()
+    writer = None
+    if fmt == "csv":
+        writer = csv.DictWriter(buf, EXPORT_FIELDS, extrasaction="ignore", lineterminator="\n")
+        writer.writeheader()
+
+    rows = 0
+    for inf_stat in stats:
+        row = dict(inf_stat)
+        row["site"] = site_name(inf_stat) if site_name else inf_stat.get("cloud_host") or inf_stat.get("cloud_type")
+        if sites and row["site"] not in sites:
+            continue
+        if writer:
+            writer.writerow(row)
+        else:
+            buf.write(json.dumps({field: row.get(field) for field in EXPORT_FIELDS}))
+            buf.write("\n")
+        rows += 1
+        if rows % chunk_rows == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+
+    if buf.tell():
+        yield buf.getvalue()
+
+
+class StatsStore:
+    """Per user cache of the IM stats of the closed days (before today).
+
+    The last_date of the stats of an infrastructure changes while it exists,
+    so only the closed days whose infrastructures have all been deleted are
+    cached. The rest of the days are requested to the IM. The stats are
+    cached by user and IM credentials (auth_id), and all the stats of a user
+    are discarded after ttl seconds or when they are invalidated (e.g. when
+    one of its infrastructures is deleted or its credentials change).
+    """
+
+    def __init__(self, ttl=3600, max_users=1000):
+        """Creator function."""
+        self.ttl = ttl
+        self.max_users = max_users
+        # (user, auth_id) -> (creation time, {day: list of stats created that day})
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def invalidate(self, user):
+        with self._lock:
+            for key in [key for key in self._users if key[0] == user]:
+                del self._users[key]
+
+    def _user_days(self, key):
+        with self._lock:
+            entry = self._users.get(key)
+            if entry is None or time.time() - entry[0] > self.ttl:
+                entry = (time.time(), {})
+                self._users[key] = entry
+            self._users.move_to_end(key)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+            return entry[1]
+
+    def get_stats(self, user, fetch, init_date, end_date, today=None, auth_id="", live_ids=None):
+        """Get the stats of the infrastructures created between init_date and end_date (YYYY-MM-DD).
+
+        fetch(init_date, end_date) is the function used to get the stats from the IM.
+        live_ids are the IDs of the infrastructures not deleted (if None no day is cached).
+        """
+        try:
+            init = datetime.date.fromisoformat(init_date)
+            end = datetime.date.fromisoformat(end_date)
+        except (TypeError, ValueError):
+            return fetch(init_date, end_date)
+        today = today or datetime.date.today()
+        days = self._user_days((user, auth_id))
+
+        # Get the stats of all the days not cached with a single request, from the first to the day after
+        # the last one (so the whole last day is included), and split them by creation day
+        missing = []
+        day = init
+        while day <= end:
+            if day >= today or str(day) not in days:
+                missing.append(str(day))
+            day += datetime.timedelta(days=1)
+
+        open_stats = []
+        if missing:
+            fetched = dict((day, []) for day in missing)
+            last = datetime.date.fromisoformat(missing[-1]) + datetime.timedelta(days=1)
+            for inf_stat in fetch(missing[0], str(last)):
+                day = inf_stat['creation_date'][:10]
+                if day in fetched:
+                    fetched[day].append(inf_stat)
+                elif not str(init) <= day <= str(end + datetime.timedelta(days=1)):
+                    # Stats out of the requested dates are returned but not cached (the ones
+                    # of the cached days and of the day after the end date are discarded)
+                    open_stats.append(inf_stat)
+            for day, day_stats in fetched.items():
+                if day < str(today) and live_ids is not None and not any(inf_stat.get('inf_id') in live_ids
+                                                                         for inf_stat in day_stats):
+                    days[day] = day_stats
+                else:
+                    open_stats.extend(day_stats)
+
+        res = []
+        day = init
+        while day <= end and day < today:
+            res.extend(days.get(str(day), []))
+            day += datetime.timedelta(days=1)
+        return sorted(res + open_stats, key=lambda inf_stat: inf_stat['creation_date'])
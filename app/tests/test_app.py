@@ -1,4 +1,10 @@
+import os
+import gzip
 import sys
+import datetime
+import shutil
+import tempfile
+import time
 
 sys.path.append('..')
 sys.path.append('.')
@@ -7,6 +13,7 @@ import unittest
 import json
 import defusedxml.ElementTree as etree
 from app import create_app
+from app.settings import Settings
 from urllib.parse import urlparse
 from mock import patch, MagicMock
 
@@ -234,6 +241,57 @@ class IMDashboardTests(unittest.TestCase):
         res = self.login(avatar)
         self.assertEqual(200, res.status_code)
 
+    @patch("app.utils.avatar")
+    def test_index_filter(self, avatar):
+        self.login(avatar)
+        res = self.client.get('/?filter=comp')
+        self.assertEqual(200, res.status_code)
+        self.assertIn(b'Deploy a VM', res.data)
+        with self.client.session_transaction() as sess:
+            sess['filter'] = 'tag:kubernetes'
+        res = self.client.get('/')
+        self.assertEqual(200, res.status_code)
+        self.assertNotIn(b'Deploy a VM', res.data)
+
+    @patch("app.utils.avatar")
+    def test_index_conditional(self, avatar):
+        self.login(avatar)
+        res = self.client.get('/')
+        self.assertEqual(200, res.status_code)
+        etag = res.headers['ETag']
+        self.assertIn('private', res.headers['Cache-Control'])
+        self.assertIn('Last-Modified', res.headers)
+
+        res = self.client.get('/', headers={'If-None-Match': etag})
+        self.assertEqual(304, res.status_code)
+        self.assertEqual(b'', res.data)
+
+        res = self.client.get('/?filter=comp', headers={'If-None-Match': etag})
+        self.assertEqual(200, res.status_code)
+        self.assertNotEqual(etag, res.headers['ETag'])
+
+        # Pages with flashed messages are not cached
+        with self.client.session_transaction() as sess:
+            sess['_flashes'] = [('info', 'Some message')]
+        res = self.client.get('/?filter=comp', headers={'If-None-Match': etag})
+        self.assertEqual(200, res.status_code)
+        self.assertNotIn('ETag', res.headers)
+
+    def test_oai_conditional(self):
+        res = self.client.get('/oai?verb=ListRecords&metadataPrefix=oai_dc')
+        self.assertEqual(200, res.status_code)
+        etag = res.headers['ETag']
+        last_modified = res.headers['Last-Modified']
+        self.assertIn('public', res.headers['Cache-Control'])
+
+        res = self.client.get('/oai?metadataPrefix=oai_dc&verb=ListRecords', headers={'If-None-Match': etag})
+        self.assertEqual(304, res.status_code)
+        res = self.client.get('/oai?verb=ListRecords&metadataPrefix=oai_dc',
+                              headers={'If-Modified-Since': last_modified})
+        self.assertEqual(304, res.status_code)
+        res = self.client.get('/oai?verb=ListRecords&metadataPrefix=oai_openaire', headers={'If-None-Match': etag})
+        self.assertEqual(200, res.status_code)
+
     @patch("app.utils.avatar")
     def test_settings(self, avatar):
         self.login(avatar)
@@ -315,6 +373,21 @@ class IMDashboardTests(unittest.TestCase):
         self.assertIn(b'Username: user', res.data)
         self.assertIn(b'Password: pass', res.data)
 
+    @patch("app.utils.getUserAuthData")
+    @patch('requests.get')
+    @patch("app.utils.avatar")
+    def test_vms(self, avatar, get, user_data):
+        user_data.return_value = "type = InfrastructureManager; token = access_token"
+        get.side_effect = self.get_response
+        self.login(avatar)
+        res = self.client.get('/vms/infid')
+        self.assertEqual(200, res.status_code)
+        self.assertIn(b'<a href="/vminfo?infId=infid&amp;vmId=0">0</a>', res.data)
+        self.assertIn(b'OpenNebula: server.com', res.data)
+        self.assertIn(b': 10.10.10.10', res.data)
+        self.assertIn(b'1 CPUs', res.data)
+        self.assertEqual(user_data.call_count, 1)
+
     @patch("app.utils.getUserAuthData")
     @patch('requests.put')
     @patch("app.utils.avatar")
@@ -354,12 +427,37 @@ class IMDashboardTests(unittest.TestCase):
         self.login(avatar)
         params = {'cpu': '4',
                   'memory': '4',
-                  'system_name': 'front'
+                  'gpu': '',
+                  'system': 'front'
                   }
         res = self.client.post('/managevm/resize/infid/0', data=params)
         self.assertEqual(302, res.status_code)
         self.assertIn('/vminfo?infId=infid&vmId=0', res.headers['location'])
         self.assertEqual(flash.call_args_list[0][0], ("Operation 'resize' successfully made on VM ID: 0", 'success'))
+        # Only the new features are sent, without getting the VM info
+        self.assertEqual(put.call_args_list[0][1]["data"], "system front (\ncpu.count >= 4 and\n"
+                                                           "memory.size >= 4.0GB\n)\n\n")
+        self.assertEqual(get.call_count, 0)
+
+        # If the IM rejects them, they are merged in the VM RADL
+        put.reset_mock()
+        put.side_effect = [MagicMock(ok=False, status_code=400, text="Error"), MagicMock(ok=True)]
+        res = self.client.post('/managevm/resize/infid/0', data=params)
+        self.assertEqual(302, res.status_code)
+        self.assertEqual(flash.call_args_list[1][0], ("Operation 'resize' successfully made on VM ID: 0", 'success'))
+        self.assertEqual(get.call_count, 1)
+        self.assertEqual(put.call_count, 2)
+        self.assertIn("memory.size >= 4.0GB", put.call_args_list[1][1]["data"])
+        self.assertIn("system front (\ncpu.count >= 4", put.call_args_list[1][1]["data"])
+
+        # Other errors are shown without merging them
+        put.reset_mock()
+        put.side_effect = [MagicMock(ok=False, status_code=401, text="Unauthorized")]
+        res = self.client.post('/managevm/resize/infid/0', data=params)
+        self.assertEqual(302, res.status_code)
+        self.assertEqual(flash.call_args_list[2][0], ("Error making resize op on VM 0: \nUnauthorized", 'error'))
+        self.assertEqual(get.call_count, 1)
+        self.assertEqual(put.call_count, 1)
 
     @patch("app.utils.getUserAuthData")
     @patch('requests.put')
@@ -397,6 +495,109 @@ class IMDashboardTests(unittest.TestCase):
         self.assertEqual(200, res.status_code)
         self.assertIn(b'CONT_MSG', res.data)
 
+    @patch("app.utils.getUserAuthData")
+    @patch('requests.get')
+    @patch("app.utils.avatar")
+    @patch("app.infra.Infrastructures.write_infra")
+    @patch("app.infra.Infrastructures.get_infra")
+    @patch("app.im.InfrastructureManager.get_inf_state")
+    def test_log_cache(self, get_inf_state, get_infra, write_infra, avatar, get, user_data):
+        user_data.return_value = "type = InfrastructureManager; token = access_token"
+        get.side_effect = self.get_response
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+
+        def cache_settings(config):
+            settings = Settings(config)
+            settings.log_cache_dir = cache_dir
+            return settings
+
+        with patch("app.Settings", side_effect=cache_settings):
+            self.setUp()
+        self.login(avatar)
+
+        # The DB state is configured but the infrastructure is being reconfigured outside the dashboard
+        get_infra.return_value = {"state": {"state": "configured"}, "log_version": 1}
+        get_inf_state.return_value = {"state": "running", "vm_states": {}}
+        res = self.client.get('/log/infid')
+        self.assertIn(b'CONT_MSG', res.data)
+        self.assertEqual(os.listdir(cache_dir), [])
+        new_data = {"state": {"state": "running", "vm_states": {}}, "log_version": 2}
+        self.assertEqual(write_infra.call_args[0], ("infid", new_data))
+
+        get_inf_state.return_value = {"state": "configured", "vm_states": {}}
+        res = self.client.get('/log/infid')
+        self.assertIn(b'CONT_MSG', res.data)
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+        # The cached log is downloaded compressed without getting it from the IM
+        get.reset_mock()
+        res = self.client.get('/log/infid/page?format=text&all=1', headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(res.data).decode(), "CONT_MSG")
+        res.close()
+        self.assertEqual(get.call_count, 0)
+        res = self.client.get('/log/infid/page?format=text&all=1', headers={'Accept-Encoding': 'gzip;q=0'})
+        self.assertNotIn('Content-Encoding', res.headers)
+        self.assertEqual(res.data, b"CONT_MSG")
+
+    @patch("app.utils.getUserAuthData")
+    @patch('requests.get')
+    @patch("app.utils.avatar")
+    def test_log_page(self, avatar, get, user_data):
+        user_data.return_value = "type = InfrastructureManager; token = access_token"
+        get.side_effect = self.get_response
+        self.login(avatar)
+        log = "\n".join(["VM 0:"] + ["line %d" % i for i in range(10)] + ["VM 1:", "fatal: error"])
+        with patch("app.im.InfrastructureManager.get_inf_property") as get_inf_property:
+            get_inf_property.return_value = MagicMock(ok=True, text=log)
+            res = self.client.get('/log/infid?count=5')
+            self.assertEqual(200, res.status_code)
+            self.assertIn(b'Lines 9-13 of 13', res.data)
+            self.assertIn(b'<p id="vm_1" class="bg-dark text-white">VM 1:<br></p>', res.data)
+            self.assertIn(b'/log/infid?vm=1&amp;count=5', res.data)
+            self.assertIn(b'href="/log/infid?start=0&amp;count=5"', res.data)
+            self.assertIn(b'href="/log/infid/page?format=text&amp;all=1"', res.data)
+            self.assertIn(b'new EventSource("/log/infid/tail?offset=%d-2")' % len(log), res.data)
+            self.assertIn(b'$.getJSON("/log/infid/search"', res.data)
+            self.assertNotIn(b'/vmlog/', res.data)
+            self.assertNotIn(b'vmid=', res.data)
+
+            res = self.client.get('/log/infid/page?count=5&vm=0')
+            page = json.loads(res.data)
+            self.assertEqual((page["start"], page["end"], page["total"], page["vms"]), (0, 5, 13, 2))
+            self.assertIn('<p id="vm_0" class="bg-dark text-white">VM 0:<br></p>', page["log"])
+
+            res = self.client.get('/log/infid/page?format=text&all=1')
+            self.assertEqual(res.data.decode(), log)
+            self.assertIn('deployment-log.txt', res.headers['Content-Disposition'])
+
+            res = self.client.get('/log/infid/search?q=fatal:&context=1')
+            self.assertEqual(json.loads(res.data), {"matches": [{"line": 12, "vm": 1, "text": "fatal: error",
+                                                                 "before": ["VM 1:"], "after": []}],
+                                                    "total": 1, "truncated": False, "vms": [{"vm": 1, "hits": 1}]})
+            res = self.client.get('/log/infid/search')
+            self.assertEqual(400, res.status_code)
+
+            # The infrastructure is configured, so only the rest of the log is sent
+            res = self.client.get('/log/infid/tail?offset=%d-1' % log.index("VM 1:"))
+            self.assertEqual(res.mimetype, "text/event-stream")
+            self.assertEqual(res.data.decode(), 'id: %d-2\ndata: <p id="vm_1" class="bg-dark text-white">VM 1:<br>'
+                             '</p><br>\ndata: <span class="bg-danger text-white">fatal: error</span><br>\ndata: \n\n'
+                             'event: end\ndata: configured\n\n' % len(log))
+            # The log of a stopped infrastructure does not grow, so its last line is also sent
+            with patch("app.im.InfrastructureManager.get_inf_state") as get_inf_state:
+                get_inf_state.return_value = {"state": "stopped", "vm_states": {}}
+                res = self.client.get('/log/infid/tail?offset=%d-2' % log.index("fatal: error"))
+                self.assertEqual(res.data.decode(), 'id: %d-2\ndata: <span class="bg-danger text-white">fatal: error'
+                                 '</span><br>\ndata: \n\nevent: end\ndata: stopped\n\n' % len(log))
+                res.close()
+            # The followers are released when the stream is closed
+            for _ in range(3):
+                res = self.client.get('/log/infid/tail?offset=%d-2' % len(log))
+                self.assertEqual(200, res.status_code)
+                res.close()
+
     @patch("app.utils.getUserAuthData")
     @patch('requests.get')
     @patch("app.utils.avatar")
@@ -435,6 +636,35 @@ class IMDashboardTests(unittest.TestCase):
         self.assertIn('/infrastructures', res.headers['location'])
         self.assertEqual(flash.call_args_list[0][0], ("Infrastructure 'infid' successfuly deleted.", 'success'))
 
+    @patch("app.utils.getUserAuthData")
+    @patch('requests.delete')
+    @patch("app.utils.avatar")
+    def test_bulk_delete(self, avatar, delete, user_data):
+        user_data.return_value = "type = InfrastructureManager; token = access_token"
+        delete.side_effect = self.delete_response
+        self.login(avatar)
+        res = self.client.post('/bulk/delete', data={"infid": ["infid", "infid2", "infid"]})
+        self.assertEqual(202, res.status_code)
+        job_url = json.loads(res.data)["url"]
+
+        for _ in range(50):
+            job = json.loads(self.client.get(job_url).data)
+            if job["finished"]:
+                break
+            time.sleep(0.1)
+        self.assertEqual(job["op"], "delete")
+        self.assertEqual((job["total"], job["done"]), (2, 2))
+        self.assertEqual(job["results"][0], {"id": "infid", "state": "success",
+                                             "message": "Operation 'delete' successfully made."})
+        self.assertEqual(job["results"][1]["state"], "error")
+
+        res = self.client.post('/bulk/migrate', data={"infid": ["infid"]})
+        self.assertEqual(400, res.status_code)
+        res = self.client.post('/bulk/stop')
+        self.assertEqual(400, res.status_code)
+        res = self.client.get('/jobs/unknown')
+        self.assertEqual(404, res.status_code)
+
     @patch("app.utils.avatar")
     @patch("app.db_cred.DBCredentials.get_creds")
     @patch('requests.get')
@@ -690,12 +920,37 @@ class IMDashboardTests(unittest.TestCase):
         get_sites.return_value = {"SITE_NAME": {"url": "URL", "state": "", "id": "", "name": ""},
                                   "SITE2": {"url": "URL2", "state": "CRITICAL", "id": "", "name": ""}}
         res = self.client.get('/stats')
+        init_date = str(datetime.date.today() - datetime.timedelta(days=180))
         self.assertEqual(200, res.status_code)
         self.assertNotIn(b'Error Getting Stats:', res.data)
-        self.assertIn(b'clouds.push("sharp-elbakyan5.im.grycap.net");', res.data)
-        self.assertIn(b'labels.push("2022-03-07 13:16:14");', res.data)
-        self.assertIn(b'const infs = [0, 1, 0];', res.data)
-        self.assertIn(b'const vms = [0, 2, 0];', res.data)
+        self.assertIn(b'<option  value="sharp-elbakyan5.im.grycap.net">', res.data)
+        self.assertIn(b'"sharp-elbakyan5.im.grycap.net": {"cpus": [0, 4, 4], "infs": [0, 1, 1], '
+                      b'"labels": ["%s 00:00:00", "2022-03-07 13:16:14", ' % init_date.encode(), res.data)
+        self.assertIn(b'"vms": [0, 2, 2]', res.data)
+
+    @patch("app.utils.avatar")
+    @patch("app.utils.getIMUserAuthData")
+    @patch('requests.get')
+    @patch("app.utils.getCachedSiteList")
+    def test_export_stats(self, get_sites, get, user_data, avatar):
+        user_data.return_value = "type = InfrastructureManager; token = access_token"
+        get.side_effect = self.get_response
+        self.login(avatar)
+        get_sites.return_value = {"SITE_NAME": {"url": "https://sharp-elbakyan5.im.grycap.net:5000", "state": "",
+                                                "id": "", "name": "SITE_NAME"}}
+        res = self.client.get('/stats/export?init_date=2022-03-01&end_date=2022-03-31')
+        self.assertEqual(200, res.status_code)
+        self.assertEqual(res.mimetype, "text/csv")
+        self.assertIn('stats_2022-03-01_2022-03-31.csv', res.headers['Content-Disposition'])
+        self.assertEqual(res.data.decode().splitlines()[1], "1,2022-03-07 13:16:14,2022-03-23,SITE_NAME,OSCAR,"
+                         "sharp-elbakyan5.im.grycap.net,kubernetes,2,4,1024,False,__OPENID__mcaballer")
+
+        res = self.client.get('/stats/export?format=ndjson&site=SITE_NAME')
+        self.assertEqual(json.loads(res.data)["site"], "SITE_NAME")
+        res = self.client.get('/stats/export?format=ndjson&site=OTHER')
+        self.assertEqual(res.data, b"")
+        res = self.client.get('/stats/export?format=xml')
+        self.assertEqual(400, res.status_code)
 
     @patch("app.utils.avatar")
     @patch("app.ssh_key.SSHKey.get_ssh_keys")
@@ -768,6 +1023,21 @@ class IMDashboardTests(unittest.TestCase):
         self.assertEqual(200, res.status_code)
         self.assertEqual(b'Current Owners:<br><ul><li>user1</li><li>user2</li></ul>', res.data)
 
+    def test_metrics(self):
+        res = self.client.get('/metrics')
+        self.assertEqual(404, res.status_code)
+
+        def enabled_settings(config):
+            settings = Settings(config)
+            settings.metrics_enabled = True
+            return settings
+
+        with patch("app.Settings", side_effect=enabled_settings):
+            self.setUp()
+        res = self.client.get('/metrics')
+        self.assertEqual(200, res.status_code)
+        self.assertIn(b'im_dashboard_cache_hits_total{cache="radl"} 0', res.data)
+
     def test_oai(self):
         namespace = {'oaipmh': 'http://www.openarchives.org/OAI/2.0/'}
 
@@ -902,7 +1172,19 @@ class IMDashboardTests(unittest.TestCase):
 
         root = etree.fromstring(res.data)
 
-        self.assertEqual(root.find(".//oaipmh:error", namespace).attrib['code'], 'noSetHierarchy')
+        sets = [elem.text for elem in root.findall(".//oaipmh:set/oaipmh:setSpec", namespace)]
+        self.assertEqual(sets, ['tag', 'tag:VM'])
+
+        # Test ListIdentifiers with set
+        res = self.client.get('/oai?verb=ListIdentifiers&metadataPrefix=oai_dc&set=tag:VM')
+        self.assertEqual(200, res.status_code)
+        root = etree.fromstring(res.data)
+        self.assertEqual(root.find(".//oaipmh:header/oaipmh:setSpec[2]", namespace).text, 'tag:VM')
+
+        res = self.client.get('/oai?verb=ListRecords&metadataPrefix=oai_dc&set=tag:SYS')
+        self.assertEqual(200, res.status_code)
+        root = etree.fromstring(res.data)
+        self.assertEqual(root.find(".//oaipmh:error", namespace).attrib['code'], 'noRecordsMatch')
 
     @patch("hvac.Client")
     def test_secret(self, hvac):
@@ -0,0 +1,94 @@
+#! /usr/bin/env python
+#
+# IM - Infrastructure Manager
+# Copyright (C) 2011 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from app.catalog import CatalogViews, ToscaCatalog
+
+
+class TestCatalog(unittest.TestCase):
+    """Class to test the catalog classes."""
+
+    @staticmethod
+    def get_tosca_info():
+        return {
+            "simple-node-disk.yml": {"metadata": {"order": 1, "childs": ["users.yml", "docker.yml"]},
+                                     "inputs": {"num_cpus": {"type": "integer"}},
+                                     "tabs": ["VM Data"]},
+            "kubernetes.yml": {"metadata": {"order": 2, "vos": ["vo1"]}, "inputs": {}, "tabs": []},
+            "users.yml": {"metadata": {"order": 3, "parents": ["simple-node-disk.yml"]},
+                          "inputs": {"users": {"type": "list"}, "num_cpus": {"default": 2}},
+                          "tabs": ["Users"]},
+            "docker.yml": {"metadata": {"order": 4, "parents": ["simple-node-disk.yml"], "vos": ["vo2"]},
+                           "inputs": {"docker_version": {"type": "string"}},
+                           "tabs": ["Docker"]}
+        }
+
+    def test_views(self):
+        catalog = ToscaCatalog(self.get_tosca_info())
+
+        view = catalog.views.get(catalog.snapshot(), ["vo1"])
+        self.assertEqual(list(view.parents), ["simple-node-disk.yml", "kubernetes.yml"])
+        self.assertEqual(list(view.children["simple-node-disk.yml"]), ["users.yml"])
+        self.assertIs(catalog.views.get(catalog.snapshot(), ["vo1"]), view)
+
+        view = catalog.views.get(catalog.snapshot(), None)
+        self.assertEqual(list(view.parents), ["simple-node-disk.yml"])
+        self.assertNotIn("docker.yml", view.visible)
+
+        catalog.update(deletedTemplates=["kubernetes.yml"])
+        self.assertNotIn("kubernetes.yml", catalog.views.get(catalog.snapshot(), ["vo1"]).visible)
+
+    def test_snapshots(self):
+        catalog = ToscaCatalog(self.get_tosca_info())
+        snapshot = catalog.snapshot()
+        self.assertEqual(snapshot.version, 1)
+
+        new_info = {"new.yml": {"metadata": {"order": 0}, "description": "New template", "inputs": {}}}
+        catalog.update(new_info, ["kubernetes.yml"])
+        self.assertEqual(catalog.version, 2)
+        self.assertEqual(list(catalog.snapshot().templates),
+                         ["new.yml", "simple-node-disk.yml", "users.yml", "docker.yml"])
+        self.assertEqual(catalog.snapshot().index.search("new"), {"new.yml"})
+
+        # The old snapshot is not modified
+        self.assertEqual(list(snapshot.templates),
+                         ["simple-node-disk.yml", "kubernetes.yml", "users.yml", "docker.yml"])
+        self.assertEqual(snapshot.index.search("new"), set())
+
+    def test_merged(self):
+        toscaInfo = self.get_tosca_info()
+        view = CatalogViews().get(ToscaCatalog(toscaInfo).snapshot(), ["vo2"])
+
+        template, childs = view.merged("simple-node-disk.yml", ["users.yml", "docker.yml", "other.yml"])
+        self.assertEqual(list(childs), ["users.yml", "docker.yml"])
+        self.assertEqual(template["inputs"], {"num_cpus": {"type": "integer", "default": 2},
+                                              "users": {"type": "list"},
+                                              "docker_version": {"type": "string"}})
+        self.assertEqual(template["tabs"], ["VM Data", "Users", "Docker"])
+        self.assertIs(view.merged("simple-node-disk.yml", ["users.yml", "docker.yml"])[0], template)
+        # the catalog is not modified
+        self.assertEqual(toscaInfo["simple-node-disk.yml"]["inputs"], {"num_cpus": {"type": "integer"}})
+
+        template, childs = view.merged("simple-node-disk.yml")
+        self.assertEqual(template["inputs"], {"num_cpus": {"type": "integer"}})
+        self.assertEqual(childs, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
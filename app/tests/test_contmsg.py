@@ -0,0 +1,161 @@
+#! /usr/bin/env python
+#
+# IM - Infrastructure Manager
+# Copyright (C) 2011 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import gzip
+import io
+import os
+import tempfile
+import time
+import unittest
+
+from app.contmsg import render_lines, LogIndex, LogIndexes, LogTail, LogFollowers, LogCache, search_log
+
+
+class TestContMsg(unittest.TestCase):
+    """Class to test the contextualization log functions."""
+
+    def test_render_lines(self):
+        log = ("VM 0:\nTASK [ok]\nfatal: [host]: FAILED!\n...ignoring\n<script>\n"
+               "VM 12:\nERROR executing task\nfatal: last line")
+        html, vms = render_lines(log.split("\n"))
+        self.assertEqual(vms, 2)
+        self.assertEqual(html.splitlines(), [
+            '<p id="vm_0" class="bg-dark text-white">VM 0:<br></p><br>',
+            'TASK [ok]<br>',
+            'fatal: [host]: FAILED!<br>',
+            '...ignoring<br>',
+            '&lt;script&gt;<br>',
+            '<p id="vm_1" class="bg-dark text-white">VM 12:<br></p><br>',
+            '<span class="bg-danger text-white">ERROR executing task</span><br>',
+            '<span class="bg-danger text-white">fatal: last line</span><br>'])
+
+        html, vms = render_lines(log.split("\n"), separators=False)
+        self.assertEqual(vms, 0)
+        self.assertTrue(html.startswith("VM 0:<br>\n"))
+
+        html, vms = render_lines(["VM 3:", "a & b"], first_vm=3)
+        self.assertEqual(html, '<p id="vm_3" class="bg-dark text-white">VM 3:<br></p><br>\na &amp; b<br>\n')
+        self.assertEqual(vms, 1)
+        self.assertEqual(render_lines([]), ("", 0))
+
+    def test_log_index(self):
+        log = "a\nVM 0:\nbb\n\nVM 1:\nc"
+        index = LogIndex(log)
+        self.assertEqual(index.num_lines, 6)
+        self.assertEqual(index.vm_lines, [1, 4])
+        for start in range(7):
+            for end in range(start, 7):
+                self.assertEqual(index.lines(log, start, end), log.split("\n")[start:end])
+
+        self.assertEqual(index.page(2), (4, 6))
+        self.assertEqual(index.page(2, start=1), (1, 3))
+        self.assertEqual(index.page(2, vm=0), (1, 3))
+        self.assertEqual(index.page(2, vm=5), (4, 6))
+        self.assertEqual(index.page(10, start=3), (3, 6))
+        self.assertEqual(index.render(log, 4, 6), '<p id="vm_1" class="bg-dark text-white">VM 1:<br></p><br>\nc<br>\n')
+
+        # The fatal errors in the last line of a page are checked with the next line of the log
+        log = "fatal: a\n...ignoring\nfatal: b"
+        index = LogIndex(log)
+        self.assertEqual(index.render(log, 0, 1), 'fatal: a<br>\n')
+        self.assertEqual(index.render(log, 2, 3), '<span class="bg-danger text-white">fatal: b</span><br>\n')
+
+        indexes = LogIndexes(max_logs=1)
+        self.assertIs(indexes.get(log), indexes.get(log))
+        indexes.get("other")
+        self.assertIsNot(indexes.get(log), index)
+
+    def test_log_tail(self):
+        tail = LogTail()
+        self.assertEqual(tail.update("VM 0:\nabc"), '<p id="vm_0" class="bg-dark text-white">VM 0:<br></p><br>\n')
+        # The last fatal line is held back until the next one arrives
+        self.assertEqual(tail.update("VM 0:\nabc\nfatal: x\n"), 'abc<br>\n')
+        self.assertEqual(tail.update("VM 0:\nabc\nfatal: x\n...ignoring\nVM 1:\n"),
+                         'fatal: x<br>\n...ignoring<br>\n<p id="vm_1" class="bg-dark text-white">VM 1:<br></p><br>\n')
+        self.assertEqual((tail.offset, tail.vms), (37, 2))
+        self.assertEqual(tail.update("VM 0:\nabc\nfatal: x\n...ignoring\nVM 1:\n"), "")
+        self.assertIsNone(tail.update("short"))
+        self.assertEqual(tail.update("short", final=True), "short<br>\n")
+
+        # The incomplete last line is not rendered until it is completed
+        tail = LogTail()
+        self.assertEqual(tail.update("abc\nde"), "abc<br>\n")
+        self.assertEqual(tail.update("abc\ndef"), "")
+        self.assertEqual(tail.update("abc\ndef\n"), "def<br>\n")
+        # Starting in the middle of a line the log is reset when it is completed
+        tail = LogTail(6)
+        self.assertEqual(tail.update("abc\ndefg"), "")
+        self.assertIsNone(tail.update("abc\ndefg\n"))
+        self.assertEqual(tail.offset, 0)
+
+    def test_log_followers(self):
+        followers = LogFollowers(max_user=2, max_total=3)
+        self.assertTrue(followers.acquire("user1"))
+        self.assertTrue(followers.acquire("user1"))
+        self.assertFalse(followers.acquire("user1"))
+        self.assertTrue(followers.acquire("user2"))
+        self.assertFalse(followers.acquire("user3"))
+        followers.release("user1")
+        self.assertTrue(followers.acquire("user3"))
+
+    def test_log_cache(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = LogCache(tmpdir)
+            key = ("user", "infid", None, 0)
+            self.assertIsNone(cache.get(key))
+            cache.put(key, "line1\r\nline2\n")
+            self.assertEqual(cache.get(key), "line1\r\nline2\n")
+            with gzip.open(cache.get_path(key), "rt", newline="") as log_file:
+                self.assertEqual(log_file.read(), "line1\r\nline2\n")
+            self.assertIsNone(cache.get(("user", "infid", None, 1)))
+            self.assertIsNone(cache.get(("user2", "infid", None, 0)))
+
+            # The least recently used logs are evicted
+            key2 = ("user", "infid2", "0", 0)
+            cache.put(key2, "log2")
+            os.utime(cache.path(key), (time.time() - 10, time.time() - 10))
+            cache.max_size = os.path.getsize(cache.path(key)) + os.path.getsize(cache.path(key2))
+            cache.put(("user", "infid3", None, 0), "log3")
+            self.assertIsNone(cache.get(key))
+            self.assertEqual(cache.get(key2), "log2")
+
+            cache.invalidate("infid2")
+            self.assertIsNone(cache.get(key2))
+            self.assertEqual(len(os.listdir(tmpdir)), 1)
+
+    def test_search_log(self):
+        log = "start\nVM 0:\nok\nfatal: a\n...ignoring\nVM 1:\nfatal: b\nend"
+        res = search_log(io.StringIO(log, newline="\n"), "fatal:", context=1)
+        self.assertEqual(res["total"], 2)
+        self.assertFalse(res["truncated"])
+        self.assertEqual(res["vms"], [{"vm": 0, "hits": 1}, {"vm": 1, "hits": 1}])
+        self.assertEqual(res["matches"][0], {"line": 3, "vm": 0, "text": "fatal: a", "before": ["ok"],
+                                             "after": ["...ignoring"]})
+        self.assertEqual(res["matches"][1]["after"], ["end"])
+
+        res = search_log(log.split("\n"), "fatal:", context=0, max_matches=1)
+        self.assertEqual(res["total"], 2)
+        self.assertTrue(res["truncated"])
+        self.assertEqual(res["matches"], [{"line": 3, "vm": 0, "text": "fatal: a", "before": [], "after": []}])
+        # The patterns are searched as plain text
+        self.assertEqual(search_log(log.split("\n"), "^(start|end)$")["total"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+#! /usr/bin/env python
+#
+# IM - Infrastructure Manager
+# Copyright (C) 2011 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import threading
+import time
+import unittest
+
+from app.jobs import JobTracker
+
+
+class TestJobTracker(unittest.TestCase):
+    """Class to test the JobTracker class."""
+
+    def wait(self, tracker, job_id, user="user"):
+        for _ in range(50):
+            job = tracker.get(job_id, user)
+            if job["finished"]:
+                return job
+            time.sleep(0.05)
+        self.fail("Job not finished")
+
+    def test_job(self):
+        tracker = JobTracker(workers=4)
+
+        def op(item):
+            if item == "inf2":
+                raise Exception("Error in inf2")
+            return "%s done" % item
+
+        job_id = tracker.submit("user", "stop", ["inf1", "inf2"], op)
+        job = self.wait(tracker, job_id)
+        self.assertEqual(job["op"], "stop")
+        self.assertEqual((job["total"], job["done"]), (2, 2))
+        self.assertEqual(job["results"], [{"id": "inf1", "state": "success", "message": "inf1 done"},
+                                          {"id": "inf2", "state": "error", "message": "Error in inf2"}])
+        # The jobs are only shown to their users
+        self.assertIsNone(tracker.get(job_id, "other"))
+        self.assertIsNone(tracker.get("unknown", "user"))
+
+        job_id = tracker.submit("user", "stop", [], op)
+        self.assertTrue(tracker.get(job_id, "user")["finished"])
+
+    def test_im_limit(self):
+        tracker = JobTracker(workers=8, per_im_limit=2)
+        lock = threading.Lock()
+        running = {"im1": 0, "im2": 0}
+        max_running = {"im1": 0, "im2": 0}
+
+        def op(im_url):
+            def run(item):
+                with lock:
+                    running[im_url] += 1
+                    max_running[im_url] = max(max_running[im_url], running[im_url])
+                time.sleep(0.05)
+                with lock:
+                    running[im_url] -= 1
+            return run
+
+        jobs = [tracker.submit("user", "start", ["inf%d" % num for num in range(6)], op(im_url), im_url)
+                for im_url in ["im1", "im2"]]
+        for job_id in jobs:
+            self.assertEqual(self.wait(tracker, job_id)["done"], 6)
+        self.assertEqual(max_running, {"im1": 2, "im2": 2})
+
+    def test_purge(self):
+        tracker = JobTracker(max_jobs=2)
+        jobs = []
+        for _ in range(3):
+            jobs.append(tracker.submit("user", "stop", ["inf"], lambda item: None))
+            self.wait(tracker, jobs[-1])
+        tracker.submit("user", "stop", [], lambda item: None)
+        self.assertIsNone(tracker.get(jobs[0], "user"))
+        self.assertIsNone(tracker.get(jobs[1], "user"))
+        self.assertIsNotNone(tracker.get(jobs[2], "user"))
+
+        tracker.ttl = -1
+        tracker.submit("user", "stop", [], lambda item: None)
+        self.assertIsNone(tracker.get(jobs[2], "user"))
+
+    def test_max_user_jobs(self):
+        tracker = JobTracker(max_jobs=3, max_user_jobs=1)
+        event = threading.Event()
+        job_id = tracker.submit("user", "stop", ["inf"], lambda item: event.wait(5))
+        # The user can not queue more jobs until the running one finishes
+        self.assertIsNone(tracker.submit("user", "stop", ["inf"], lambda item: None))
+        jobs = [(user, tracker.submit(user, "stop", ["inf"], lambda item: event.wait(5)))
+                for user in ["user2", "user3"]]
+        # Nor the other users if there are max_jobs jobs not finished
+        self.assertIsNone(tracker.submit("user4", "stop", ["inf"], lambda item: None))
+        event.set()
+        for user, job in [("user", job_id)] + jobs:
+            self.wait(tracker, job, user)
+        self.assertIsNotNone(tracker.submit("user", "stop", ["inf"], lambda item: None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+#! /usr/bin/env python
+#
+# IM - Infrastructure Manager
+# Copyright (C) 2011 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+
+from app.metrics import Metrics
+from app.radl_cache import RADLCache
+
+
+class Counters:
+    hits = 0
+    misses = 0
+
+
+class TestMetrics(unittest.TestCase):
+    """Class to test the Metrics class."""
+
+    def test_render(self):
+        metrics = Metrics()
+        cache = RADLCache()
+        cache.hits, cache.misses = 3, 1
+        metrics.register_cache("radl", cache)
+        metrics.register_cache("other", Counters())
+        self.assertEqual(metrics.snapshot()["radl"], {"hits": 3, "misses": 1, "hit_rate": 0.75, "size": 0})
+        self.assertEqual(metrics.snapshot()["other"], {"hits": 0, "misses": 0, "hit_rate": 0.0, "size": None})
+
+        lines = metrics.render().splitlines()
+        self.assertEqual(lines[:4], ["# HELP im_dashboard_cache_hits_total Number of hits of the cache.",
+                                     "# TYPE im_dashboard_cache_hits_total counter",
+                                     'im_dashboard_cache_hits_total{cache="radl"} 3',
+                                     'im_dashboard_cache_hits_total{cache="other"} 0'])
+        self.assertIn('im_dashboard_cache_hit_rate{cache="radl"} 0.75', lines)
+        self.assertIn('im_dashboard_cache_size{cache="radl"} 0', lines)
+        self.assertNotIn('im_dashboard_cache_size{cache="other"} None', lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,197 @@
+#! /usr/bin/env python
+#
+# IM - Infrastructure Manager
+# Copyright (C) 2011 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import datetime
+import unittest
+
+from lxml import etree
+from mock import MagicMock, patch
+from werkzeug.datastructures import MultiDict
+
+from app.oaipmh.oai import OAI
+from app.oaipmh.records import RecordStore
+
+
+class TestOAI(unittest.TestCase):
+    """Class to test the OAI class."""
+
+    namespace = {'oaipmh': 'http://www.openarchives.org/OAI/2.0/',
+                 'dc': 'http://purl.org/dc/elements/1.1/'}
+
+    def setUp(self):
+        self.metadata_dict = {}
+        for i in range(5):
+            self.metadata_dict["template%d.yml" % i] = {"display_name": "Template %d" % i,
+                                                        "creation_date": datetime.date(2020, 9, i + 1)}
+
+    @staticmethod
+    def oai(version=1):
+        return OAI("IM Dashboard", "http://localhost/oai", "description", "http://localhost/templates/",
+                   page_size=2, token_secret="secret", version=version)
+
+    def process(self, version=1, records=None, **params):
+        request = MagicMock()
+        request.values = MultiDict(params)
+        return etree.fromstring(self.oai(version).processRequest(request, self.metadata_dict, records))
+
+    def test_resumption_token(self):
+        names = []
+        root = self.process(verb="ListRecords", metadataPrefix="oai_dc")
+        for cursor in [0, 2, 4]:
+            names.extend(elem.text for elem in root.findall(".//dc:title", self.namespace))
+            token = root.find(".//oaipmh:resumptionToken", self.namespace)
+            self.assertEqual(token.attrib["completeListSize"], "5")
+            self.assertEqual(token.attrib["cursor"], str(cursor))
+            if token.text:
+                root = self.process(verb="ListRecords", resumptionToken=token.text)
+        self.assertEqual(names, ["Template %d" % i for i in range(5)])
+        # The last page has an empty token
+        self.assertIsNone(token.text)
+
+        # The from/until arguments are kept in the token
+        root = self.process(verb="ListIdentifiers", metadataPrefix="oai_dc", **{"from": "2020-09-03"})
+        token = root.find(".//oaipmh:resumptionToken", self.namespace)
+        self.assertEqual(token.attrib["completeListSize"], "3")
+        root = self.process(verb="ListIdentifiers", resumptionToken=token.text)
+        elems = root.findall(".//oaipmh:identifier", self.namespace)
+        self.assertEqual([elem.text for elem in elems], ["http://localhost/templates/template4.yml"])
+
+        # The list fits in one page: no token is returned
+        root = self.process(verb="ListIdentifiers", metadataPrefix="oai_dc", until="2020-09-02")
+        self.assertIsNone(root.find(".//oaipmh:resumptionToken", self.namespace))
+
+    def test_bad_resumption_token(self):
+        root = self.process(verb="ListRecords", metadataPrefix="oai_dc")
+        token = root.find(".//oaipmh:resumptionToken", self.namespace).text
+
+        # Tampered token
+        root = self.process(verb="ListRecords", resumptionToken="x" + token)
+        self.assertEqual(root.find(".//oaipmh:error", self.namespace).attrib['code'], 'badResumptionToken')
+        # Token of other version of the catalog
+        root = self.process(version=2, verb="ListRecords", resumptionToken=token)
+        self.assertEqual(root.find(".//oaipmh:error", self.namespace).attrib['code'], 'badResumptionToken')
+        # The resumptionToken is an exclusive argument
+        root = self.process(verb="ListRecords", metadataPrefix="oai_dc", resumptionToken=token)
+        self.assertEqual(root.find(".//oaipmh:error", self.namespace).attrib['code'], 'badArgument')
+
+    def test_record_store(self):
+        records = RecordStore(self.oai(), self.metadata_dict)
+        with patch.object(OAI, "mapDC", wraps=records.oai.mapDC) as map_dc:
+            for _ in range(2):
+                root = self.process(records=records, verb="ListRecords", metadataPrefix="oai_dc")
+                self.assertEqual([elem.text for elem in root.findall(".//dc:title", self.namespace)],
+                                 ["Template 0", "Template 1"])
+                root = self.process(records=records, verb="GetRecord", metadataPrefix="oai_dc",
+                                    identifier="http://localhost/templates/template1.yml")
+                self.assertEqual(root.find(".//dc:title", self.namespace).text, "Template 1")
+            self.assertEqual(map_dc.call_count, 2)
+
+        root = self.process(records=records, verb="ListIdentifiers", metadataPrefix="oai_dc")
+        self.assertEqual(root.find(".//oaipmh:ListIdentifiers/oaipmh:header/oaipmh:datestamp", self.namespace).text,
+                         "2020-09-01")
+        self.assertIsNotNone(root.find(".//oaipmh:ListIdentifiers/oaipmh:resumptionToken", self.namespace))
+
+    def test_record_index(self):
+        self.metadata_dict["template5.yml"] = {"display_name": "Template 5"}
+        self.metadata_dict["template6.yml"] = {"display_name": "Template 6",
+                                               "creation_date": datetime.date(2020, 8, 1)}
+        records = RecordStore(self.oai(), self.metadata_dict)
+        self.assertEqual(records.recordName("http://localhost/templates/template3.yml"), "template3.yml")
+        self.assertIsNone(records.recordName("template3.yml"))
+
+        # Sorted by datestamp, without creation_date the earliest datestamp is used
+        start, end = records.dateRange()
+        self.assertEqual(records.names(start, end), ["template5.yml", "template6.yml"] +
+                         ["template%d.yml" % i for i in range(5)])
+        start, end = records.dateRange(datetime.datetime(2020, 9, 2), datetime.datetime(2020, 9, 4))
+        self.assertEqual(records.names(start, end), ["template1.yml", "template2.yml", "template3.yml"])
+        self.assertEqual(records.dateRange(datetime.datetime(2020, 9, 4), datetime.datetime(2020, 9, 2)), (5, 5))
+
+        root = self.process(records=records, verb="GetRecord", metadataPrefix="oai_dc",
+                            identifier="http://otherhost/templates/template1.yml")
+        self.assertEqual(root.find(".//oaipmh:error", self.namespace).attrib['code'], 'idDoesNotExist')
+
+    def test_sets(self):
+        self.metadata_dict["template0.yml"].update({"tag": "VM", "childs": ["template1.yml", "nonexistent.yml"]})
+        self.metadata_dict["template1.yml"].update({"tag": "VM", "vos": ["vo.access.egi.eu"]})
+        self.metadata_dict["template2.yml"].update({"vos": ["vo.access.egi.eu", "vo test"],
+                                                    "parents": ["template0.yml"]})
+        self.metadata_dict["template3.yml"].update({"tag": "SYS"})
+
+        root = self.process(verb="ListSets")
+        sets = {elem.find("oaipmh:setSpec", self.namespace).text: elem.find("oaipmh:setName", self.namespace).text
+                for elem in root.findall(".//oaipmh:set", self.namespace)}
+        self.assertEqual(sets, {"tag": "Templates by tag", "tag:VM": "Tag VM", "tag:SYS": "Tag SYS",
+                                "vo": "Templates by VO", "vo:vo.access.egi.eu": "VO vo.access.egi.eu",
+                                "vo:vo_test": "VO vo test", "family": "Template families",
+                                "family:template0.yml": "Family of Template 0"})
+
+        for set_spec, names in [("tag:VM", ["template0.yml", "template1.yml"]),
+                                ("tag", ["template0.yml", "template1.yml", "template3.yml"]),
+                                ("vo:vo_test", ["template2.yml"]),
+                                ("family:template0.yml", ["template0.yml", "template1.yml", "template2.yml"])]:
+            root = self.process(verb="ListIdentifiers", metadataPrefix="oai_dc", set=set_spec)
+            self.assertEqual([elem.text for elem in root.findall(".//oaipmh:identifier", self.namespace)],
+                             ["http://localhost/templates/%s" % name for name in names[:2]])
+            token = root.find(".//oaipmh:resumptionToken", self.namespace)
+            if len(names) > 2:
+                self.assertEqual(token.attrib["completeListSize"], str(len(names)))
+                # The set is kept in the token
+                root = self.process(verb="ListIdentifiers", resumptionToken=token.text)
+                self.assertEqual([elem.text for elem in root.findall(".//oaipmh:identifier", self.namespace)],
+                                 ["http://localhost/templates/%s" % name for name in names[2:]])
+            else:
+                self.assertIsNone(token)
+
+        root = self.process(verb="GetRecord", metadataPrefix="oai_dc",
+                            identifier="http://localhost/templates/template2.yml")
+        self.assertEqual([elem.text for elem in root.findall(".//oaipmh:setSpec", self.namespace)],
+                         ["family", "family:template0.yml", "vo", "vo:vo.access.egi.eu", "vo:vo_test"])
+
+        root = self.process(verb="ListRecords", metadataPrefix="oai_dc", set="tag:nonexistent")
+        self.assertEqual(root.find(".//oaipmh:error", self.namespace).attrib['code'], 'noRecordsMatch')
+
+        # Without sets
+        self.setUp()
+        root = self.process(verb="ListSets")
+        self.assertEqual(root.find(".//oaipmh:error", self.namespace).attrib['code'], 'noSetHierarchy')
+        root = self.process(verb="ListRecords", metadataPrefix="oai_dc", set="tag:VM")
+        self.assertEqual(root.find(".//oaipmh:error", self.namespace).attrib['code'], 'noSetHierarchy')
+
+    def test_stream(self):
+        oai = OAI("IM Dashboard", "http://localhost/oai", "description", "http://localhost/templates/",
+                  page_size=5, stream=True)
+        oai.CHUNK_SIZE = 1
+        request = MagicMock()
+        request.values = MultiDict({"verb": "ListRecords", "metadataPrefix": "oai_dc"})
+        chunks = list(oai.processRequest(request, self.metadata_dict))
+        # Envelope head, one chunk per record and the tail
+        self.assertEqual(len(chunks), 7)
+        root = etree.fromstring("".join(chunks))
+        self.assertEqual([elem.text for elem in root.findall(".//dc:title", self.namespace)],
+                         ["Template %d" % i for i in range(5)])
+
+        request.values = MultiDict({"verb": "Identify"})
+        chunks = oai.processRequest(request, self.metadata_dict)
+        self.assertEqual(len(chunks), 1)
+        root = etree.fromstring(chunks[0])
+        self.assertEqual(root.find(".//oaipmh:repositoryName", self.namespace).text, "IM Dashboard")
+
+
+if __name__ == '__main__':
+    unittest.main()
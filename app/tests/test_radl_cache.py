@@ -0,0 +1,70 @@
+#! /usr/bin/env python
+#
+# IM - Infrastructure Manager
+# Copyright (C) 2011 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+
+from app.radl_cache import RADLCache
+from mock import patch
+from radl import radl_parse
+from radl.radl import RADLParseException
+
+RADL = """
+network public (outbound = 'yes')
+system front (
+    cpu.count >= 2 and
+    net_interface.0.connection = 'public'
+)
+deploy front 1
+"""
+
+
+class TestRADLCache(unittest.TestCase):
+    """Class to test the RADLCache class."""
+
+    def test_cache(self):
+        cache = RADLCache(cache_size=2)
+        radl = cache.parse(RADL)
+        self.assertEqual(radl.systems[0].getValue("cpu.count"), 2)
+        # The returned objects are copies, so they can be modified
+        radl.systems[0].setValue("cpu.count", 4)
+        radl.deploys = []
+        radl = cache.parse(RADL)
+        self.assertEqual(radl.systems[0].getValue("cpu.count"), 2)
+        self.assertEqual(len(radl.deploys), 1)
+        self.assertIs(cache.parse(RADL, copy=False), cache.parse(RADL, copy=False))
+        self.assertEqual((cache.hits, cache.misses), (3, 1))
+
+        # The parse errors are not cached
+        for _ in range(2):
+            with self.assertRaises(RADLParseException):
+                cache.parse("invalid radl")
+        self.assertEqual(cache.misses, 3)
+        self.assertEqual(len(cache), 1)
+
+        # The first one has been evicted
+        with patch("app.radl_cache.radl_parse.parse_radl", wraps=radl_parse.parse_radl) as parse_radl:
+            cache.parse(RADL + "\n")
+            cache.parse(RADL + "\n\n")
+            cache.parse(RADL)
+            self.assertEqual(parse_radl.call_count, 3)
+        self.assertEqual(len(cache), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
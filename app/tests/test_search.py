@@ -0,0 +1,74 @@
+#! /usr/bin/env python
+#
+# IM - Infrastructure Manager
+# Copyright (C) 2011 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from app.search import TemplateIndex
+
+
+class TestTemplateIndex(unittest.TestCase):
+    """Class to test the TemplateIndex class."""
+
+    toscaInfo = {
+        "simple-node-disk.yml": {"description": "Deploy a compute node getting the IP and SSH credentials",
+                                 "metadata": {"template_name": "VM", "display_name": "Deploy a VM", "tag": "VM"},
+                                 "inputs": {"num_cpus": {}, "mem_size": {}}},
+        "kubernetes.yml": {"description": "Deploy a Kubernetes cluster",
+                           "metadata": {"display_name": "Kubernetes Virtual Cluster", "tag": "SYS",
+                                        "vos": ["vo.access.egi.eu", "vo.test.eu"]},
+                           "inputs": {"wn_num": {}, "kube_version": {}}},
+        "users.yml": {"description": "Add users to the VMs",
+                      "metadata": {"template_name": "Users", "parents": ["simple-node-disk.yml"]},
+                      "inputs": {"users": {}}}
+    }
+
+    def setUp(self):
+        self.index = TemplateIndex()
+        self.index.update(self.toscaInfo)
+
+    def test_search(self):
+        self.assertEqual(self.index.search("deploy"), {"simple-node-disk.yml", "kubernetes.yml"})
+        self.assertEqual(self.index.search("Deploy compute"), {"simple-node-disk.yml"})
+        self.assertEqual(self.index.search("kube"), {"kubernetes.yml"})
+        self.assertEqual(self.index.search("num_cpus"), {"simple-node-disk.yml"})
+        self.assertEqual(self.index.search("nonexistent"), set())
+        self.assertEqual(self.index.search(""), set(self.toscaInfo))
+
+    def test_facets(self):
+        self.assertEqual(self.index.search("tag:vm"), {"simple-node-disk.yml"})
+        self.assertEqual(self.index.search("tag:vm tag:sys"), {"simple-node-disk.yml", "kubernetes.yml"})
+        self.assertEqual(self.index.search("deploy vo:vo.test.eu"), {"kubernetes.yml"})
+        self.assertEqual(self.index.search("deploy", tags=["SYS"]), {"kubernetes.yml"})
+        self.assertEqual(self.index.search("tag:vm", vos="vo.test.eu"), set())
+
+    def test_incremental_update(self):
+        copy = self.index.copy()
+        self.index.remove("kubernetes.yml")
+        self.assertEqual(self.index.search("kube"), set())
+        self.assertEqual(self.index.search("tag:sys"), set())
+        self.assertEqual(len(self.index), 2)
+        # The copy is not modified
+        self.assertEqual(copy.search("kube"), {"kubernetes.yml"})
+
+        self.index.add("users.yml", {"description": "Add users and groups", "metadata": {}, "inputs": {}})
+        self.assertEqual(self.index.search("groups"), {"users.yml"})
+        self.assertEqual(self.index.search("vms"), set())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+#! /usr/bin/env python
+#
+# IM - Infrastructure Manager
+# Copyright (C) 2011 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import datetime
+import json
+import unittest
+
+from app.stats import stats_series, bucket_size, cumulative_series, StatsStore, export_stats
+
+
+def stat(creation_date, last_date, vm_count=1, cloud_host="host1"):
+    return {"creation_date": creation_date, "last_date": last_date, "vm_count": vm_count,
+            "cpu_count": vm_count * 2, "memory_size": vm_count * 1024, "cloud_host": cloud_host,
+            "cloud_type": "OpenStack"}
+
+
+class TestStats(unittest.TestCase):
+    """Class to test the stats aggregation."""
+
+    stats = [stat("2022-03-05 10:00:00", "2022-03-20", 2, "host2"),
+             stat("2022-03-01 10:00:00", "2022-03-02"),
+             stat("2022-03-03 10:00:00", "2022-03-30", 1, ""),
+             stat("2022-03-04 10:00:00", "2022-03-02")]
+
+    def test_created(self):
+        res = stats_series(self.stats, "2022-03-01", "2022-03-25")
+        self.assertEqual(res["infs"], [0, 1, 1, 1, 1, 0])
+        self.assertEqual(res["vms"], [0, 1, 1, 1, 2, 0])
+        self.assertEqual(res["labels"], ["2022-03-01 00:00:00", "2022-03-01 10:00:00", "2022-03-03 10:00:00",
+                                         "2022-03-04 10:00:00", "2022-03-05 10:00:00", "2022-03-25 23:59:59"])
+        self.assertEqual(res["clouds"], ["", "host1", "OpenStack", "host1", "host2", ""])
+        self.assertEqual(res["cloud_hosts"], ["host1", "OpenStack", "host2"])
+
+    def test_active(self):
+        res = stats_series(self.stats, "2022-03-01", "2022-03-25", True, lambda s: s["cloud_host"] or "other")
+        self.assertEqual(res["labels"], ["2022-03-01 00:00:00", "2022-03-01 10:00:00", "2022-03-02 12:00:00",
+                                         "2022-03-03 10:00:00", "2022-03-04 10:00:00", "2022-03-04 10:00:00",
+                                         "2022-03-05 10:00:00", "2022-03-20 12:00:00", "2022-03-25 23:59:59"])
+        self.assertEqual(res["infs"], [0, 1, -1, 1, 1, -1, 1, -1, 0])
+        self.assertEqual(res["vms"], [0, 1, -1, 1, 1, -1, 2, -2, 0])
+        self.assertEqual(res["cpus"], [0, 2, -2, 2, 2, -2, 4, -4, 0])
+        self.assertEqual(res["mems"], [0, 1, -1, 1, 1, -1, 2, -2, 0])
+        self.assertEqual(res["clouds"], ["", "host1", "host1", "other", "host1", "host1", "host2", "host2", ""])
+        # The infrastructure deleted the same day it was created is removed after its creation
+        self.assertEqual(res["clouds"][5], "host1")
+        # The infrastructure still active at the end date is not removed
+        self.assertEqual(sum(res["infs"]), 1)
+
+    def test_bucket_size(self):
+        res = stats_series(self.stats, "2022-03-01", "2022-03-25")
+        self.assertIsNone(bucket_size(res, "auto"))
+        self.assertIsNone(bucket_size(res, "none"))
+        self.assertEqual(bucket_size(res, "day"), 86400)
+        self.assertIsNone(bucket_size(res, "auto", max_points=4))
+        self.assertEqual(bucket_size(res, "auto", max_points=3), 720000)
+        # The buckets are enlarged to keep the number of points bounded
+        self.assertEqual(bucket_size(res, "hour", max_points=100), 86400)
+        self.assertEqual(bucket_size(res, "week", max_points=2), 1080000)
+
+    def test_cumulative(self):
+        res = cumulative_series(stats_series(self.stats, "2022-03-01", "2022-03-25", True))
+        self.assertEqual(list(res), ["", "host1", "OpenStack", "host2"])
+        self.assertEqual(res[""]["labels"], ["2022-03-01 00:00:00", "2022-03-01 10:00:00", "2022-03-02 12:00:00",
+                                             "2022-03-03 10:00:00", "2022-03-04 10:00:00", "2022-03-05 10:00:00",
+                                             "2022-03-20 12:00:00", "2022-03-25 23:59:59"])
+        self.assertEqual(res[""]["infs"], [0, 1, 0, 1, 1, 2, 1, 1])
+        self.assertEqual(res["host2"]["vms"], [0, 2, 0, 0])
+
+        res = cumulative_series(stats_series(self.stats, "2022-03-01", "2022-03-25", True), 7 * 86400)
+        self.assertEqual(res[""]["labels"], ["2022-03-01 00:00:00", "2022-03-01 00:00:00", "2022-03-15 00:00:00",
+                                             "2022-03-25 23:59:59"])
+        self.assertEqual(res[""]["infs"], [0, 2, 1, 1])
+        self.assertEqual(res[""]["vms"], [0, 3, 1, 1])
+        self.assertEqual(res["host1"]["mems"], [0, 0, 0])
+
+    def test_store(self):
+        calls = []
+        stats = [dict(inf_stat, inf_id=str(num)) for num, inf_stat in enumerate(self.stats)]
+
+        def fetch(init_date, end_date):
+            calls.append((init_date, end_date))
+            return [s for s in stats if init_date <= s["creation_date"][:10] <= end_date]
+
+        store = StatsStore(ttl=3600)
+        today = datetime.date(2022, 3, 4)
+        res = store.get_stats("user", fetch, "2022-03-01", "2022-03-05", today, live_ids=set())
+        self.assertEqual([s["creation_date"] for s in res],
+                         ["2022-03-01 10:00:00", "2022-03-03 10:00:00", "2022-03-04 10:00:00",
+                          "2022-03-05 10:00:00"])
+        self.assertEqual(calls, [("2022-03-01", "2022-03-06")])
+
+        # The days not cached and the open ones are requested in a single request
+        calls.clear()
+        res = store.get_stats("user", fetch, "2022-02-27", "2022-03-05", today, live_ids=set())
+        self.assertEqual(len(res), 4)
+        self.assertEqual(calls, [("2022-02-27", "2022-03-06")])
+
+        # The stats of the day after the end date are not returned
+        calls.clear()
+        res = store.get_stats("user", fetch, "2022-03-03", "2022-03-04", today, live_ids=set())
+        self.assertEqual([s["creation_date"] for s in res], ["2022-03-03 10:00:00", "2022-03-04 10:00:00"])
+        self.assertEqual(calls, [("2022-03-04", "2022-03-05")])
+
+        calls.clear()
+        res = store.get_stats("user", fetch, "2022-03-01", "2022-03-02", today, live_ids=set())
+        self.assertEqual(len(res), 1)
+        self.assertEqual(calls, [])
+
+        # The stats are cached per IM credentials
+        res = store.get_stats("user", fetch, "2022-03-01", "2022-03-02", today, "other", set())
+        self.assertEqual(calls, [("2022-03-01", "2022-03-03")])
+
+        store.invalidate("user")
+        calls.clear()
+        store.get_stats("user", fetch, "2022-03-01", "2022-03-02", today, live_ids=set())
+        self.assertEqual(calls, [("2022-03-01", "2022-03-03")])
+
+        # The days with infrastructures not deleted are not cached
+        store.invalidate("user")
+        calls.clear()
+        res = store.get_stats("user", fetch, "2022-03-01", "2022-03-03", today, live_ids={"2"})
+        self.assertEqual([s["inf_id"] for s in res], ["1", "2"])
+        res = store.get_stats("user", fetch, "2022-03-01", "2022-03-03", today, live_ids={"2"})
+        self.assertEqual([s["inf_id"] for s in res], ["1", "2"])
+        self.assertEqual(calls, [("2022-03-01", "2022-03-04"), ("2022-03-03", "2022-03-04")])
+        # Nor if the live infrastructures are unknown
+        calls.clear()
+        store.get_stats("user", fetch, "2022-02-27", "2022-02-27", today)
+        store.get_stats("user", fetch, "2022-02-27", "2022-02-27", today)
+        self.assertEqual(calls, [("2022-02-27", "2022-02-28"), ("2022-02-27", "2022-02-28")])
+
+        # Expired entries are discarded
+        calls.clear()
+        store.ttl = -1
+        store.get_stats("user", fetch, "2022-03-01", "2022-03-02", today, live_ids=set())
+        self.assertEqual(calls, [("2022-03-01", "2022-03-03")])
+        self.assertEqual(store.get_stats("user", fetch, "invalid", "2022-03-02", today), [])
+
+    def test_export(self):
+        res = list(export_stats(self.stats, "csv", chunk_rows=3))
+        self.assertEqual(len(res), 2)
+        lines = "".join(res).splitlines()
+        self.assertEqual(lines[0], "inf_id,creation_date,last_date,site,cloud_type,cloud_host,tosca_name,"
+                                   "vm_count,cpu_count,memory_size,hybrid,im_user")
+        self.assertEqual(lines[3], ",2022-03-03 10:00:00,2022-03-30,OpenStack,OpenStack,,,1,2,1024,,")
+
+        res = "".join(export_stats(self.stats, "ndjson", lambda s: s["cloud_host"].upper(), {"HOST1"}))
+        rows = [json.loads(line) for line in res.splitlines()]
+        self.assertEqual([row["creation_date"] for row in rows], ["2022-03-01 10:00:00", "2022-03-04 10:00:00"])
+        self.assertEqual(rows[0]["site"], "HOST1")
+        self.assertEqual(rows[0]["vm_count"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
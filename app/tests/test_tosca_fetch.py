@@ -0,0 +1,91 @@
+#! /usr/bin/env python
+#
+# IM - Infrastructure Manager
+# Copyright (C) 2011 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from app.tosca_fetch import ToscaFetcher
+from app.tosca_validator import ToscaValidator
+from mock import patch, MagicMock
+
+TOSCA = """
+tosca_definitions_version: tosca_simple_yaml_1_0
+topology_template:
+  node_templates:
+    node:
+      type: tosca.nodes.Compute
+"""
+
+URL = "https://raw.githubusercontent.com/grycap/tosca/main/templates/simple-node-disk.yml"
+
+
+class TestToscaFetcher(unittest.TestCase):
+    """Class to test the ToscaFetcher class."""
+
+    @staticmethod
+    def response(status_code, content=b"", headers=None):
+        resp = MagicMock()
+        resp.status_code = status_code
+        resp.headers = headers or {}
+        resp.encoding = "utf-8"
+        resp.iter_content.return_value = [content[i:i + 10] for i in range(0, len(content), 10)]
+        return resp
+
+    @patch("app.tosca_validator.ToscaTemplate")
+    @patch("requests.get")
+    def test_conditional_fetch(self, get, tosca_template):
+        fetcher = ToscaFetcher(ToscaValidator(), cache_size=1)
+        get.return_value = self.response(200, TOSCA.encode(), {"ETag": '"v1"',
+                                                               "Last-Modified": "Mon, 19 Oct 2026 10:00:00 GMT"})
+        template = fetcher.get_template(URL)
+        self.assertEqual(template["topology_template"]["node_templates"]["node"]["type"], "tosca.nodes.Compute")
+        self.assertEqual(get.call_args_list[0][1]["headers"], {})
+
+        get.return_value = self.response(304)
+        self.assertEqual(fetcher.get_template(URL), template)
+        self.assertEqual(get.call_args_list[1][1]["headers"], {"If-None-Match": '"v1"',
+                                                               "If-Modified-Since": "Mon, 19 Oct 2026 10:00:00 GMT"})
+        self.assertEqual((fetcher.hits, fetcher.misses), (1, 1))
+        # Neither downloaded nor parsed again
+        self.assertEqual(tosca_template.call_count, 1)
+        self.assertEqual(fetcher.validator.hits, 1)
+
+        # Responses without validators are not cached
+        get.return_value = self.response(200, TOSCA.encode())
+        fetcher.fetch(URL + "2")
+        self.assertEqual(len(fetcher._cache), 1)
+        # LRU eviction
+        get.return_value = self.response(200, TOSCA.encode(), {"ETag": '"v2"'})
+        fetcher.fetch(URL + "2")
+        self.assertEqual(list(fetcher._cache), [URL + "2"])
+
+    @patch("requests.get")
+    def test_max_size(self, get):
+        fetcher = ToscaFetcher(ToscaValidator(), max_size=20)
+        get.return_value = self.response(200, TOSCA.encode(), {"Content-Length": str(len(TOSCA))})
+        with self.assertRaises(Exception) as ex:
+            fetcher.fetch(URL)
+        self.assertIn("TOSCA template too large", str(ex.exception))
+
+        get.return_value = self.response(200, TOSCA.encode())
+        with self.assertRaises(Exception) as ex:
+            fetcher.fetch(URL)
+        self.assertIn("more than 20 bytes", str(ex.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+#! /usr/bin/env python
+#
+# IM - Infrastructure Manager
+# Copyright (C) 2011 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from app.tosca_validator import ToscaValidator, ToscaValidationError
+from mock import patch
+from toscaparser.common.exception import ValidationError
+
+TOSCA = """
+tosca_definitions_version: tosca_simple_yaml_1_0
+topology_template:
+  node_templates:
+    node:
+      type: tosca.nodes.Compute
+"""
+
+
+class TestToscaValidator(unittest.TestCase):
+    """Class to test the ToscaValidator class."""
+
+    @patch("app.tosca_validator.ToscaTemplate")
+    def test_cache(self, tosca_template):
+        validator = ToscaValidator(cache_size=2)
+        template = validator.validate(TOSCA)
+        self.assertEqual(template["topology_template"]["node_templates"]["node"]["type"], "tosca.nodes.Compute")
+        template["topology_template"] = {}
+        template = validator.validate(TOSCA)
+        self.assertIn("node", template["topology_template"]["node_templates"])
+        self.assertEqual(tosca_template.call_count, 1)
+        self.assertEqual((validator.hits, validator.misses), (1, 1))
+
+        tosca_template.side_effect = ValidationError(message="Invalid template")
+        for _ in range(2):
+            with self.assertRaises(ToscaValidationError) as ex:
+                validator.validate(TOSCA + "\n")
+            self.assertEqual(str(ex.exception), "Invalid template")
+        self.assertEqual(tosca_template.call_count, 2)
+
+        # The transient errors (e.g. getting the imports) are not cached
+        for error in [OSError("Connection refused"), ValidationError(message="URLException: Failed to reach server")]:
+            tosca_template.reset_mock()
+            tosca_template.side_effect = error
+            for _ in range(2):
+                with self.assertRaises(ToscaValidationError):
+                    validator.validate(TOSCA + "\n\n\n")
+            self.assertEqual(tosca_template.call_count, 2)
+        tosca_template.reset_mock()
+
+        # The first one has been evicted
+        tosca_template.side_effect = None
+        validator.validate(TOSCA + "\n\n")
+        validator.validate(TOSCA)
+        self.assertEqual(tosca_template.call_count, 2)
+
+    def test_process(self):
+        validator = ToscaValidator(use_process=True, cpu_time_limit=0, timeout=60)
+        template = validator.validate(TOSCA)
+        self.assertIn("node", template["topology_template"]["node_templates"])
+
+        with self.assertRaises(ToscaValidationError):
+            validator.validate(TOSCA.replace("tosca.nodes.Compute", "tosca.nodes.Invalid"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -20,6 +20,7 @@ import unittest
 import flask
 from app import utils
 from mock import patch, MagicMock
+from radl import radl_parse
 
 
 class TestUtils(unittest.TestCase):
@@ -74,6 +75,19 @@ class TestUtils(unittest.TestCase):
         self.assertEqual(new_template, {"topology_template": {"node_templates": {"n1": {"type": "Compute"},
                                                                                  "n2": {"type": "Compute"}}}})
 
+    def test_resize_radl(self):
+        res = utils.resize_radl(2, 4, 1, 20, system_name="front")
+        self.assertEqual(res, "system front (\ncpu.count >= 2 and\nmemory.size >= 4GB and\ngpu.count >= 1 and\n"
+                              "disks.free_size >= 20GB\n)\n\n")
+
+        radl = radl_parse.parse_radl("system front (instance_type = 'small' and cpu.count = 1 and "
+                                     "disk.0.image.url = 'one://server.com/id')")
+        res = radl_parse.parse_radl(utils.resize_radl(2, 4, radl=radl))
+        self.assertIsNone(res.systems[0].getValue("instance_type"))
+        self.assertEqual(res.systems[0].getFeature("cpu.count").operator, ">=")
+        self.assertEqual(res.systems[0].getValue("memory.size"), 4294967296)
+        self.assertEqual(res.systems[0].getValue("disk.0.image.url"), "one://server.com/id")
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,81 @@
+#! /usr/bin/env python
+#
+# IM - Infrastructure Manager
+# Copyright (C) 2011 - GRyCAP - Universitat Politecnica de Valencia
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+
+from app.vminfo import format_vminfo, vm_view
+
+
+class TestVMInfo(unittest.TestCase):
+    """Class to test the VM info formatting."""
+
+    def test_format_vminfo(self):
+        radl = [{"class": "network", "id": "publica", "outbound": "yes", "outports": "22/tcp-22/tcp,80/tcp-8080/tcp"},
+                {"class": "system", "id": "front", "state": "configured", "cpu.arch": "x86_64", "cpu.count_min": 2,
+                 "memory.size_min": 2147483648, "provider.type": "OpenStack", "provider.host": "server.com",
+                 "provider.port": 5000, "gpu.count": 0, "gpu.vendor": "NVIDIA",
+                 "net_interface.0.connection": "publica", "net_interface.0.ip": "8.8.8.8",
+                 "net_interface.0.dns_name": "front", "net_interface.1.connection": "privada",
+                 "disk.0.image.url": "ost://server.com/image", "disk.0.os.name": "linux",
+                 "disk.1.size": 10737418240, "disk.1.device": "vdb", "disk.1.mount_path": "/mnt/data"}]
+        res = format_vminfo(radl)
+        self.assertEqual(res["state"], "configured")
+        self.assertEqual(res["deployment"], "OpenStack: server.com:5000")
+        self.assertEqual(res["nets"], '<i class="fa fa-network-wired"></i> <span class="badge bg-secondary">0</span>'
+                                      ': 8.8.8.8 (front)')
+        self.assertEqual(res["disks"], '<i class="fa fa-database"></i> <span class="badge bg-secondary">0</span><br/>'
+                                       '&nbsp;&nbsp;- URL: ost://server.com/image<br/><br/>'
+                                       '<i class="fa fa-database"></i> <span class="badge bg-secondary">1</span><br/>'
+                                       '&nbsp;&nbsp;- Size: 10.0 GiB<br/>&nbsp;&nbsp;- Device: vdb<br/>'
+                                       '&nbsp;&nbsp;- Mount Path: /mnt/data<br/>')
+        self.assertIn('<span class="badge bg-secondary">8080</span>', res["outports"])
+        self.assertEqual(res["vminfo"], {"id": "front", "cpu.count": 2, "memory.size": "2.0 GiB"})
+
+    def test_vm_view(self):
+        radl = [{"class": "network", "id": "publica", "outbound": "yes",
+                 "outports": "22/tcp-22/tcp,1000:2000/tcp,10.0.0.0/24-443/tcp-443/tcp"},
+                {"class": "system", "id": "front", "state": "running", "provider.type": "EC2",
+                 "provider.host": "us-east-1", "gpu.count": 1, "gpu.vendor": "NVIDIA",
+                 "net_interface.0.connection": "privada", "net_interface.1.connection": "publica",
+                 "net_interface.1.ip": "8.8.8.8", "net_interface.1.additional_dns_names": ["www@domain.com"],
+                 "net_interface.1.ipv6": "::1", "net_interface.3.connection": "other",
+                 "net_interface.3.ip": "10.0.0.3", "disk.0.image.url": "aws://image", "disk.0.os.flavour": "ubuntu",
+                 "disk.2.size": 1073741824, "disk.2.device": "xvdc", "disk.2.type": "gp2"}]
+        res = vm_view(radl)
+        self.assertEqual(res["state"], "running")
+        self.assertEqual(res["deployment"], "EC2: us-east-1")
+        # The interfaces after the first one without connection (and the ones without IP) are not shown
+        self.assertEqual(res["nets"], [{"id": 1, "ip": "8.8.8.8", "dns_name": None,
+                                        "additional_dns_names": ["www@domain.com"]}])
+        self.assertEqual(res["disks"], [{"id": 0, "props": [("URL", "aws://image"), ("O.S. Flavor", "ubuntu")]}])
+        self.assertEqual(res["ports"], [{"remote_cidr": "0.0.0.0/0", "remote_port": 22, "local_port": 22,
+                                         "is_range": False},
+                                        {"remote_cidr": "0.0.0.0/0", "remote_port": 1000, "local_port": 2000,
+                                         "is_range": True},
+                                        {"remote_cidr": "10.0.0.0/24", "remote_port": 443, "local_port": 443,
+                                         "is_range": False}])
+        # The rest of the properties are kept, but the device of the disks not shown
+        self.assertEqual(res["vminfo"], {"id": "front", "gpu.count": 1, "gpu.vendor": "NVIDIA",
+                                         "net_interface.1.ipv6": "::1", "net_interface.3.connection": "other",
+                                         "net_interface.3.ip": "10.0.0.3",
+                                         "disk.2.size": "1.0 GiB", "disk.2.type": "gp2"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+#
+# IM - Infrastructure Manager Dashboard
+# Copyright (C) 2020 - GRyCAP - Universitat Politecnica de Valencia
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""Class to download the remote TOSCA templates provided by the users."""
+
+import threading
+from collections import OrderedDict
+
+import requests
+
+
+class ToscaFetcher:
+    """Download and validate remote TOSCA templates with an HTTP cache.
+
+    The documents are revalidated with conditional requests (ETag and
+    Last-Modified) and the parsed templates are obtained from the
+    ToscaValidator cache, so a not modified document is neither downloaded
+    nor parsed again.
+    """
+
+    CHUNK_SIZE = 65536
+
+    def __init__(self, validator, cache_size=64, max_size=1048576, timeout=10):
+        """Creator function."""
+        self.validator = validator
+        self.cache_size = cache_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _read_content(self, response):
+        length = response.headers.get("Content-Length")
+        if length and length.isdigit() and int(length) > self.max_size:
+            raise Exception("TOSCA template too large (%s bytes)." % length)
+
+        chunks = []
+        size = 0
+        for chunk in response.iter_content(self.CHUNK_SIZE):
+            chunks.append(chunk)
+            size += len(chunk)
+            if size > self.max_size:
+                raise Exception("TOSCA template too large (more than %d bytes)." % self.max_size)
+        return b"".join(chunks).decode(response.encoding or "utf-8", errors="replace")
+
+    def fetch(self, url):
+        """Get the TOSCA document of an URL."""
+        with self._lock:
+            entry = self._cache.get(url)
+
+        headers = {}
+        if entry:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        response = requests.get(url, headers=headers, timeout=self.timeout, stream=True)
+        try:
+            if entry and response.status_code == 304:
+                self.hits += 1
+                with self._lock:
+                    if url in self._cache:
+                        self._cache.move_to_end(url)
+                return entry["content"]
+
+            self.misses += 1
+            response.raise_for_status()
+            content = self._read_content(response)
+        finally:
+            response.close()
+
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        with self._lock:
+            if etag or last_modified:
+                self._cache[url] = {"etag": etag, "last_modified": last_modified, "content": content}
+                self._cache.move_to_end(url)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            else:
+                self._cache.pop(url, None)
+        return content
+
+    def get_template(self, url):
+        """Get the parsed and validated TOSCA template of an URL."""
+        return self.validator.validate(self.fetch(url))
@@ -0,0 +1,155 @@
+#
+# IM - Infrastructure Manager Dashboard
+# Copyright (C) 2020 - GRyCAP - Universitat Politecnica de Valencia
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""Class to validate the TOSCA templates provided by the users."""
+
+import copy
+import hashlib
+import multiprocessing
+import resource
+import threading
+from collections import OrderedDict
+
+import yaml
+from toscaparser.common.exception import TOSCAException
+from toscaparser.tosca_template import ToscaTemplate
+
+
+def content_hash(tosca):
+    return hashlib.sha256(tosca.encode("utf-8")).hexdigest()
+
+
+def validate_tosca(tosca):
+    """Parse and validate a TOSCA document and return the parsed template."""
+    template = yaml.safe_load(tosca)
+    ToscaTemplate(yaml_dict_tpl=copy.deepcopy(template))
+    return template
+
+
+def is_document_error(ex):
+    """Check if a validation error only depends on the document, so that it can be cached."""
+    if isinstance(ex, yaml.YAMLError):
+        return True
+    # The errors getting the imports of the template (e.g. network errors) are reported as URLException
+    return isinstance(ex, TOSCAException) and "URLException:" not in str(ex)
+
+
+def _validate_worker(conn, tosca, cpu_time_limit):
+    if cpu_time_limit:
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_time_limit, cpu_time_limit + 1))
+    try:
+        conn.send((validate_tosca(tosca), None, True))
+    except Exception as ex:
+        conn.send((None, "%s" % ex, is_document_error(ex)))
+    finally:
+        conn.close()
+
+
+class ToscaValidationError(Exception):
+    """Error raised when a TOSCA document is not valid."""
+
+
+class ToscaValidator:
+    """Validate TOSCA documents caching the results by content hash.
+
+    The cache is bounded (LRU eviction) and only holds the valid templates and
+    the errors of the documents (not the transient ones, e.g. getting the
+    imports). Optionally the validation is made in a separate process with a
+    CPU time limit and a wall-clock timeout, so that a large template does not
+    block the thread serving the request.
+    """
+
+    def __init__(self, cache_size=128, use_process=False, cpu_time_limit=30, timeout=120):
+        """Creator function."""
+        self.cache_size = cache_size
+        self.use_process = use_process
+        self.cpu_time_limit = cpu_time_limit
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._context = None
+        if use_process:
+            self._context = multiprocessing.get_context("forkserver")
+            self._context.set_forkserver_preload([__name__])
+
+    def _validate_in_process(self, tosca):
+        parent_conn, child_conn = self._context.Pipe(duplex=False)
+        proc = self._context.Process(target=_validate_worker, args=(child_conn, tosca, self.cpu_time_limit),
+                                     daemon=True)
+        proc.start()
+        child_conn.close()
+        timeout = min(self.cpu_time_limit * 2 + 10, self.timeout) if self.cpu_time_limit else self.timeout
+        try:
+            if parent_conn.poll(timeout):
+                return parent_conn.recv()
+            raise TimeoutError()
+        except (EOFError, TimeoutError):
+            # The process has been killed by the CPU time limit or it is hung
+            raise ToscaValidationError("TOSCA validation exceeded the time limit (%ss)." % timeout)
+        finally:
+            parent_conn.close()
+            proc.join(1)
+            if proc.is_alive():
+                proc.kill()
+
+    def get(self, key):
+        """Get a copy of the cached result for a content hash (template, error) or None."""
+        with self._lock:
+            if key not in self._cache:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._cache.move_to_end(key)
+            template, error = self._cache[key]
+        return copy.deepcopy(template), error
+
+    def put(self, key, template, error=None):
+        with self._lock:
+            self._cache[key] = (template, error)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def validate(self, tosca):
+        """Validate a TOSCA document and return a copy of the parsed template.
+
+        Raises ToscaValidationError if the document is not valid.
+        """
+        key = content_hash(tosca)
+        res = self.get(key)
+        if res is None:
+            if self.use_process:
+                template, error, cacheable = self._validate_in_process(tosca)
+            else:
+                try:
+                    template, error, cacheable = validate_tosca(tosca), None, True
+                except Exception as ex:
+                    template, error, cacheable = None, "%s" % ex, is_document_error(ex)
+            if cacheable:
+                self.put(key, template, error)
+                template = copy.deepcopy(template)
+            res = template, error
+
+        template, error = res
+        if error:
+            raise ToscaValidationError(error)
+        return template
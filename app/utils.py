@@ -28,13 +28,15 @@ import time
 import re
 from collections import OrderedDict
 from fnmatch import fnmatch
-from hashlib import md5
+from hashlib import md5, sha256
 from random import randint
+from urllib.parse import urlparse
 
 import requests
 import urllib3
 import yaml
 from flask import flash, g
+from radl.radl import RADL, Feature, system
 from radl.radl_json import parse_radl
 from requests.packages.urllib3.exceptions import InsecureRequestWarning
 
@@ -45,6 +47,8 @@ urllib3.disable_warnings(InsecureRequestWarning)
 
 SITE_LIST = {}
 LAST_UPDATE = 0
+# (site list, version of the site list, {site host: site name})
+SITE_HOSTS = (None, None, {})
 PORT_SPECT_TYPES = ["PortSpec", "tosca.datatypes.network.PortSpec", "tosca.datatypes.indigo.network.PortSpec"]
 
 
@@ -155,6 +159,36 @@ def getCachedSiteList(force=False):
     return SITE_LIST
 
 
+def getCachedSiteHosts():
+    """Get the names of the cached sites indexed by the host of their URL."""
+    global SITE_HOSTS
+
+    sites = getCachedSiteList()
+    version = (LAST_UPDATE, len(sites))
+    if SITE_HOSTS[0] is not sites or SITE_HOSTS[1] != version:
+        hosts = {}
+        for site in list(sites.values()):
+            hosts[urlparse(site['url'])[1].split(":")[0]] = site["name"]
+        SITE_HOSTS = (sites, version, hosts)
+    return SITE_HOSTS[2]
+
+
+def getStatsSiteName():
+    """Get a function returning the site name of the rows of the IM stats."""
+    site_hosts = None
+
+    def site_name(inf_stat):
+        nonlocal site_hosts
+        if inf_stat['cloud_host']:
+            # only load this data if a EGI Cloud site appears
+            if site_hosts is None:
+                site_hosts = getCachedSiteHosts()
+            return site_hosts.get(inf_stat['cloud_host'], inf_stat['cloud_host'])
+        return inf_stat['cloud_type']
+
+    return site_name
+
+
 def getIMUserAuthData(access_token, cred, userid):
     if g.settings.im_auth == "Bearer":
         return "Bearer %s" % access_token
@@ -266,12 +300,37 @@ def get_out_ports(vminfo):
     system = radl_info.systems[0]
 
     for net in radl_info.networks:
-        if net.isPublic() and system.getNumNetworkWithConnection(net.id):
+        if net.isPublic() and system.getNumNetworkWithConnection(net.id) is not None:
             outports = net.getOutPorts()
 
     return outports
 
 
+def resize_radl(cpu, memory, gpu=0, disk_size=0, radl=None, system_name="vm"):
+    """Get the RADL to resize a VM to the new HW features (memory and disk size in GB).
+
+    If the RADL of the VM is set, the features are merged in its first system,
+    otherwise a RADL with a system with only the new features is returned.
+    """
+    if radl is None:
+        radl = RADL()
+        radl.add(system(system_name))
+    vm_system = radl.systems[0]
+    vm_system.delValue("instance_type")
+    vm_system.delValue("cpu.count")
+    vm_system.addFeature(Feature("cpu.count", ">=", cpu), conflict="other", missing="other")
+    vm_system.delValue("memory.size")
+    vm_system.addFeature(Feature("memory.size", ">=", memory, "GB"), conflict="other", missing="other")
+    if gpu > 0:
+        vm_system.delValue("gpu.count")
+        vm_system.addFeature(Feature("gpu.count", ">=", gpu), conflict="other", missing="other")
+    if disk_size > 0:
+        vm_system.delValue("disks.free_size")
+        vm_system.delValue("disks.0.free_size")
+        vm_system.addFeature(Feature("disks.free_size", ">=", disk_size, "GB"), conflict="other", missing="other")
+    return str(radl)
+
+
 def to_pretty_json(value):
     return json.dumps(value, sort_keys=True,
                       indent=4, separators=(',', ': '))
@@ -282,6 +341,23 @@ def avatar(email, size):
     return 'https://www.gravatar.com/avatar/{}?d=identicon&s={}'.format(digest, size)
 
 
+def response_etag(*parts):
+    """Get the ETag of a response that only depends on the specified parts."""
+    return sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def sse_event(data, event=None, event_id=None):
+    """Format a Server-Sent Event."""
+    res = ""
+    if event_id is not None:
+        res += "id: %s\n" % event_id
+    if event:
+        res += "event: %s\n" % event
+    for line in str(data).split("\n"):
+        res += "data: %s\n" % line
+    return res + "\n"
+
+
 def loadToscaTemplates(directory):
 
     toscaTemplates = []
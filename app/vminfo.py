@@ -0,0 +1,167 @@
+#
+# IM - Infrastructure Manager Dashboard
+# Copyright (C) 2020 - GRyCAP - Universitat Politecnica de Valencia
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""Functions to format the information of the VMs."""
+
+import re
+
+from markupsafe import Markup, escape
+
+from app import utils
+
+# Features of the VMs not shown
+HIDDEN_FEATURES = frozenset(["cpu.arch", "disk.0.os.name", "provider.vo"])
+# Features of the network interfaces and disks: net_interface.<num>.<prop> and disk.<num>.<prop>
+INDEXED_FEATURE = re.compile(r"^(net_interface|disk)\.(\d+)\.(.+)$")
+# Properties of the disks shown and their labels, in order
+DISK_PROPS = (("size", "Size"), ("image.url", "URL"), ("device", "Device"), ("mount_path", "Mount Path"),
+              ("fstype", "F.S. type"), ("os.flavour", "O.S. Flavor"), ("os.version", "O.S. Version"),
+              ("type", "Volume Type"))
+# Properties of the disks not shown if the disk has no size nor image
+EXTRA_DISK_PROPS = frozenset(["device", "fstype", "mount_path"])
+GPU_FEATURES = ("gpu.count", "gpu.model", "gpu.vendor")
+
+# HTML templates of the nets, disks and ports, the values must be escaped
+NET_HTML = '<i class="fa fa-network-wired"></i> <span class="badge bg-secondary">%s</span>: %s%s'
+DISK_HTML = '<i class="fa fa-database"></i> <span class="badge bg-secondary">%s</span><br/>'
+DISK_PROP_HTML = '&nbsp;&nbsp;- %s: %s<br/>'
+PORT_HTML = '<i class="fas fa-project-diagram"></i> <span class="badge bg-secondary">%s%s</span>'
+PORT_REDIRECT_HTML = ' <i class="fas fa-long-arrow-alt-right"></i> <span class="badge bg-secondary">%s</span>'
+PORT_RANGE_HTML = ' : </i> <span class="badge bg-secondary">%s</span>'
+
+
+def _format_size(value):
+    return "%.1f GiB" % (value / 1073741824.0)
+
+
+def vm_view(radl_json):
+    """Get the view model of the RADL (in JSON format) of a VM.
+
+    The features of the system are classified in a single pass. Return a
+    dict with the state, the deployment, the lists of nets, disks and ports
+    of the VM and the rest of its features in vminfo.
+    """
+    vminfo = {}
+    indexed = {"net_interface": {}, "disk": {}}
+    for name, value in utils.format_json_radl(radl_json).items():
+        if name in HIDDEN_FEATURES:
+            continue
+        if name.endswith("size") and isinstance(value, (int, float)):
+            value = _format_size(value)
+        match = INDEXED_FEATURE.match(name)
+        if match:
+            indexed[match.group(1)].setdefault(int(match.group(2)), {})[match.group(3)] = value
+        else:
+            vminfo[name] = value
+
+    state = vminfo.pop("state", "")
+    deployment = vminfo.pop("provider.type", "")
+    if "provider.host" in vminfo:
+        if "provider.port" in vminfo:
+            deployment += ": %s:%s" % (vminfo.pop("provider.host"), vminfo.pop("provider.port"))
+        else:
+            deployment += ": " + vminfo.pop("provider.host")
+    if "gpu.count" in vminfo and vminfo["gpu.count"] <= 0:
+        for name in GPU_FEATURES:
+            vminfo.pop(name, None)
+
+    nets = []
+    interfaces = indexed["net_interface"]
+    num = 0
+    while "connection" in interfaces.get(num, {}):
+        props = interfaces[num]
+        del props["connection"]
+        if "ip" in props:
+            net = {"id": num, "ip": props.pop("ip"), "dns_name": props.pop("dns_name", None),
+                   "additional_dns_names": None}
+            if props.get("additional_dns_names"):
+                net["additional_dns_names"] = props.pop("additional_dns_names")
+            nets.append(net)
+        num += 1
+
+    disks = []
+    num = 0
+    while "size" in indexed["disk"].get(num, {}) or "image.url" in indexed["disk"].get(num, {}):
+        props = indexed["disk"][num]
+        disks.append({"id": num, "props": [(label, props.pop(name)) for name, label in DISK_PROPS if name in props]})
+        num += 1
+    for disk_num, props in indexed["disk"].items():
+        if disk_num >= num:
+            for name in EXTRA_DISK_PROPS:
+                props.pop(name, None)
+
+    # The rest of the properties are shown with the other features
+    for prefix, elems in indexed.items():
+        for elem_num, props in elems.items():
+            for name, value in props.items():
+                vminfo["%s.%d.%s" % (prefix, elem_num, name)] = value
+
+    ports = []
+    # Parsing the RADL is only needed to get the ports
+    outports = any(elem.get("outports") for elem in radl_json if elem["class"] == "network")
+    for port in utils.get_out_ports(radl_json) if outports else []:
+        ports.append({"remote_cidr": port.get_remote_cidr(), "remote_port": port.get_remote_port(),
+                      "local_port": port.get_local_port(), "is_range": port.is_range()})
+
+    return {"state": state, "deployment": deployment, "nets": nets, "disks": disks, "ports": ports,
+            "vminfo": vminfo}
+
+
+def render_nets(nets):
+    res = []
+    for net in nets:
+        names = " (%s)" % net["dns_name"] if net["dns_name"] else ""
+        if net["additional_dns_names"]:
+            names += " (%s)" % ", ".join(net["additional_dns_names"]).replace("@", ".")
+        res.append(NET_HTML % (escape(net["id"]), escape(net["ip"]), escape(names)))
+    return Markup("<br/>".join(res)) if res else ""
+
+
+def render_disks(disks):
+    res = []
+    for disk in disks:
+        res.append(DISK_HTML % escape(disk["id"]) +
+                   "".join(DISK_PROP_HTML % (escape(label), escape(value)) for label, value in disk["props"]))
+    return Markup("<br/>".join(res)) if res else ""
+
+
+def render_ports(ports):
+    res = []
+    for port in ports:
+        remote_cidr = "%s-" % port["remote_cidr"] if port["remote_cidr"] != "0.0.0.0/0" else ""
+        html = PORT_HTML % (escape(remote_cidr), escape(port["remote_port"]))
+        if port["is_range"]:
+            html += PORT_RANGE_HTML % escape(port["local_port"])
+        elif port["remote_port"] != port["local_port"]:
+            html += PORT_REDIRECT_HTML % escape(port["local_port"])
+        res.append(html + "<br/>")
+    return Markup("".join(res)) if res else ""
+
+
+def format_vminfo(radl_json):
+    """Format the RADL (in JSON format) of a VM to be shown in the VM info pages.
+
+    Return a dict with the state, deployment, nets, disks and outports (in
+    HTML) of the VM, and the rest of its features in vminfo.
+    """
+    view = vm_view(radl_json)
+    return {"vminfo": view["vminfo"], "state": view["state"], "deployment": view["deployment"],
+            "nets": render_nets(view["nets"]), "disks": render_disks(view["disks"]),
+            "outports": render_ports(view["ports"])}
@@ -0,0 +1,120 @@
+#
+# IM - Infrastructure Manager Dashboard
+# Copyright (C) 2020 - GRyCAP - Universitat Politecnica de Valencia
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""Benchmark of the rendering and search of the contextualization logs shown in /log.
+
+Usage: python benchmarks/bench_log.py [--size MB] [--legacy]
+"""
+
+import argparse
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from markupsafe import Markup
+
+from app.contmsg import LogIndex, search_log
+
+TASK_LINES = ["TASK [Gathering Facts] *********************************************************",
+              "ok: [10.0.0.%d]",
+              "changed: [10.0.0.%d] => (item=<pkg>)",
+              "fatal: [10.0.0.%d]: FAILED! => {\"changed\": false, \"msg\": \"No package matching\"}",
+              "...ignoring",
+              "PLAY RECAP *********************************************************************"]
+
+
+def synthetic_log(size, seed=0):
+    rand = random.Random(seed)
+    lines = []
+    length = 0
+    vm = 0
+    while length < size:
+        if rand.random() < 0.0005:
+            line = "VM %d:" % vm
+            vm += 1
+        elif rand.random() < 0.001:
+            line = "ERROR executing task: conf-ansible"
+        else:
+            line = rand.choice(TASK_LINES)
+            if "%d" in line:
+                line = line % rand.randint(1, 254)
+        lines.append(line)
+        length += len(line) + 1
+    lines.append(TASK_LINES[-1])
+    return "\n".join(lines)
+
+
+def legacy_render_log(log):
+    """Previous implementation: appends Markup to a string line by line (quadratic)."""
+    res = ""
+    lines = log.split('\n')
+    for n, line in enumerate(lines):
+        if "ERROR executing task" in line or ("fatal: " in line and "...ignoring" not in lines[n + 1]):
+            res += Markup('<span class="bg-danger text-white">%s</span><br>' % line)
+        else:
+            res += Markup("%s<br>\n" % line)
+    log = res
+    res = ""
+    lines = log.split('\n')
+    vms = 0
+    for line in lines:
+        sline = str(line)
+        if len(sline) > 8 and len(sline) < 12 and sline.startswith("VM ") and sline.endswith(":<br>"):
+            res += Markup('<p id="vm_%s" class="bg-dark text-white">%s</p><br>' % (vms, line))
+            vms += 1
+        else:
+            res += Markup("%s\n" % line)
+    return res, vms
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=50, help="Size of the log in MB")
+    parser.add_argument("--legacy", action="store_true",
+                        help="Also time the previous implementation (slow with large logs)")
+    args = parser.parse_args()
+
+    log = synthetic_log(args.size * 1024 * 1024)
+    print("Log: %d MB, %d lines" % (args.size, log.count("\n") + 1))
+
+    start = time.time()
+    index = LogIndex(log)
+    print("index: %.3fs (%d VMs)" % (time.time() - start, len(index.vm_lines)))
+
+    start = time.time()
+    html = index.render(log, 0, index.num_lines)
+    print("render: %.3fs (%d MB of HTML)" % (time.time() - start, len(html) // (1024 * 1024)))
+
+    start = time.time()
+    res = search_log(io.StringIO(log, newline="\n"), "fatal: ")
+    print("search_log: %.3fs (%d matches)" % (time.time() - start, res["total"]))
+
+    if args.legacy:
+        start = time.time()
+        legacy_render_log(log)
+        print("legacy: %.3fs" % (time.time() - start))
+
+
+if __name__ == "__main__":
+    main()
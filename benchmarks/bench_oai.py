@@ -0,0 +1,80 @@
+#
+# IM - Infrastructure Manager Dashboard
+# Copyright (C) 2023 - GRyCAP - Universitat Politecnica de Valencia
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""Benchmark of the OAI-PMH ListRecords requests.
+
+Usage: python benchmarks/bench_oai.py [--records N] [--page-size N] [--requests N]
+"""
+
+import argparse
+import datetime
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+from werkzeug.datastructures import MultiDict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.oaipmh.oai import OAI
+from app.oaipmh.records import RecordStore
+
+
+def metadata(num):
+    res = {}
+    for i in range(num):
+        res["template%d.yml" % i] = {"display_name": "Template %d" % i,
+                                     "template_author": "Author %d" % i,
+                                     "creation_date": datetime.date(2020, 1, 1) + datetime.timedelta(days=i % 1000),
+                                     "tag": "VM",
+                                     "description": "Description of the template number %d" % i}
+    return res
+
+
+def run(metadata_dict, page_size, num_requests, prefix, cached):
+    request = SimpleNamespace(values=MultiDict({"verb": "ListRecords", "metadataPrefix": prefix}))
+    oai = OAI("bench", "http://localhost/oai", "", "http://localhost/templates/", page_size=page_size,
+              token_secret="secret", version=1)
+    records = RecordStore(oai, metadata_dict)
+    start = time.perf_counter()
+    for _ in range(num_requests):
+        if not cached:
+            records = RecordStore(oai, metadata_dict)
+        oai.processRequest(request, records=records)
+    return num_requests / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=5000)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    metadata_dict = metadata(args.records)
+    for prefix in ["oai_dc", "oai_openaire"]:
+        for cached in [False, True]:
+            rps = run(metadata_dict, args.page_size, args.requests, prefix, cached)
+            print("ListRecords %-12s %-8s %10.1f req/s" % (prefix, "cached" if cached else "uncached", rps))
+
+
+if __name__ == "__main__":
+    main()
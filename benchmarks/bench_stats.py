@@ -0,0 +1,95 @@
+#
+# IM - Infrastructure Manager Dashboard
+# Copyright (C) 2020 - GRyCAP - Universitat Politecnica de Valencia
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""Benchmark of the aggregation of the IM stats shown in /stats.
+
+Usage: python benchmarks/bench_stats.py [--rows N] [--legacy]
+"""
+
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.stats import stats_series, bucket_size, cumulative_series
+
+
+def synthetic_stats(num, seed=0):
+    rand = random.Random(seed)
+    start = datetime.datetime(2022, 1, 1)
+    res = []
+    for i in range(num):
+        creation = start + datetime.timedelta(seconds=rand.randint(0, 180 * 86400))
+        last = creation + datetime.timedelta(days=rand.randint(0, 30))
+        vm_count = rand.randint(1, 10)
+        res.append({"creation_date": creation.strftime("%Y-%m-%d %H:%M:%S"),
+                    "last_date": last.strftime("%Y-%m-%d"),
+                    "vm_count": vm_count, "cpu_count": vm_count * 2, "memory_size": vm_count * 4096,
+                    "cloud_host": "host%d" % rand.randint(0, 20), "cloud_type": "OpenStack"})
+    return res
+
+
+def legacy_active_series(stats):
+    """Previous implementation: rescans the active infrastructures for every stat."""
+    inf_actives = []
+    infs = [0]
+    for inf_stat in sorted(stats, key=lambda stat: stat['creation_date']):
+        curr_date = datetime.datetime.strptime(inf_stat['creation_date'], "%Y-%m-%d %H:%M:%S")
+        for inf in list(inf_actives):
+            if datetime.datetime.strptime(inf[1], "%Y-%m-%d %H:%M:%S") <= curr_date:
+                infs.append(-1)
+                inf_actives.remove(inf)
+        inf_actives.append((inf_stat['vm_count'], "%s 12:00:00" % inf_stat['last_date']))
+        infs.append(1)
+    return infs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--legacy", action="store_true", help="also time the previous implementation")
+    args = parser.parse_args()
+
+    stats = synthetic_stats(args.rows)
+    for active in [False, True]:
+        start = time.perf_counter()
+        res = stats_series(stats, "2022-01-01", "2022-07-31", active)
+        elapsed = time.perf_counter() - start
+        print("stats_series active=%-5s rows=%d events=%d %.3fs" % (active, args.rows, len(res["infs"]), elapsed))
+
+        for bucket in ["none", "auto", "hour", "week"]:
+            start = time.perf_counter()
+            plot = cumulative_series(res, bucket_size(res, bucket))
+            elapsed = time.perf_counter() - start
+            points = sum(len(cloud_series["labels"]) for cloud_series in plot.values())
+            print("  cumulative_series bucket=%-4s points=%d %.3fs" % (bucket, points, elapsed))
+
+    if args.legacy:
+        start = time.perf_counter()
+        legacy_active_series(stats)
+        print("legacy active rows=%d %.3fs" % (args.rows, time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    main()
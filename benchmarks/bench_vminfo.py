@@ -0,0 +1,164 @@
+#
+# IM - Infrastructure Manager Dashboard
+# Copyright (C) 2020 - GRyCAP - Universitat Politecnica de Valencia
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""Benchmark of the formatting of the VM info shown in /vminfo and /vms.
+
+Usage: python benchmarks/bench_vminfo.py [--vms N] [--nets N] [--disks N] [--legacy]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from markupsafe import Markup
+
+from app import utils
+from app.vminfo import format_vminfo, vm_view
+
+
+def synthetic_radl(nets, disks):
+    system = {"class": "system", "id": "front", "state": "configured", "provider.type": "OpenStack",
+              "provider.host": "server.com", "provider.port": 5000, "cpu.arch": "x86_64", "cpu.count": 4,
+              "memory.size": 8589934592, "gpu.count": 0, "instance_id": "some-id"}
+    for num in range(nets):
+        system["net_interface.%d.connection" % num] = "net%d" % num
+        system["net_interface.%d.ip" % num] = "10.0.%d.1" % num
+        system["net_interface.%d.dns_name" % num] = "front%d" % num
+    for num in range(disks):
+        system["disk.%d.size" % num] = 10737418240
+        system["disk.%d.device" % num] = "vd%s" % chr(ord("a") + num % 26)
+        system["disk.%d.mount_path" % num] = "/mnt/disk%d" % num
+        system["disk.%d.fstype" % num] = "ext4"
+    system["disk.0.image.url"] = "ost://server.com/image"
+    system["disk.0.os.name"] = "linux"
+    return [{"class": "network", "id": "net0", "outbound": "yes",
+             "outports": "22/tcp-22/tcp,8080/tcp-80/tcp,1000:2000/tcp"}, system]
+
+
+def legacy_format_vminfo(radl_json):
+    """Previous implementation: deletes the features one by one with string formatted keys."""
+    state = ""
+    nets = ""
+    disks = ""
+    deployment = ""
+    outports = utils.get_out_ports(radl_json)
+    vminfo = utils.format_json_radl(radl_json)
+    for name in ["cpu.arch", "provider.vo", "disk.0.os.name"]:
+        if name in vminfo:
+            del vminfo[name]
+    if "state" in vminfo:
+        state = vminfo.pop("state")
+    if "provider.type" in vminfo:
+        deployment = vminfo.pop("provider.type")
+    if "provider.host" in vminfo:
+        if "provider.port" in vminfo:
+            deployment += ": %s:%s" % (vminfo["provider.host"], vminfo.pop("provider.port"))
+        else:
+            deployment += ": " + vminfo["provider.host"]
+        del vminfo["provider.host"]
+    if "gpu.count" in vminfo and vminfo["gpu.count"] <= 0:
+        for name in ["gpu.count", "gpu.model", "gpu.vendor"]:
+            if name in vminfo:
+                del vminfo[name]
+
+    cont = 0
+    while "net_interface.%s.connection" % cont in vminfo:
+        if "net_interface.%s.ip" % cont in vminfo:
+            if cont > 0:
+                nets += Markup('<br/>')
+            nets += Markup('<i class="fa fa-network-wired"></i>')
+            nets += Markup(' <span class="badge bg-secondary">%s</span>' % cont)
+            nets += ": %s" % vminfo["net_interface.%s.ip" % cont]
+            del vminfo["net_interface.%s.ip" % cont]
+            if "net_interface.%s.dns_name" % cont in vminfo:
+                nets += " (%s)" % vminfo["net_interface.%s.dns_name" % cont]
+                del vminfo["net_interface.%s.dns_name" % cont]
+        cont += 1
+
+    cont = 0
+    while "net_interface.%s.connection" % cont in vminfo:
+        del vminfo["net_interface.%s.connection" % cont]
+        cont += 1
+
+    for elem in vminfo:
+        if elem.endswith("size") and isinstance(vminfo[elem], (int, float)):
+            vminfo[elem] = "%.1f GiB" % (vminfo[elem] / 1073741824.0)
+
+    cont = 0
+    while "disk.%s.size" % cont in vminfo or "disk.%s.image.url" % cont in vminfo:
+        if cont > 0:
+            disks += Markup('<br/>')
+        disks += Markup('<i class="fa fa-database"></i> <span class="badge bg-secondary">%s</span><br/>' % cont)
+        prop_map = {"size": "Size", "image.url": "URL", "device": "Device", "mount_path": "Mount Path",
+                    "fstype": "F.S. type", "os.flavour": "O.S. Flavor", "os.version": "O.S. Version",
+                    "type": "Volume Type"}
+        for name, label in prop_map.items():
+            prop = "disk.%s.%s" % (cont, name)
+            if prop in vminfo:
+                disks += Markup('&nbsp;&nbsp;')
+                disks += "- %s: %s" % (label, vminfo[prop])
+                disks += Markup('<br/>')
+                del vminfo[prop]
+        cont += 1
+
+    str_outports = ""
+    for port in outports or []:
+        str_outports += Markup('<i class="fas fa-project-diagram"></i> <span class="badge '
+                               'bg-secondary">%s</span>' % port.get_remote_port())
+        if not port.is_range():
+            if port.get_remote_port() != port.get_local_port():
+                str_outports += Markup(' <i class="fas fa-long-arrow-alt-right">'
+                                       '</i> <span class="badge bg-secondary">%s</span>' % port.get_local_port())
+        else:
+            str_outports += Markup(' : </i> <span class="badge bg-secondary">%s</span>' % port.get_local_port())
+        str_outports += Markup('<br/>')
+
+    return {"vminfo": vminfo, "state": state, "nets": nets, "disks": disks, "deployment": deployment,
+            "outports": str_outports}
+
+
+def timeit(func, radl, vms):
+    start = time.time()
+    for _ in range(vms):
+        func(radl)
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vms", type=int, default=1000, help="Number of VMs formatted")
+    parser.add_argument("--nets", type=int, default=4, help="Number of network interfaces of each VM")
+    parser.add_argument("--disks", type=int, default=8, help="Number of disks of each VM")
+    parser.add_argument("--legacy", action="store_true", help="Also time the previous implementation")
+    args = parser.parse_args()
+
+    radl = synthetic_radl(args.nets, args.disks)
+    print("VMs: %d, %d nets, %d disks" % (args.vms, args.nets, args.disks))
+    print("vm_view: %.3fs" % timeit(vm_view, radl, args.vms))
+    print("format_vminfo: %.3fs" % timeit(format_vminfo, radl, args.vms))
+    if args.legacy:
+        print("legacy: %.3fs" % timeit(legacy_format_vminfo, radl, args.vms))
+
+
+if __name__ == "__main__":
+    main()